@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Script to compress existing documents and receipts at rest
+"""
+from routers.documents import DOCUMENTS_PREFIX, format_file_size
+from routers.expenses import RECEIPTS_PREFIX
+from services.storage import LocalStorage, storage
+from services.storage_codec import STORAGE_COMPRESSION, compress_existing_files
+
+def compress_storage():
+    """Recompress every raw file the storage policy allows"""
+    if not isinstance(storage, LocalStorage):
+        print("❌ Compression at rest only applies to local file storage")
+        return
+    
+    print(f"Codec: {STORAGE_COMPRESSION}")
+    status = compress_existing_files(storage.path_for(DOCUMENTS_PREFIX), storage.path_for(RECEIPTS_PREFIX))
+    
+    saved = status["bytesBefore"] - status["bytesAfter"]
+    print(f"✅ Scanned {status['filesScanned']} files, compressed {status['filesCompressed']}")
+    print(f"   Before: {format_file_size(status['bytesBefore'])}")
+    print(f"   After:  {format_file_size(status['bytesAfter'])}")
+    print(f"   Saved:  {format_file_size(saved)}")
+    if status["errors"]:
+        print(f"⚠️  {status['errors']} file(s) could not be compressed")
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Compressing Stored Files")
+    print("=" * 60)
+    compress_storage()
+    print("=" * 60)
@@ -4,6 +4,7 @@ Script to create an admin user in the database
 """
 from passlib.context import CryptContext
 from database import db
+from services.admin_search import search_fields
 
 # Password hashing context (same as in auth.py)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -45,7 +46,7 @@ def create_admin_user():
     }
     
     try:
-        result = db.users.insert_one(admin_user)
+        result = db.users.insert_one({**admin_user, **search_fields("user", admin_user)})
         print(f"✅ Admin user created successfully!")
         print(f"   Email: {admin_email}")
         print(f"   Password: {admin_password}")
@@ -1,33 +1,207 @@
+import bisect
+import functools
+import itertools
 import os
+import threading
+import time
 from copy import deepcopy
 from datetime import datetime
 from types import SimpleNamespace
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import certifi
 import pymongo
 from bson import ObjectId
 from dotenv import load_dotenv
+from pymongo import monitoring
 
 load_dotenv()
 
 
+# Observers are called with an operation event after every database operation,
+# whichever backend is in use. Events carry:
+#   collection, operation, seconds, failed
+#   filter    the query the operation matched on, or None (inserts, bulk writes)
+#   scanned   documents examined, or None where the backend does not say (Mongo)
+#   returned  documents returned, counted, modified or deleted
+_operation_observers: List[Callable[[SimpleNamespace], None]] = []
+
+# Index keys declared through create_index, per collection. Both backends fill
+# this in, so query filters can be checked against the indexes the app relies on
+declared_indexes: Dict[str, Set[Tuple[str, ...]]] = {}
+
+
+def add_operation_observer(observer: Callable[[SimpleNamespace], None]):
+    _operation_observers.append(observer)
+
+
+def declare_index(collection: str, fields: Iterable[str]):
+    declared_indexes.setdefault(collection, set()).add(tuple(fields))
+
+
+def _notify_observers(collection: str, operation: str, seconds: float, failed: bool,
+                      filter: Optional[Dict[str, Any]] = None, scanned: Optional[int] = None, returned: Optional[int] = None):
+    event = SimpleNamespace(collection=collection, operation=operation, seconds=seconds, failed=failed,
+                            filter=filter, scanned=scanned, returned=returned)
+    for observer in _operation_observers:
+        try:
+            observer(event)
+        except Exception as e:
+            print(f"⚠️  Database operation observer failed: {e}")
+
+
+def _command_filter(name: str, command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if name == "find":
+        return command.get("filter", {})
+    if name in ("count", "findAndModify", "distinct"):
+        return command.get("query", {})
+    if name in ("update", "delete"):
+        statements = command.get("updates" if name == "update" else "deletes") or [{}]
+        return statements[0].get("q", {})
+    if name == "aggregate":
+        return _pipeline_filter(command.get("pipeline", []))
+    return None
+
+
+def _pipeline_filter(pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return pipeline[0]["$match"] if pipeline and "$match" in pipeline[0] else {}
+
+
+def _reply_count(name: str, reply: Dict[str, Any]) -> Optional[int]:
+    if name in ("find", "aggregate"):
+        return len(reply.get("cursor", {}).get("firstBatch", []))
+    if name == "getMore":
+        return len(reply.get("cursor", {}).get("nextBatch", []))
+    if name == "findAndModify":
+        return int(reply.get("value") is not None)
+    if name == "distinct":
+        return len(reply.get("values", []))
+    return reply.get("n")
+
+
+class _CommandObserver(monitoring.CommandListener):
+    """Reports the commands pymongo sends, keyed by the collection they target"""
+
+    DATA_COMMANDS = {"find", "getMore", "insert", "update", "delete", "findAndModify", "aggregate", "count", "distinct", "createIndexes"}
+
+    def __init__(self):
+        self._pending: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        name = event.command_name
+        if name not in self.DATA_COMMANDS:
+            return
+        target = str(event.command.get("collection") if name == "getMore" else event.command.get(name))
+        if name == "createIndexes":
+            for index in event.command.get("indexes", []):
+                declare_index(target, index["key"].keys())
+        self._pending[(event.connection_id, event.request_id)] = (target, _command_filter(name, event.command))
+
+    def _finish(self, event, failed: bool):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is not None:
+            collection, filter = pending
+            returned = None if failed else _reply_count(event.command_name, event.reply)
+            _notify_observers(collection, event.command_name, event.duration_micros / 1_000_000, failed,
+                              filter=filter, returned=returned)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+# Operations that call other operations (insert_many -> insert_one) are reported
+# once; `scanned` counts the documents the outermost operation examined
+_operation_state = threading.local()
+
+# Which argument holds the filter, for the in-memory operations that have one
+_FILTERED_OPERATIONS = {"find_one", "find", "count_documents", "update_one", "find_one_and_update",
+                        "update_many", "delete_one", "delete_many"}
+
+
+def _operation_filter(operation: str, args: tuple, kwargs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if operation in _FILTERED_OPERATIONS:
+        return (args[0] if args else kwargs.get("query")) or {}
+    if operation == "aggregate":
+        return _pipeline_filter(args[0] if args else kwargs.get("pipeline", []))
+    return None
+
+
+def _result_count(result: Any) -> Optional[int]:
+    if result is None:
+        return 0
+    if isinstance(result, dict):
+        return 1
+    if isinstance(result, int):
+        return result
+    if isinstance(result, InMemoryCursor):
+        return len(result)
+    counts = [getattr(result, attribute) for attribute in ("inserted_count", "matched_count", "deleted_count") if hasattr(result, attribute)]
+    if counts:
+        return sum(counts) + int(getattr(result, "upserted_id", None) is not None)
+    if hasattr(result, "inserted_ids"):
+        return len(result.inserted_ids)
+    if hasattr(result, "inserted_id"):
+        return 1
+    return None
+
+
+def _observed(method):
+    operation = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not _operation_observers or getattr(_operation_state, "depth", 0):
+            return method(self, *args, **kwargs)
+        _operation_state.depth = 1
+        _operation_state.scanned = 0
+        start = time.perf_counter()
+        result = None
+        failed = True
+        try:
+            result = method(self, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _operation_state.depth = 0
+            _notify_observers(self.name, operation, time.perf_counter() - start, failed,
+                              filter=_operation_filter(operation, args, kwargs), scanned=_operation_state.scanned,
+                              returned=None if failed else _result_count(result))
+    return wrapper
+
+
 class InMemoryCursor:
     def __init__(self, documents: List[Dict[str, Any]]):
         self._documents = documents
 
-    def sort(self, key: str, direction: int = 1) -> "InMemoryCursor":
-        reverse = direction == -1
+    def sort(self, key: Any, direction: int = 1) -> "InMemoryCursor":
+        # Like pymongo: a single key and direction, or a list of (key, direction) pairs
+        keys = key if isinstance(key, list) else [(key, direction)]
 
-        def sort_key(doc: Dict[str, Any]):
-            value = InMemoryCollection._get_value(doc, key)
-            if isinstance(value, datetime):
-                return value
-            return value or ""
+        def sort_key_for(field: str):
+            def sort_key(doc: Dict[str, Any]):
+                value = InMemoryCollection._normalize(InMemoryCollection._get_value(doc, field))
+                if isinstance(value, datetime):
+                    return value
+                return value or ""
+            return sort_key
 
-        sorted_docs = sorted(self._documents, key=sort_key, reverse=reverse)
+        sorted_docs = list(self._documents)
+        # Stable sorts applied from the least significant key
+        for field, field_direction in reversed(keys):
+            sorted_docs.sort(key=sort_key_for(field), reverse=field_direction == -1)
         return InMemoryCursor(sorted_docs)
 
+    def skip(self, count: int) -> "InMemoryCursor":
+        return InMemoryCursor(self._documents[count:])
+
+    def limit(self, count: int) -> "InMemoryCursor":
+        if not count:
+            return self
+        return InMemoryCursor(self._documents[:count])
+
     def __iter__(self):
         return iter(self._documents)
 
@@ -38,8 +212,10 @@ class InMemoryCursor:
 # In-memory database for development/testing
 class InMemoryCollection:
     def __init__(self):
+        # Set by InMemoryDB to the attribute name, like pymongo's Collection.name
+        self.name = "collection"
         self.data: List[Dict[str, Any]] = []
-        self._counter = 1
+        self._counter = itertools.count(1)
 
     @staticmethod
     def _normalize(value: Any) -> Any:
@@ -77,37 +253,147 @@ class InMemoryCollection:
                 if not any(self._matches(document, condition) for condition in value):
                     return False
                 continue
+            if key == "$and":
+                if not all(self._matches(document, condition) for condition in value):
+                    return False
+                continue
 
-            expected = self._normalize(value)
             actual = self._normalize(self._get_value(document, key))
+            if isinstance(value, dict) and any(op.startswith("$") for op in value):
+                if not all(self._apply_operator(actual, op, operand) for op, operand in value.items()):
+                    return False
+                continue
+
+            expected = self._normalize(value)
+            if isinstance(actual, list) and not isinstance(expected, list):
+                # Like Mongo, a scalar matches any element of an array field
+                if expected not in [self._normalize(item) for item in actual]:
+                    return False
+                continue
             if actual != expected:
                 return False
 
         return True
 
+    def _apply_operator(self, actual: Any, operator: str, operand: Any) -> bool:
+        if operator in ("$in", "$nin"):
+            candidates = [self._normalize(item) for item in operand]
+            values = actual if isinstance(actual, list) else [actual]
+            found = any(self._normalize(value) in candidates for value in values)
+            return found if operator == "$in" else not found
+        if operator == "$ne":
+            return actual != self._normalize(operand)
+        if operator == "$exists":
+            return (actual is not None) == bool(operand)
+        if actual is None:
+            return False
+        operand = self._normalize(operand)
+        try:
+            if operator == "$gt":
+                return actual > operand
+            if operator == "$gte":
+                return actual >= operand
+            if operator == "$lt":
+                return actual < operand
+            if operator == "$lte":
+                return actual <= operand
+        except TypeError:
+            return False
+        raise ValueError(f"Unsupported query operator: {operator}")
+
+    @_observed
     def insert_one(self, document: Dict[str, Any]):
         doc_copy = deepcopy(document)
         if "_id" not in doc_copy:
-            doc_copy["_id"] = str(self._counter)
-            self._counter += 1
+            doc_copy["_id"] = str(next(self._counter))
         self.data.append(doc_copy)
+        self._index_add(doc_copy)
         return SimpleNamespace(inserted_id=doc_copy["_id"])
 
-    def find_one(self, query: Optional[Dict[str, Any]] = None):
-        for doc in self.data:
+    @_observed
+    def insert_many(self, documents: Iterable[Dict[str, Any]]):
+        inserted_ids = [self.insert_one(document).inserted_id for document in documents]
+        return SimpleNamespace(inserted_ids=inserted_ids)
+
+    def _scan(self, documents: Iterable[Dict[str, Any]], query: Optional[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """The documents matching the query, counting each one examined"""
+        for doc in documents:
+            if _operation_observers:
+                _operation_state.scanned = getattr(_operation_state, "scanned", 0) + 1
             if self._matches(doc, query):
-                return doc
-        return None
+                yield doc
+
+    @_observed
+    def find_one(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None):
+        return next(self._scan(self.data, query), None)
     
-    def find(self, query: Optional[Dict[str, Any]] = None) -> InMemoryCursor:
-        matched = [doc for doc in self.data if self._matches(doc, query)]
-        return InMemoryCursor(matched)
+    @_observed
+    def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> InMemoryCursor:
+        return InMemoryCursor(list(self._scan(self.data, query)))
 
-    def update_one(self, query: Dict[str, Any], update: Dict[str, Any]):
-        doc = self.find_one(query)
-        if not doc:
-            return SimpleNamespace(matched_count=0, modified_count=0)
+    @_observed
+    def count_documents(self, query: Optional[Dict[str, Any]] = None) -> int:
+        return sum(1 for _ in self._scan(self.data, query))
+
+    @classmethod
+    def _evaluate(cls, document: Dict[str, Any], expression: Any) -> Any:
+        """The few aggregation expressions the app uses: "$field", literals, $size and $ifNull"""
+        if isinstance(expression, str) and expression.startswith("$"):
+            return cls._get_value(document, expression[1:])
+        if isinstance(expression, dict) and len(expression) == 1:
+            operator, operand = next(iter(expression.items()))
+            if operator == "$size":
+                return len(cls._evaluate(document, operand))
+            if operator == "$ifNull":
+                value = cls._evaluate(document, operand[0])
+                return cls._evaluate(document, operand[1]) if value is None else value
+            if operator.startswith("$"):
+                raise ValueError(f"Unsupported aggregation expression: {operator}")
+        return expression
+
+    @_observed
+    def aggregate(self, pipeline: List[Dict[str, Any]]) -> InMemoryCursor:
+        """Supports $match, $group with $sum, $count, $sort and $limit"""
+        documents = None
+        for stage in pipeline:
+            name, spec = next(iter(stage.items()))
+            if name == "$match":
+                documents = list(self.find(spec)) if documents is None else [doc for doc in documents if self._matches(doc, spec)]
+                continue
+            if documents is None:
+                documents = list(self.data)
+            if name == "$group":
+                groups: Dict[Any, Dict[str, Any]] = {}
+                for doc in documents:
+                    key = self._evaluate(doc, spec["_id"])
+                    group = groups.setdefault(repr(key), {"_id": key, **{field: 0 for field in spec if field != "_id"}})
+                    for field, accumulator in spec.items():
+                        if field == "_id":
+                            continue
+                        if "$sum" not in accumulator:
+                            raise ValueError(f"Unsupported accumulator: {accumulator}")
+                        value = self._evaluate(doc, accumulator["$sum"])
+                        if isinstance(value, (int, float)) and not isinstance(value, bool):
+                            group[field] += value
+                documents = list(groups.values())
+            elif name == "$count":
+                documents = [{spec: len(documents)}] if documents else []
+            elif name == "$sort":
+                documents = list(InMemoryCursor(documents).sort(list(spec.items())))
+            elif name == "$limit":
+                documents = documents[:spec]
+            else:
+                raise ValueError(f"Unsupported aggregation stage: {name}")
+        return InMemoryCursor(documents if documents is not None else list(self.data))
 
+    def create_index(self, keys: Any, **kwargs) -> str:
+        # Indexes are only recorded for the in-memory store; return a Mongo-style name
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        declare_index(self.name, [field for field, _ in keys])
+        return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+    def _apply_update(self, doc: Dict[str, Any], update: Dict[str, Any]) -> bool:
         modified = False
 
         if "$set" in update:
@@ -124,40 +410,370 @@ class InMemoryCollection:
                     current.append(value)
             modified = True
 
+        if "$inc" in update:
+            for key, value in update["$inc"].items():
+                self._set_value(doc, key, (self._get_value(doc, key) or 0) + value)
+            modified = True
+
+        return modified
+
+    # Hooks for collections that keep secondary indexes over their documents
+    def _index_add(self, doc: Dict[str, Any]):
+        pass
+
+    def _index_remove(self, doc: Dict[str, Any]):
+        pass
+
+    @_observed
+    def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        doc = self.find_one(query)
+        if not doc:
+            if upsert:
+                # Seed the new document from the equality conditions of the query
+                new_doc: Dict[str, Any] = {}
+                for key, value in query.items():
+                    if not key.startswith("$") and not isinstance(value, dict):
+                        self._set_value(new_doc, key, value)
+                for key, value in update.get("$setOnInsert", {}).items():
+                    self._set_value(new_doc, key, value)
+                self._apply_update(new_doc, update)
+                result = self.insert_one(new_doc)
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=result.inserted_id)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+        self._index_remove(doc)
+        modified = self._apply_update(doc, update)
+        self._index_add(doc)
+
         return SimpleNamespace(matched_count=1, modified_count=int(modified))
 
+    @_observed
+    def find_one_and_update(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False,
+                            return_document: bool = False):
+        """return_document=True (pymongo's ReturnDocument.AFTER) returns the updated document"""
+        doc = self.find_one(query)
+        if not doc:
+            if not upsert:
+                return None
+            new_doc: Dict[str, Any] = {}
+            for key, value in query.items():
+                if not key.startswith("$") and not isinstance(value, dict):
+                    self._set_value(new_doc, key, value)
+            for key, value in update.get("$setOnInsert", {}).items():
+                self._set_value(new_doc, key, value)
+            self._apply_update(new_doc, update)
+            inserted_id = self.insert_one(new_doc).inserted_id
+            return self.find_one({"_id": inserted_id}) if return_document else None
+
+        before = deepcopy(doc)
+        self._index_remove(doc)
+        self._apply_update(doc, update)
+        self._index_add(doc)
+        return doc if return_document else before
+
+    @_observed
     def update_many(self, query: Dict[str, Any], update: Dict[str, Any]):
         matched = 0
         modified = 0
-        for doc in self.data:
-            if not self._matches(doc, query):
-                continue
+        for doc in list(self.find(query)):
             matched += 1
-            if "$set" in update:
-                for key, value in update["$set"].items():
-                    self._set_value(doc, key, value)
+            self._index_remove(doc)
+            if self._apply_update(doc, update):
                 modified += 1
+            self._index_add(doc)
         return SimpleNamespace(matched_count=matched, modified_count=modified)
     
+    @_observed
+    def bulk_write(self, requests: Iterable[Any], ordered: bool = True):
+        """Apply pymongo InsertOne/UpdateOne/DeleteOne operations in order"""
+        inserted = matched = modified = deleted = 0
+        for request in requests:
+            name = type(request).__name__
+            if name == "InsertOne":
+                self.insert_one(request._doc)
+                inserted += 1
+            elif name == "UpdateOne":
+                result = self.update_one(request._filter, request._doc, upsert=bool(request._upsert))
+                matched += result.matched_count
+                modified += result.modified_count
+            elif name == "DeleteOne":
+                deleted += self.delete_one(request._filter).deleted_count
+            else:
+                raise ValueError(f"Unsupported bulk operation: {name}")
+        return SimpleNamespace(inserted_count=inserted, matched_count=matched, modified_count=modified, deleted_count=deleted)
+
+    @_observed
     def delete_one(self, query: Dict[str, Any]):
         doc = self.find_one(query)
         if doc:
             self.data.remove(doc)
+            self._index_remove(doc)
             return SimpleNamespace(deleted_count=1)
         return SimpleNamespace(deleted_count=0)
 
+    @_observed
+    def delete_many(self, query: Dict[str, Any]):
+        for doc in self.find(query):
+            self._index_remove(doc)
+        remaining = [doc for doc in self.data if not self._matches(doc, query)]
+        deleted = len(self.data) - len(remaining)
+        self.data = remaining
+        return SimpleNamespace(deleted_count=deleted)
+
+
+class RangeIndexedCollection(InMemoryCollection):
+    """
+    In-memory stand-in for a compound (partition_field, range_field) index.
+
+    Documents are kept sorted by range_field within each partition, so a query
+    with an equality on the partition field and a range on the range field is
+    answered with two binary searches instead of a full scan.
+    """
+
+    def __init__(self, partition_field: str, range_field: str):
+        super().__init__()
+        self.partition_field = partition_field
+        self.range_field = range_field
+        self._sequence = itertools.count()
+        # partition -> sorted [(range value, sequence)] and the documents in the same order
+        self._keys: Dict[Any, List[tuple]] = {}
+        self._docs: Dict[Any, List[Dict[str, Any]]] = {}
+        # Documents without a range value are scanned on every query of their partition
+        self._unranged: Dict[Any, List[Dict[str, Any]]] = {}
+        self._entry_keys: Dict[int, tuple] = {}
+
+    def _partition(self, doc: Dict[str, Any]) -> Any:
+        return self._normalize(self._get_value(doc, self.partition_field))
+
+    def _index_add(self, doc: Dict[str, Any]):
+        partition = self._partition(doc)
+        value = self._get_value(doc, self.range_field)
+        if value is None:
+            self._unranged.setdefault(partition, []).append(doc)
+            return
+        key = (value, next(self._sequence))
+        keys = self._keys.setdefault(partition, [])
+        position = bisect.bisect_right(keys, key)
+        keys.insert(position, key)
+        self._docs.setdefault(partition, []).insert(position, doc)
+        self._entry_keys[id(doc)] = key
+
+    def _index_remove(self, doc: Dict[str, Any]):
+        partition = self._partition(doc)
+        key = self._entry_keys.pop(id(doc), None)
+        if key is None:
+            unranged = self._unranged.get(partition, [])
+            if any(item is doc for item in unranged):
+                self._unranged[partition] = [item for item in unranged if item is not doc]
+            return
+        keys = self._keys[partition]
+        position = bisect.bisect_left(keys, key)
+        del keys[position]
+        del self._docs[partition][position]
+
+    def _candidates(self, query: Optional[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Documents that can match the query according to the index, or None to fall back to a scan"""
+        if not query or self.partition_field not in query:
+            return None
+        partition = query[self.partition_field]
+        if isinstance(partition, dict):
+            return None
+        partition = self._normalize(partition)
+
+        keys = self._keys.get(partition, [])
+        docs = self._docs.get(partition, [])
+        low, high = 0, len(keys)
+        bounds = query.get(self.range_field)
+        if isinstance(bounds, dict):
+            # (value, -1) sorts before and (value, inf) after every entry with that value
+            if "$gte" in bounds:
+                low = max(low, bisect.bisect_left(keys, (bounds["$gte"], -1)))
+            if "$gt" in bounds:
+                low = max(low, bisect.bisect_right(keys, (bounds["$gt"], float("inf"))))
+            if "$lt" in bounds:
+                high = min(high, bisect.bisect_left(keys, (bounds["$lt"], -1)))
+            if "$lte" in bounds:
+                high = min(high, bisect.bisect_right(keys, (bounds["$lte"], float("inf"))))
+        return docs[low:high] + self._unranged.get(partition, [])
+
+    @_observed
+    def find_one(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None):
+        candidates = self._candidates(query)
+        if candidates is None:
+            return super().find_one(query, projection)
+        return next(self._scan(candidates, query), None)
+
+    @_observed
+    def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> InMemoryCursor:
+        candidates = self._candidates(query)
+        if candidates is None:
+            return super().find(query, projection)
+        return InMemoryCursor(list(self._scan(candidates, query)))
+
+    @_observed
+    def count_documents(self, query: Optional[Dict[str, Any]] = None) -> int:
+        candidates = self._candidates(query)
+        if candidates is None:
+            return super().count_documents(query)
+        return sum(1 for _ in self._scan(candidates, query))
+
+
+# Fields admin search matches on; a tuple is searched as its values joined by spaces
+USER_SEARCH_FIELDS: List[Union[str, Tuple[str, ...]]] = ["email", ("firstName", "lastName")]
+FAMILY_SEARCH_FIELDS: List[Union[str, Tuple[str, ...]]] = ["familyName", "familyCode", "parent1_email", "parent2_email"]
+
+
+class SearchIndexedCollection(InMemoryCollection):
+    """
+    In-memory stand-in for the lowercase search fields admin search indexes in Mongo.
+
+    Each indexed value and each word in it is a lowercase term. A sorted list of
+    the distinct terms answers prefix lookups with a binary search, and a
+    trigram -> documents map narrows substring lookups to a few candidates.
+    """
+
+    def __init__(self, fields: List[Union[str, Tuple[str, ...]]]):
+        super().__init__()
+        self.search_fields = fields
+        self._postings: Dict[str, Set[int]] = {}
+        self._grams: Dict[str, Set[int]] = {}
+        self._sorted_terms: List[str] = []
+        # Bulk inserts add terms unsorted and sort once on the next lookup
+        self._terms_dirty = False
+        self._bulk_loading = False
+        self._doc_terms: Dict[int, Set[str]] = {}
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+
+    @staticmethod
+    def normalize_text(value: Any) -> str:
+        return " ".join(str(value).lower().split()) if value is not None else ""
+
+    @classmethod
+    def search_values(cls, doc: Dict[str, Any], fields: List[Union[str, Tuple[str, ...]]]) -> List[str]:
+        values = []
+        for field in fields:
+            parts = field if isinstance(field, tuple) else (field,)
+            value = cls.normalize_text(" ".join(str(doc.get(part) or "") for part in parts))
+            if value:
+                values.append(value)
+        return values
+
+    @classmethod
+    def search_terms(cls, values: Iterable[str]) -> Set[str]:
+        terms = set()
+        for value in values:
+            terms.add(value)
+            terms.update(value.split(" "))
+        return terms
+
+    @staticmethod
+    def trigrams(text: str) -> Set[str]:
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _index_add(self, doc: Dict[str, Any]):
+        key = id(doc)
+        terms = self.search_terms(self.search_values(doc, self.search_fields))
+        self._doc_terms[key] = terms
+        self._by_id[key] = doc
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = set()
+                if self._bulk_loading or self._terms_dirty:
+                    self._terms_dirty = True
+                else:
+                    bisect.insort(self._sorted_terms, term)
+            posting.add(key)
+            for gram in self.trigrams(term):
+                self._grams.setdefault(gram, set()).add(key)
+
+    def _index_remove(self, doc: Dict[str, Any]):
+        key = id(doc)
+        self._by_id.pop(key, None)
+        for term in self._doc_terms.pop(key, ()):
+            posting = self._postings[term]
+            posting.discard(key)
+            if not posting:
+                del self._postings[term]
+                if not self._terms_dirty:
+                    del self._sorted_terms[bisect.bisect_left(self._sorted_terms, term)]
+            for gram in self.trigrams(term):
+                keys = self._grams.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._grams[gram]
+
+    @_observed
+    def insert_many(self, documents: Iterable[Dict[str, Any]]):
+        self._bulk_loading = True
+        try:
+            return super().insert_many(documents)
+        finally:
+            self._bulk_loading = False
+
+    def _terms(self) -> List[str]:
+        if self._terms_dirty:
+            self._sorted_terms = sorted(self._postings)
+            self._terms_dirty = False
+        return self._sorted_terms
+
+    def prefix_search(self, prefix: str) -> Iterator[Dict[str, Any]]:
+        """Documents with a term starting with `prefix`, in term order, each once"""
+        terms = self._terms()
+        seen: Set[int] = set()
+        for position in range(bisect.bisect_left(terms, prefix), len(terms)):
+            term = terms[position]
+            if not term.startswith(prefix):
+                break
+            for key in self._postings[term]:
+                if key not in seen:
+                    seen.add(key)
+                    yield self._by_id[key]
+
+    def substring_search(self, text: str) -> Iterator[Dict[str, Any]]:
+        """Documents with a term containing `text`"""
+        grams = self.trigrams(text)
+        if not grams:
+            # Too short for trigrams: check every distinct term instead
+            keys: Set[int] = set()
+            for term, posting in self._postings.items():
+                if text in term:
+                    keys.update(posting)
+        else:
+            postings = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+            keys = set(postings[0]).intersection(*postings[1:])
+        for key in keys:
+            if any(text in term for term in self._doc_terms[key]):
+                yield self._by_id[key]
+
 
 class InMemoryDB:
     def __init__(self):
-        self.families = InMemoryCollection()
-        self.users = InMemoryCollection()
-        self.events = InMemoryCollection()
-        self.change_requests = InMemoryCollection()
+        self.families = SearchIndexedCollection(FAMILY_SEARCH_FIELDS)
+        self.users = SearchIndexedCollection(USER_SEARCH_FIELDS)
+        self.events = RangeIndexedCollection("family_id", "date")
+        self.change_requests = RangeIndexedCollection("family_id", "created_at")
+        self.custody_rules = InMemoryCollection()
+        self.custody_exceptions = RangeIndexedCollection("family_id", "date")
+        self.calendar_changes = InMemoryCollection()
+        self.counters = InMemoryCollection()
         self.conversations = InMemoryCollection()
         self.messages = InMemoryCollection()
         self.expenses = InMemoryCollection()
+        self.activity = RangeIndexedCollection("family_id", "created_at")
         self.documents = InMemoryCollection()
         self.document_folders = InMemoryCollection()
+        self.document_pages = InMemoryCollection()
+        self.document_terms = InMemoryCollection()
+        self.contract_jobs = InMemoryCollection()
+        self.contract_parse_cache = InMemoryCollection()
+        self.contract_runners = InMemoryCollection()
+        self.stats = InMemoryCollection()
+        self.export_jobs = InMemoryCollection()
+        self.request_profiles = InMemoryCollection()
+        for name, collection in vars(self).items():
+            collection.name = name
 
 
 try:
@@ -169,7 +785,8 @@ try:
         client = pymongo.MongoClient(
             mongo_uri, 
             tlsCAFile=certifi.where(),
-            serverSelectionTimeoutMS=5000  # 5 second timeout
+            serverSelectionTimeoutMS=5000,  # 5 second timeout
+            event_listeners=[_CommandObserver()]
         )
         db = client.bridge
         client.admin.command('ismaster')
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Script to export one family, or the whole platform, as a portable archive
+
+Usage:
+    python export_tenant.py <family id or code>
+    python export_tenant.py --all
+    python export_tenant.py --resume <export id>
+"""
+import sys
+
+from routers.documents import format_file_size
+from services import tenant_export
+
+def print_progress(job, printed):
+    """Print each collection as it finishes"""
+    for name, state in job["progress"].items():
+        if state["done"] and name not in printed:
+            print(f"   {name}: {state['count']} record(s)")
+            printed.add(name)
+
+def export_tenant(args):
+    """Create or resume an export job and run it in this process"""
+    if args[0] == "--resume":
+        if len(args) < 2:
+            print("❌ --resume needs the export id")
+            return
+        job = tenant_export.get_export_job(args[1])
+        if not job:
+            print(f"❌ Export {args[1]} not found")
+            return
+        print(f"Resuming export {job['id']}")
+    elif args[0] == "--all":
+        job = tenant_export.create_export_job("platform")
+        print(f"Exporting the whole platform (export {job['id']})")
+    else:
+        family = tenant_export.find_family(args[0])
+        if not family:
+            print(f"❌ Family {args[0]} not found")
+            return
+        job = tenant_export.create_export_job("family", family)
+        print(f"Exporting family {family.get('familyName')} (export {job['id']})")
+
+    printed = set()
+    job = tenant_export.run_export(job["id"], on_progress=lambda job: print_progress(job, printed))
+
+    if job["status"] != "completed":
+        print(f"❌ Export failed: {job['error']}")
+        print(f"   Resume with: python export_tenant.py --resume {job['id']}")
+        return
+    files = job["files"]
+    print(f"✅ Copied {files['count']} file(s) ({format_file_size(files['bytes'])})")
+    if files["missing"]:
+        print(f"⚠️  {files['missing']} referenced file(s) were missing from storage")
+    print(f"   Archive: {job['archive']['path']} ({format_file_size(job['archive']['bytes'])})")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    print("=" * 60)
+    print("Exporting Data")
+    print("=" * 60)
+    export_tenant(sys.argv[1:])
+    print("=" * 60)
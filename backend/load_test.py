@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Script to load-test the API with a mixed workload
+
+Usage:
+    python load_test.py [--families N] [--duration S] [--concurrency C] [--users U]
+    python load_test.py --url http://localhost:8000 [--prefix NAME] ...
+
+Without --url the app is driven in-process over an ASGI transport, and a
+population of --families families is generated first if it doesn't exist yet.
+With --url the requests go to a running server, whose database must already
+hold a population (python generate_data.py N against the same database).
+
+Workers log in as --users generated parents plus the load-test admin, then
+loop over a weighted mix of dashboard, messaging, activity, calendar, upload
+and admin requests for --duration seconds. The report gives throughput and
+latency percentiles per endpoint; --json writes it to a file as well.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    import httpx
+except ImportError:
+    # httpx is only needed to run the load test
+    httpx = None
+
+from database import db
+from services.synthetic_data import ADMIN_EMAIL, LAST_NAMES, LOADTEST_PASSWORD, generate_population, parent_email
+
+UPLOAD_BYTES = 50 * 1024
+RECEIPT_BYTES = 20 * 1024
+PERCENTILES = (50, 90, 99)
+
+
+class Session:
+    """A logged-in user and what the workload has learned about their family"""
+
+    def __init__(self, email: str, headers: Dict[str, str]):
+        self.email = email
+        self.headers = headers
+        self.conversation_ids: Optional[List[str]] = None
+
+
+async def login(client, email: str) -> Session:
+    response = await client.post("/api/v1/auth/login", data={"username": email, "password": LOADTEST_PASSWORD})
+    response.raise_for_status()
+    return Session(email, {"Authorization": f"Bearer {response.json()['access_token']}"})
+
+
+# Workload operations: each returns the endpoint it called, as a route template
+
+async def dashboard(client, session: Session, rng: random.Random):
+    await client.get("/api/v1/dashboard", headers=session.headers)
+    return "GET /api/v1/dashboard"
+
+async def list_conversations(client, session: Session, rng: random.Random):
+    response = await client.get("/api/v1/messaging/conversations", headers=session.headers)
+    if response.status_code == 200:
+        session.conversation_ids = [conversation["id"] for conversation in response.json()]
+    return "GET /api/v1/messaging/conversations"
+
+async def read_messages(client, session: Session, rng: random.Random):
+    if not session.conversation_ids:
+        return await list_conversations(client, session, rng)
+    conversation_id = rng.choice(session.conversation_ids)
+    await client.get(f"/api/v1/messaging/conversations/{conversation_id}/messages", headers=session.headers)
+    return "GET /api/v1/messaging/conversations/{conversation_id}/messages"
+
+async def send_message(client, session: Session, rng: random.Random):
+    if not session.conversation_ids:
+        return await list_conversations(client, session, rng)
+    await client.post("/api/v1/messaging/messages", headers=session.headers, json={
+        "conversation_id": rng.choice(session.conversation_ids), "content": "Load test message", "tone": "friendly"
+    })
+    return "POST /api/v1/messaging/messages"
+
+async def activity(client, session: Session, rng: random.Random):
+    await client.get("/api/v1/activity", headers=session.headers)
+    return "GET /api/v1/activity"
+
+async def calendar(client, session: Session, rng: random.Random):
+    today = date.today()
+    await client.get("/api/v1/calendar/events", headers=session.headers, params={"year": today.year, "month": today.month})
+    return "GET /api/v1/calendar/events"
+
+async def expenses(client, session: Session, rng: random.Random):
+    await client.get("/api/v1/expenses", headers=session.headers)
+    return "GET /api/v1/expenses"
+
+async def documents(client, session: Session, rng: random.Random):
+    await client.get("/api/v1/documents", headers=session.headers)
+    return "GET /api/v1/documents"
+
+async def upload_document(client, session: Session, rng: random.Random):
+    await client.post("/api/v1/documents/upload", headers=session.headers, json={
+        "name": "Load test scan", "type": "medical", "file_name": "loadtest.jpg",
+        "file_content": base64.b64encode(rng.randbytes(UPLOAD_BYTES)).decode("ascii"),
+    })
+    return "POST /api/v1/documents/upload"
+
+async def create_expense(client, session: Session, rng: random.Random):
+    await client.post("/api/v1/expenses", headers=session.headers, json={
+        "description": "Load test expense", "amount": round(rng.uniform(5, 200), 2), "category": "other",
+        "date": date.today().isoformat(), "receipt_file_name": "receipt.jpg",
+        "receipt_content": base64.b64encode(rng.randbytes(RECEIPT_BYTES)).decode("ascii"),
+    })
+    return "POST /api/v1/expenses"
+
+async def admin_stats(client, session: Session, rng: random.Random):
+    await client.get("/api/v1/admin/stats", headers=session.headers)
+    return "GET /api/v1/admin/stats"
+
+async def admin_families(client, session: Session, rng: random.Random):
+    await client.get("/api/v1/admin/families", headers=session.headers, params={"limit": 50})
+    return "GET /api/v1/admin/families"
+
+async def admin_search(client, session: Session, rng: random.Random):
+    await client.get("/api/v1/admin/search", headers=session.headers, params={"q": rng.choice(LAST_NAMES).lower()})
+    return "GET /api/v1/admin/search"
+
+# (operation, weight); admin operations run as the load-test admin
+PARENT_WORKLOAD = [
+    (dashboard, 25), (list_conversations, 12), (read_messages, 10), (send_message, 8), (activity, 8),
+    (calendar, 8), (expenses, 6), (documents, 5), (upload_document, 3), (create_expense, 3),
+]
+ADMIN_WORKLOAD = [(admin_stats, 4), (admin_families, 3), (admin_search, 3)]
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else 0.0
+
+
+class Results:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, endpoint: str, seconds: float, failed: bool):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        self.errors[endpoint] = self.errors.get(endpoint, 0) + int(failed)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        def summary(latencies: List[float], errors: int) -> Dict[str, Any]:
+            ordered = sorted(latencies)
+            return {
+                "requests": len(ordered),
+                "errors": errors,
+                "rps": round(len(ordered) / elapsed, 2),
+                **{f"p{pct}Ms": round(percentile(ordered, pct) * 1000, 2) for pct in PERCENTILES},
+                "maxMs": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+            }
+
+        everything = [seconds for latencies in self.latencies.values() for seconds in latencies]
+        return {
+            "seconds": round(elapsed, 2),
+            "total": summary(everything, sum(self.errors.values())),
+            "endpoints": {endpoint: summary(latencies, self.errors[endpoint]) for endpoint, latencies in sorted(self.latencies.items())},
+        }
+
+
+class _ResponseTracker:
+    """Wraps the client so every request's latency and status lands in Results under the operation's endpoint"""
+
+    def __init__(self, client, results: Results):
+        self.client = client
+        self.results = results
+        self.failed = False
+
+    async def request(self, method: str, url: str, **kwargs):
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.failed = True
+            raise
+        self.failed = self.failed or response.status_code >= 400
+        return response
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+
+async def worker(client, sessions: List[Session], admin: Session, results: Results, deadline: float, seed: int):
+    rng = random.Random(seed)
+    workload = [(operation, weight, False) for operation, weight in PARENT_WORKLOAD]
+    workload += [(operation, weight, True) for operation, weight in ADMIN_WORKLOAD]
+    weights = [weight for _, weight, _ in workload]
+    while time.perf_counter() < deadline:
+        operation, _, as_admin = rng.choices(workload, weights=weights)[0]
+        tracker = _ResponseTracker(client, results)
+        start = time.perf_counter()
+        try:
+            endpoint = await operation(tracker, admin if as_admin else rng.choice(sessions), rng)
+        except httpx.HTTPError as e:
+            endpoint = f"{operation.__name__} ({type(e).__name__})"
+        results.add(endpoint, time.perf_counter() - start, tracker.failed)
+
+
+async def run_load_test(client, args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    indexes = rng.sample(range(args.families), min(args.users, args.families))
+    print(f"Logging in {len(indexes)} parents and the admin...")
+    sessions = [await login(client, parent_email(args.prefix, index, "a")) for index in indexes]
+    admin = await login(client, ADMIN_EMAIL)
+
+    print(f"Running {args.concurrency} workers for {args.duration}s...")
+    results = Results()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*[
+        worker(client, sessions, admin, results, deadline, args.seed * 1000 + number)
+        for number in range(args.concurrency)
+    ])
+    return results.report(time.perf_counter() - start)
+
+
+def print_report(report: Dict[str, Any]):
+    header = f"{'endpoint':<62} {'reqs':>6} {'errs':>5} {'req/s':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for endpoint, row in rows:
+        print(f"{endpoint:<62} {row['requests']:>6} {row['errors']:>5} {row['rps']:>8} "
+              f"{row['p50Ms']:>8} {row['p90Ms']:>8} {row['p99Ms']:>8} {row['maxMs']:>8}")
+    print("(latencies in ms)")
+
+
+async def main(args):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        print(f"Load testing {args.url}")
+    else:
+        from main import app
+        if not db.users.find_one({"email": parent_email(args.prefix, 0, "a")}):
+            print(f"Generating {args.families} families...")
+            summary = await asyncio.to_thread(generate_population, args.families, args.seed, args.prefix)
+            print(f"   done in {summary['seconds']}s")
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=60)
+        print("Load testing the app in-process")
+
+    async with client:
+        report = await run_load_test(client, args)
+    report["config"] = {key: value for key, value in vars(args).items() if key != "json"}
+    report["finishedAt"] = datetime.utcnow().isoformat()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the API with a mixed workload")
+    parser.add_argument("--url", help="Base URL of a running server; omit to drive the app in-process")
+    parser.add_argument("--families", type=int, default=200, help="Families in the population (default 200)")
+    parser.add_argument("--prefix", default="family", help="Prefix the population was generated with (default 'family')")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default 1)")
+    parser.add_argument("--users", type=int, default=20, help="Distinct parents to log in as (default 20)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent workers (default 10)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run (default 30)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+    if httpx is None:
+        print("❌ httpx is required for the load test: pip install httpx")
+    else:
+        asyncio.run(main(args))
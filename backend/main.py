@@ -1,9 +1,31 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth, family, calendar, admin, messaging, expenses, activity, documents
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from routers import auth, family, calendar, admin, messaging, expenses, activity, documents, dashboard
 from database import db
+from services.loop_monitor import start_loop_monitor, stop_loop_monitor
+from services.metrics import METRICS_TOKEN, MetricsMiddleware, render_metrics
+from services.request_profiler import ProfilingMiddleware
+from services.platform_stats import start_stats_scheduler
+from services.contract_jobs import start_contract_recovery
+from services.document_search import start_extraction_recovery
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Admin statistics are recomputed in the background on a schedule
+    start_stats_scheduler()
+    # Contract jobs left unfinished by a stopped process are picked up again
+    start_contract_recovery()
+    # So are documents left mid-extraction
+    start_extraction_recovery()
+    # Event-loop lag is measured for as long as the app runs
+    start_loop_monitor()
+    yield
+    stop_loop_monitor()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware must be added BEFORE including routers
 app.add_middleware(
@@ -22,6 +44,10 @@ app.add_middleware(
     expose_headers=["*"],
     max_age=3600,
 )
+# Profiles requests on demand (X-Profile header from an admin, or sampled)
+app.add_middleware(ProfilingMiddleware)
+# Added last so it wraps everything else, CORS included
+app.add_middleware(MetricsMiddleware)
 
 db_connection_status = "successful" if db is not None else "failed"
 
@@ -34,6 +60,7 @@ app.include_router(messaging.router)
 app.include_router(expenses.router)
 app.include_router(activity.router)
 app.include_router(documents.router)
+app.include_router(dashboard.router)
 
 @app.get("/")
 def read_root():
@@ -41,4 +68,11 @@ def read_root():
 
 @app.get("/healthz")
 def health_check():
-    return {"status": "ok", "db_connection": db_connection_status}
\ No newline at end of file
+    return {"status": "ok", "db_connection": db_connection_status}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus scrape endpoint"""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
\ No newline at end of file
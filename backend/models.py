@@ -91,6 +91,25 @@ class EventCreate(BaseModel):
     parent: Optional[str] = None
     isSwappable: Optional[bool] = False
 
+class EventBatchUpdate(BaseModel):
+    id: str
+    date: Optional[datetime] = None
+    type: Optional[str] = None
+    title: Optional[str] = None
+    parent: Optional[str] = None
+    isSwappable: Optional[bool] = None
+
+class CalendarBatch(BaseModel):
+    create: List[EventCreate] = []
+    update: List[EventBatchUpdate] = []
+    delete: List[str] = []  # Event ids
+
+class CalendarImport(BaseModel):
+    fileName: str
+    fileContent: str  # Base64 encoded .ics or .csv file
+    format: Optional[str] = None  # 'ics' or 'csv'; detected from the file when omitted
+    dryRun: bool = False  # Validate and report without writing
+
 class ChangeRequest(BaseModel):
     id: Optional[str] = None
     event_id: str
@@ -99,6 +118,7 @@ class ChangeRequest(BaseModel):
     requestedDate: Optional[datetime] = None  # New date if requesting a date change
     reason: Optional[str] = None
     createdAt: datetime
+    conflicts: Optional[List[dict]] = None  # Reported when the request is made
 
 class ChangeRequestCreate(BaseModel):
     event_id: str
@@ -107,6 +127,60 @@ class ChangeRequestCreate(BaseModel):
 
 class ChangeRequestUpdate(BaseModel):
     status: str  # approved or rejected
+    force: bool = False  # Approve even if the move conflicts with the calendar
+
+class SwapSetValidation(BaseModel):
+    proposals: List[ChangeRequestCreate]
+
+# Recurring custody schedule models
+class CustodyRule(BaseModel):
+    id: Optional[str] = None
+    family_id: str
+    kind: str = "base"  # base (repeating pattern) or holiday (yearly override)
+    title: Optional[str] = None
+    parents: List[str] = ["mom", "dad"]  # Who "A" and "B" are in the pattern
+    # Base rules
+    pattern: Optional[str] = None  # 'week-on-week-off', '2-2-3', '2-2-5-5', 'alternating-weekends', 'custom'
+    cycle: Optional[str] = None  # For custom patterns, e.g. "AAAABBB" repeated from startDate
+    startDate: date
+    untilDate: Optional[date] = None
+    # Holiday rules: a fixed date (month/day) or the nth weekday of a month
+    month: Optional[int] = None
+    day: Optional[int] = None
+    weekday: Optional[int] = None  # 0=Monday
+    nth: Optional[int] = None  # 1-5, or -1 for the last one
+    durationDays: int = 1
+    alternate: bool = True  # Alternate yearly starting with parents[0] in startDate's year
+    createdAt: Optional[datetime] = None
+
+class CustodyRuleCreate(BaseModel):
+    kind: str = "base"
+    title: Optional[str] = None
+    parents: List[str] = ["mom", "dad"]
+    pattern: Optional[str] = None  # Defaults to the pattern found in the family's custody agreement
+    cycle: Optional[str] = None
+    startDate: date
+    untilDate: Optional[date] = None
+    month: Optional[int] = None
+    day: Optional[int] = None
+    weekday: Optional[int] = None
+    nth: Optional[int] = None
+    durationDays: int = 1
+    alternate: bool = True
+
+class ScheduleException(BaseModel):
+    id: Optional[str] = None
+    family_id: str
+    date: date
+    parent: str
+    reason: Optional[str] = None
+    change_request_id: Optional[str] = None
+    createdAt: Optional[datetime] = None
+
+class ScheduleExceptionCreate(BaseModel):
+    date: date
+    parent: str
+    reason: Optional[str] = None
 
 # Messaging Models
 class Message(BaseModel):
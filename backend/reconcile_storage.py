@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Script to reclaim orphaned files and flag records whose file is missing
+"""
+import sys
+
+from routers.documents import format_file_size
+from services.storage_reconciler import reconcile_storage
+
+def run_reconciliation(dry_run: bool):
+    """Reconcile the file store against the database and print the report"""
+    report = reconcile_storage(dry_run=dry_run)
+    
+    action = "Would reclaim" if dry_run else "Reclaimed"
+    print(f"✅ Scanned {report['filesScanned']} files ({format_file_size(report['bytesScanned'])})")
+    print(f"   {action} {report['orphanedFiles']} orphaned file(s): {format_file_size(report['bytesReclaimed'])}")
+    for key in report["orphanSamples"]:
+        print(f"     - {key}")
+    print(f"   Scanned {report['recordsScanned']} records, {report['danglingRecords']} with a missing file")
+    for record in report["danglingSamples"]:
+        print(f"     - {record['collection']} {record['id']}: {record['url']}")
+    if report["errors"]:
+        print(f"⚠️  {report['errors']} error(s) during reconciliation")
+
+if __name__ == "__main__":
+    dry_run = "--dry-run" in sys.argv
+    print("=" * 60)
+    print("Reconciling File Storage" + (" (dry run)" if dry_run else ""))
+    print("=" * 60)
+    run_reconciliation(dry_run)
+    print("=" * 60)
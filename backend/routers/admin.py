@@ -1,10 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from pydantic import BaseModel
+from typing import List, Optional
 from datetime import datetime
+import asyncio
 
 from models import User, Family, Child
 from routers.auth import get_current_user
 from database import db
+from routers.documents import DOCUMENTS_PREFIX
+from routers.expenses import RECEIPTS_PREFIX
+from services.storage import LocalStorage, shard_migration_status, start_shard_migration, storage
+from services.storage_reconciler import reconcile_status, start_reconciliation
+from services.storage_codec import migration_status, start_compression_migration
+from services import admin_search, db_profiler, request_profiler, tenant_export
+from services.loop_monitor import get_loop_status
+from services.platform_stats import DEFAULT_HISTORY_DAYS, MAX_HISTORY_DAYS, get_stats, refresh_stats
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, fetch_page
 
 try:
     from bson import ObjectId
@@ -14,49 +26,87 @@ except ImportError:
 
 router = APIRouter()
 
+# API sort name -> stored field; each is paired with _id so pages are stable
+FAMILY_SORTS = {"createdAt": "createdAt", "familyName": "familyName", "familyCode": "familyCode"}
+USER_SORTS = {"email": "email", "firstName": "firstName", "lastName": "lastName"}
+# Never returned to the client: the password hash and the search index fields
+PRIVATE_USER_FIELDS = ("password", "search_terms", "search_grams")
+
+
+def ensure_admin_indexes():
+    """Each admin listing sort is served by a (field, _id) index; the joins look up by email"""
+    try:
+        for field in FAMILY_SORTS.values():
+            db.families.create_index([(field, 1), ("_id", 1)])
+        db.families.create_index([("parent2_email", 1), ("createdAt", -1), ("_id", -1)])
+        db.families.create_index([("parent1_email", 1)])
+        db.families.create_index([("parent2_email", 1)])
+        for field in USER_SORTS.values():
+            db.users.create_index([(field, 1), ("_id", 1)])
+    except Exception as e:
+        print(f"⚠️  Could not create admin indexes: {e}")
+
+
+class ExportRequest(BaseModel):
+    familyId: Optional[str] = None  # Family _id or code; omit to export the whole platform
+
 def get_admin_user(current_user: User = Depends(get_current_user)):
     """Dependency to check if user is admin"""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
+def page_params(sort: str, order: Optional[str], allowed: dict, default_order: str):
+    if sort not in allowed:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by '{sort}'. Choose from: {', '.join(allowed)}")
+    order = order or default_order
+    return allowed[sort], 1 if order == "asc" else -1, order
+
+def page_response(items: list, total: int, next_cursor: Optional[str], sort: str, order: str) -> dict:
+    return {"items": items, "total": total, "nextCursor": next_cursor, "sort": sort, "order": order}
+
+def parent_info(email: Optional[str], name: Optional[str], user: Optional[dict]) -> dict:
+    return {
+        "email": email,
+        "name": name or "Unknown",
+        "firstName": user.get("firstName") if user else "Unknown",
+        "lastName": user.get("lastName") if user else "Unknown",
+    }
+
 @router.get("/api/v1/admin/families")
-async def get_all_families(admin: User = Depends(get_admin_user)):
-    """Get all families with their details (Admin only)"""
+async def get_all_families(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Number of families to return"),
+    cursor: Optional[str] = Query(None, description="nextCursor from the previous page"),
+    sort: str = Query("createdAt", description=f"One of: {', '.join(FAMILY_SORTS)}"),
+    order: Optional[str] = Query(None, pattern="^(asc|desc)$", description="Defaults to newest first for createdAt, otherwise ascending"),
+    linked: Optional[bool] = Query(None, description="Only linked (true) or unlinked (false) families"),
+    admin: User = Depends(get_admin_user)
+):
+    """Get a page of families with their details (Admin only)"""
     try:
-        families = list(db.families.find())
-        
-        # Convert MongoDB _id to string and format data
+        sort_field, direction, order = page_params(sort, order, FAMILY_SORTS, "desc" if sort == "createdAt" else "asc")
+        query = {}
+        if linked is True:
+            query["parent2_email"] = {"$ne": None}
+        elif linked is False:
+            query["parent2_email"] = None
+
+        families, next_cursor = fetch_page(db.families, query, sort_field, direction, cursor, limit)
+
+        # One lookup for every parent on the page
+        emails = {family.get(key) for family in families for key in ("parent1_email", "parent2_email")}
+        emails.discard(None)
+        users = {user["email"]: user for user in db.users.find({"email": {"$in": list(emails)}})} if emails else {}
+
         result = []
         for family in families:
-            family['_id'] = str(family['_id'])
-            
-            # Get user details for parent1
-            parent1_user = db.users.find_one({"email": family.get("parent1_email")})
-            parent1_info = {
-                "email": family.get("parent1_email"),
-                "name": family.get("parent1_name", "Unknown"),
-                "firstName": parent1_user.get("firstName") if parent1_user else "Unknown",
-                "lastName": parent1_user.get("lastName") if parent1_user else "Unknown",
-            }
-            
-            # Get user details for parent2 if exists
-            parent2_info = None
-            if family.get("parent2_email"):
-                parent2_user = db.users.find_one({"email": family.get("parent2_email")})
-                parent2_info = {
-                    "email": family.get("parent2_email"),
-                    "name": family.get("parent2_name", "Unknown"),
-                    "firstName": parent2_user.get("firstName") if parent2_user else "Unknown",
-                    "lastName": parent2_user.get("lastName") if parent2_user else "Unknown",
-                }
-            
             result.append({
-                "id": family['_id'],
+                "id": str(family['_id']),
                 "familyName": family.get("familyName"),
                 "familyCode": family.get("familyCode"),
-                "parent1": parent1_info,
-                "parent2": parent2_info,
+                "parent1": parent_info(family.get("parent1_email"), family.get("parent1_name"), users.get(family.get("parent1_email"))),
+                "parent2": parent_info(family.get("parent2_email"), family.get("parent2_name"), users.get(family.get("parent2_email")))
+                    if family.get("parent2_email") else None,
                 "children": family.get("children", []),
                 "childrenCount": len(family.get("children", [])),
                 "custodyArrangement": family.get("custodyArrangement"),
@@ -64,12 +114,47 @@ async def get_all_families(admin: User = Depends(get_admin_user)):
                 "linkedAt": family.get("linkedAt"),
                 "isLinked": bool(family.get("parent2_email"))
             })
-        
-        return result
+
+        return page_response(result, db.families.count_documents(query), next_cursor, sort, order)
+    except HTTPException:
+        raise
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error fetching families: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching families: {str(e)}")
 
+@router.get("/api/v1/admin/search")
+async def search_admin(
+    q: str = Query(..., min_length=1, max_length=200, description="Email, name, family name or family code, or part of one"),
+    type: Optional[str] = Query(None, pattern="^(user|family)$", description="Only users or only families"),
+    limit: int = Query(admin_search.DEFAULT_PAGE_SIZE, ge=1, le=admin_search.MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, description="nextOffset from the previous page"),
+    admin: User = Depends(get_admin_user)
+):
+    """Find users and families, best matches first (Admin only)"""
+    try:
+        if not q.strip():
+            raise HTTPException(status_code=400, detail="Search query is empty")
+        kinds = [type] if type else ["user", "family"]
+        return admin_search.search(q, kinds, limit=limit, offset=offset)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error searching: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching: {str(e)}")
+
+@router.post("/api/v1/admin/search/reindex")
+async def reindex_admin_search(admin: User = Depends(get_admin_user)):
+    """Add search fields to users and families created before search existed (Admin only)"""
+    try:
+        users = await asyncio.to_thread(admin_search.reindex, "user")
+        families = await asyncio.to_thread(admin_search.reindex, "family")
+        return {"users": users, "families": families}
+    except Exception as e:
+        print(f"Error reindexing search: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error reindexing search: {str(e)}")
+
 @router.get("/api/v1/admin/families/{family_id}")
 async def get_family_details(family_id: str, admin: User = Depends(get_admin_user)):
     """Get detailed information about a specific family (Admin only)"""
@@ -97,13 +182,15 @@ async def get_family_details(family_id: str, admin: User = Depends(get_admin_use
             parent1_user = dict(parent1_user)
             if '_id' in parent1_user:
                 parent1_user['_id'] = str(parent1_user['_id'])
-            parent1_user.pop('password', None)
+            for field in PRIVATE_USER_FIELDS:
+                parent1_user.pop(field, None)
         
         if parent2_user:
             parent2_user = dict(parent2_user)
             if '_id' in parent2_user:
                 parent2_user['_id'] = str(parent2_user['_id'])
-            parent2_user.pop('password', None)
+            for field in PRIVATE_USER_FIELDS:
+                parent2_user.pop(field, None)
         
         return {
             "id": family['_id'],
@@ -126,52 +213,229 @@ async def get_family_details(family_id: str, admin: User = Depends(get_admin_use
         raise HTTPException(status_code=500, detail=f"Error fetching family details: {str(e)}")
 
 @router.get("/api/v1/admin/stats")
-async def get_admin_stats(admin: User = Depends(get_admin_user)):
-    """Get overall statistics (Admin only)"""
+async def get_admin_stats(
+    days: int = Query(DEFAULT_HISTORY_DAYS, ge=1, le=MAX_HISTORY_DAYS, description="Days of daily history to include"),
+    admin: User = Depends(get_admin_user)
+):
+    """Get overall statistics and daily trends (Admin only)"""
     try:
-        total_families = db.families.count_documents({})
-        linked_families = db.families.count_documents({"parent2_email": {"$ne": None}})
-        total_users = db.users.count_documents({})
-        
-        # Count total children across all families
-        families = list(db.families.find({}, {"children": 1}))
-        total_children = sum(len(f.get("children", [])) for f in families)
-        
+        # A cold stats collection means a full refresh, which must not run on the event loop
+        stats = await asyncio.to_thread(get_stats, days)
+        totals = stats["totals"]
+        total_families = totals.get("families", 0)
+        linked_families = totals.get("linkedFamilies", 0)
+        # The newest row is only today's once something has been counted or refreshed today
+        today_key = datetime.utcnow().strftime("%Y-%m-%d")
+        today = next((point for point in reversed(stats["history"]) if point["date"] == today_key), {})
+
         return {
             "totalFamilies": total_families,
             "linkedFamilies": linked_families,
             "unlinkedFamilies": total_families - linked_families,
-            "totalUsers": total_users,
-            "totalChildren": total_children
+            "linkedRatio": round(linked_families / total_families, 4) if total_families else 0.0,
+            "totalUsers": totals.get("users", 0),
+            "totalChildren": totals.get("children", 0),
+            "totalMessages": totals.get("messages", 0),
+            "messagesToday": today.get("messages", 0),
+            "expenseCount": totals.get("expenseCount", 0),
+            "expenseVolume": round(totals.get("expenseAmount", 0.0), 2),
+            "storageBytes": totals.get("storageBytes", 0),
+            "activeFamilies": totals.get("activeFamilies", 0),
+            "refreshedAt": totals.get("refreshedAt"),
+            "history": stats["history"]
         }
     except Exception as e:
         print(f"Error fetching stats: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching stats: {str(e)}")
 
+@router.post("/api/v1/admin/stats/refresh")
+async def refresh_admin_stats(admin: User = Depends(get_admin_user)):
+    """Recompute statistics now instead of waiting for the next scheduled refresh (Admin only)"""
+    try:
+        totals = await asyncio.to_thread(refresh_stats)
+        return {key: value for key, value in totals.items() if key != "_id"}
+    except Exception as e:
+        print(f"Error refreshing stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error refreshing stats: {str(e)}")
+
+@router.get("/api/v1/admin/db/profile")
+async def get_db_profile(
+    sort: str = Query("time", description=f"Rank query shapes by: {', '.join(db_profiler.SORTS)}"),
+    limit: int = Query(20, ge=1, le=200, description="Number of shapes and slow queries to return"),
+    admin: User = Depends(get_admin_user)
+):
+    """Get the busiest and slowest database query shapes, unindexed scans and recent slow queries (Admin only)"""
+    if sort not in db_profiler.SORTS:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by '{sort}'. Choose from: {', '.join(db_profiler.SORTS)}")
+    return db_profiler.get_profile(sort, limit)
+
+@router.delete("/api/v1/admin/db/profile")
+async def reset_db_profile(admin: User = Depends(get_admin_user)):
+    """Clear the collected query profile (Admin only)"""
+    db_profiler.reset_profile()
+    return {"message": "Database profile reset"}
+
+@router.get("/api/v1/admin/event-loop")
+async def get_event_loop_status(admin: User = Depends(get_admin_user)):
+    """Get event-loop lag percentiles and, in debug mode, what recently blocked the loop (Admin only)"""
+    return get_loop_status()
+
+@router.get("/api/v1/admin/profiles")
+async def get_request_profiles(
+    limit: int = Query(20, ge=1, le=request_profiler.MAX_PROFILES, description="Number of profiles to return"),
+    admin: User = Depends(get_admin_user)
+):
+    """List recent request profiles, newest first (Admin only)"""
+    return {"profiles": request_profiler.list_profiles(limit), "sampleRate": request_profiler.PROFILE_SAMPLE_RATE}
+
+@router.get("/api/v1/admin/profiles/{profile_id}")
+async def get_request_profile(profile_id: str, admin: User = Depends(get_admin_user)):
+    """Get a request profile with its collapsed stacks and hottest functions (Admin only)"""
+    profile = request_profiler.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@router.get("/api/v1/admin/profiles/{profile_id}/collapsed")
+async def download_request_profile(profile_id: str, admin: User = Depends(get_admin_user)):
+    """Download a profile's collapsed stacks for flamegraph.pl or speedscope (Admin only)"""
+    profile = request_profiler.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(
+        profile["collapsed"] + "\n",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.collapsed"'}
+    )
+
 @router.get("/api/v1/admin/users")
-async def get_all_users(admin: User = Depends(get_admin_user)):
-    """Get all users (Admin only)"""
+async def get_all_users(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Number of users to return"),
+    cursor: Optional[str] = Query(None, description="nextCursor from the previous page"),
+    sort: str = Query("email", description=f"One of: {', '.join(USER_SORTS)}"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    admin: User = Depends(get_admin_user)
+):
+    """Get a page of users (Admin only)"""
     try:
-        users = list(db.users.find({}, {"password": 0}))  # Exclude passwords
-        
+        sort_field, direction, order = page_params(sort, order, USER_SORTS, "asc")
+        users, next_cursor = fetch_page(db.users, {}, sort_field, direction, cursor, limit)
+
+        # One lookup for the families of everyone on the page
+        emails = [user.get("email") for user in users if user.get("email")]
+        families_by_email = {}
+        if emails:
+            for family in db.families.find({"$or": [
+                {"parent1_email": {"$in": emails}},
+                {"parent2_email": {"$in": emails}}
+            ]}):
+                for key in ("parent1_email", "parent2_email"):
+                    if family.get(key):
+                        families_by_email.setdefault(family[key], family)
+
+        result = []
         for user in users:
+            # Copy rather than edit the stored document, and never return the password
+            user = {key: value for key, value in user.items() if key not in PRIVATE_USER_FIELDS}
             user['_id'] = str(user['_id'])
-            
-            # Find if user is part of any family
-            family = db.families.find_one({
-                "$or": [
-                    {"parent1_email": user.get("email")},
-                    {"parent2_email": user.get("email")}
-                ]
-            })
-            
+            family = families_by_email.get(user.get("email"))
             user['hasFamily'] = bool(family)
             if family:
                 user['familyName'] = family.get("familyName")
                 user['familyId'] = str(family['_id'])
-        
-        return users
+            result.append(user)
+
+        return page_response(result, db.users.count_documents({}), next_cursor, sort, order)
+    except HTTPException:
+        raise
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error fetching users: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
 
+@router.post("/api/v1/admin/storage/compress")
+async def start_storage_compression(admin: User = Depends(get_admin_user)):
+    """Start recompressing existing documents and receipts in the background (Admin only)"""
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=400, detail="Compression at rest only applies to local file storage")
+    started = start_compression_migration(storage.path_for(DOCUMENTS_PREFIX), storage.path_for(RECEIPTS_PREFIX))
+    return {"started": started, "status": migration_status}
+
+@router.get("/api/v1/admin/storage/compress")
+async def get_storage_compression_status(admin: User = Depends(get_admin_user)):
+    """Get progress of the storage compression migration (Admin only)"""
+    return migration_status
+
+@router.post("/api/v1/admin/storage/shard")
+async def start_storage_sharding(admin: User = Depends(get_admin_user)):
+    """Move files from the flat layout into hash-sharded directories in the background (Admin only)"""
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=400, detail="Sharding only applies to local file storage")
+    started = start_shard_migration(DOCUMENTS_PREFIX, RECEIPTS_PREFIX)
+    return {"started": started, "status": shard_migration_status}
+
+@router.get("/api/v1/admin/storage/shard")
+async def get_storage_sharding_status(admin: User = Depends(get_admin_user)):
+    """Get progress of the shard migration (Admin only)"""
+    return shard_migration_status
+
+@router.post("/api/v1/admin/storage/reconcile")
+async def start_storage_reconciliation(dry_run: bool = False, admin: User = Depends(get_admin_user)):
+    """Reclaim orphaned files and flag records with missing files in the background (Admin only)"""
+    started = start_reconciliation(dry_run=dry_run)
+    return {"started": started, "status": reconcile_status}
+
+@router.get("/api/v1/admin/storage/reconcile")
+async def get_storage_reconciliation_status(admin: User = Depends(get_admin_user)):
+    """Get the latest storage reconciliation report (Admin only)"""
+    return reconcile_status
+
+@router.post("/api/v1/admin/exports")
+async def create_export(export_request: ExportRequest, admin: User = Depends(get_admin_user)):
+    """Start exporting one family, or every family, as an archive in the background (Admin only)"""
+    try:
+        family = None
+        if export_request.familyId:
+            family = tenant_export.find_family(export_request.familyId)
+            if not family:
+                raise HTTPException(status_code=404, detail="Family not found")
+        job = tenant_export.create_export_job("family" if family else "platform", family, created_by=admin.email)
+        tenant_export.start_export(job["id"])
+        return tenant_export.export_summary(job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error starting export: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error starting export: {str(e)}")
+
+@router.get("/api/v1/admin/exports/{export_id}")
+async def get_export(export_id: str, admin: User = Depends(get_admin_user)):
+    """Get the progress of an export (Admin only)"""
+    job = tenant_export.get_export_job(export_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return tenant_export.export_summary(job)
+
+@router.post("/api/v1/admin/exports/{export_id}/resume")
+async def resume_export(export_id: str, admin: User = Depends(get_admin_user)):
+    """Continue a failed or interrupted export from its last checkpoint (Admin only)"""
+    job = tenant_export.get_export_job(export_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job["status"] == "completed":
+        raise HTTPException(status_code=400, detail="Export already completed")
+    started = tenant_export.start_export(export_id)
+    return {"started": started, "export": tenant_export.export_summary(job)}
+
+@router.get("/api/v1/admin/exports/{export_id}/download")
+async def download_export(export_id: str, admin: User = Depends(get_admin_user)):
+    """Download a completed export archive (Admin only)"""
+    job = tenant_export.get_export_job(export_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job["status"] != "completed" or not job.get("archive"):
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    return FileResponse(job["archive"]["path"], media_type="application/zip", filename=f"export-{export_id}.zip")
+
+
+ensure_admin_indexes()
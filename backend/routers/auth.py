@@ -8,6 +8,8 @@ import os
 
 from models import User
 from database import db
+from services.admin_search import search_fields
+from services.platform_stats import record_stats
 
 router = APIRouter()
 
@@ -40,7 +42,9 @@ async def create_user(user_data: User):
     
     hashed_password = pwd_context.hash(user_data.password)
     user_in_db = user_data.model_copy(update={"password": hashed_password})
-    db.users.insert_one(user_in_db.model_dump())
+    user_doc = user_in_db.model_dump()
+    db.users.insert_one({**user_doc, **search_fields("user", user_doc)})
+    record_stats({"users": 1}, {"newUsers": 1})
     return user_in_db
 
 @router.post("/api/v1/auth/login", response_model=Token)
@@ -1,138 +1,1029 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional, Tuple
+from pymongo import UpdateOne
 import uuid
-from datetime import datetime
+import base64
+import secrets
+from datetime import date, datetime, timedelta, timezone
 
-from models import Event, EventCreate, User, ChangeRequest, ChangeRequestCreate, ChangeRequestUpdate
+from models import (
+    CalendarBatch, CalendarImport, Event, EventCreate, User, ChangeRequest, ChangeRequestCreate, ChangeRequestUpdate,
+    CustodyRule, CustodyRuleCreate, ScheduleException, ScheduleExceptionCreate, SwapSetValidation
+)
 from routers.auth import get_current_user
+from database import db
+from services.custody_schedule import (
+    add_exception, apply_custody_swap, custody_events,
+    parse_custody_event_id, pattern_from_text, schedule_parents, to_date, to_datetime, validate_rule
+)
+from services.custody_map import custody_stats, invalidate_custody_map, parent_on, refresh_custody_days
+from services.calendar_sync import (
+    CHANGE_REQUEST, EVENT, SCHEDULE, SyncTokenExpired, changes_since, current_sequence,
+    encode_sync_token, ics_etag, record_calendar_change, record_calendar_changes, render_ics
+)
+from services.calendar_import import MAX_IMPORT_EVENTS, natural_key, parse_calendar_file
+from services.calendar_conflicts import find_conflicts, resolve_event, validate_swap_set
+from services import activity_log
 
 router = APIRouter()
 
-# In-memory "database" for demonstration purposes
-fake_events_db = {}
-fake_change_requests_db = {}
+# Longest window a single range query may cover
+MAX_RANGE_DAYS = 366 * 2
+MAX_BATCH_OPERATIONS = 1000
+# Imported events are de-duplicated and written this many at a time
+IMPORT_CHUNK_SIZE = 500
+
+
+def ensure_calendar_indexes():
+    """Range queries are (family_id, date); change requests are listed newest first per family"""
+    try:
+        db.events.create_index([("family_id", 1), ("date", 1)])
+        db.events.create_index([("id", 1)])
+        db.events.create_index([("family_id", 1), ("natural_key", 1)])
+        db.change_requests.create_index([("family_id", 1), ("created_at", -1)])
+        db.change_requests.create_index([("event_id", 1), ("status", 1)])
+        db.change_requests.create_index([("id", 1)])
+    except Exception as e:
+        print(f"⚠️  Could not create calendar indexes: {e}")
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """Store every date as naive UTC so range comparisons never mix aware and naive values"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def resolve_date_range(
+    year: Optional[int],
+    month: Optional[int],
+    start: Optional[datetime],
+    end: Optional[datetime]
+) -> Tuple[datetime, datetime]:
+    """Turn year/month or start/end query parameters into a half-open [start, end) range"""
+    if start or end:
+        if not (start and end):
+            raise HTTPException(status_code=400, detail="Both start and end are required")
+        start, end = to_utc_naive(start), to_utc_naive(end)
+        if end <= start:
+            raise HTTPException(status_code=400, detail="end must be after start")
+        if (end - start).days > MAX_RANGE_DAYS:
+            raise HTTPException(status_code=400, detail=f"Range cannot exceed {MAX_RANGE_DAYS} days")
+        return start, end
+
+    if year is None:
+        raise HTTPException(status_code=400, detail="Provide year (and optionally month) or start and end")
+    if month is None:
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="Month must be between 1 and 12")
+    if month == 12:
+        return datetime(year, 12, 1), datetime(year + 1, 1, 1)
+    return datetime(year, month, 1), datetime(year, month + 1, 1)
+
+
+def refresh_day(family_id: str, value: datetime):
+    """Patch one day of the family's cached custody map"""
+    day = to_date(value)
+    refresh_custody_days(family_id, day, day + timedelta(days=1))
+
+
+def build_event_doc(family_id: str, event_data: EventCreate, created_by: str, now: datetime) -> dict:
+    event_date = to_utc_naive(event_data.date)
+    return {
+        "id": str(uuid.uuid4()),
+        "family_id": family_id,
+        "date": event_date,
+        "type": event_data.type,
+        "title": event_data.title,
+        "parent": event_data.parent,
+        "isSwappable": event_data.isSwappable,
+        # Identifies the same real-world event across imports
+        "natural_key": natural_key(event_date, event_data.type, event_data.title),
+        "created_by_email": created_by,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+def format_event(doc: dict) -> Event:
+    return Event(
+        id=doc.get("id") or str(doc.get("_id", "")),
+        family_id=doc["family_id"],
+        date=doc["date"],
+        type=doc["type"],
+        title=doc["title"],
+        parent=doc.get("parent"),
+        isSwappable=doc.get("isSwappable", False)
+    )
+
+
+def format_change_request(doc: dict) -> ChangeRequest:
+    return ChangeRequest(
+        id=doc.get("id") or str(doc.get("_id", "")),
+        event_id=doc["event_id"],
+        requestedBy_email=doc["requested_by_email"],
+        status=doc.get("status", "pending"),
+        requestedDate=doc.get("requestedDate"),
+        reason=doc.get("reason"),
+        createdAt=doc["created_at"]
+    )
+
 
 @router.get("/api/v1/calendar/events", response_model=List[Event])
 async def get_calendar_events(
-    year: int = Query(..., description="Year to fetch events for"),
-    month: int = Query(..., description="Month to fetch events for (1-12)")
-    # TODO: Re-enable authentication: current_user: User = Depends(get_current_user)
+    year: Optional[int] = Query(None, description="Year to fetch events for"),
+    month: Optional[int] = Query(None, description="Month to fetch events for (1-12). Omit for the whole year"),
+    start: Optional[datetime] = Query(None, description="Start of the range (inclusive)"),
+    end: Optional[datetime] = Query(None, description="End of the range (exclusive)"),
+    expand: bool = Query(True, description="Include custody days expanded from the family's recurring schedule"),
+    current_user: User = Depends(get_current_user)
 ):
-    """Get calendar events for a specific month."""
-    # In a real implementation, we would:
-    # 1. Get the user's family_id
-    # 2. Query events for that family_id within the specified month
-    
-    # For now, return all events (filtered by month in a real implementation)
-    events = []
-    for event in fake_events_db.values():
-        # Filter by year and month
-        if event.date.year == year and event.date.month == month:
-            events.append(event)
-    
-    return events
+    """Get calendar events for a month, a year or an arbitrary date range."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        family_id = str(family["_id"])
+        range_start, range_end = resolve_date_range(year, month, start, end)
+
+        # One query on the (family_id, date) index, whatever the size of the range
+        events = db.events.find({
+            "family_id": family_id,
+            "date": {"$gte": range_start, "$lt": range_end}
+        }).sort("date", 1)
+        events = [format_event(event) for event in events]
+
+        # Custody days are expanded from a few rule records for just this range
+        if expand:
+            events += [format_event(event) for event in custody_events(family_id, range_start, range_end)]
+            events.sort(key=lambda event: event.date)
+
+        return events
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Get calendar events: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/api/v1/calendar/events", response_model=Event)
 async def create_calendar_event(
-    event_data: EventCreate
-    # TODO: Re-enable authentication: current_user: User = Depends(get_current_user)
+    event_data: EventCreate,
+    current_user: User = Depends(get_current_user)
 ):
     """Create a new calendar event."""
-    # In a real implementation, we would:
-    # 1. Get the user's family_id from the database
-    # 2. Verify the user has permission to create events for this family
-    
-    # For now, use a placeholder family_id
-    family_id = "placeholder-family-id"
-    
-    event_id = str(uuid.uuid4())
-    event = Event(
-        id=event_id,
-        family_id=family_id,
-        date=event_data.date,
-        type=event_data.type,
-        title=event_data.title,
-        parent=event_data.parent,
-        isSwappable=event_data.isSwappable
-    )
-    
-    fake_events_db[event_id] = event
-    return event
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        event_doc = build_event_doc(str(family["_id"]), event_data, current_user.email, datetime.utcnow())
+
+        db.events.insert_one(event_doc)
+        record_calendar_change(event_doc["family_id"], EVENT, event_doc["id"])
+        activity_log.record_activity(
+            event_doc["family_id"], activity_log.CALENDAR_UPDATE, f"event:{event_doc['id']}", current_user.email,
+            title=event_doc["title"], eventType=event_doc["type"], parent=event_doc["parent"],
+            parentName=activity_log.custody_parent_name(family, event_doc["parent"])
+        )
+        if event_doc["type"] == "custody":
+            refresh_day(event_doc["family_id"], event_doc["date"])
+        return format_event(event_doc)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Create calendar event: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/api/v1/calendar/events/{event_id}")
+async def delete_calendar_event(event_id: str, current_user: User = Depends(get_current_user)):
+    """Delete a calendar event."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        family_id = str(family["_id"])
+        event = db.events.find_one({"family_id": family_id, "id": event_id})
+        if not event:
+            raise HTTPException(status_code=404, detail="Event not found")
+
+        db.events.delete_one({"family_id": family_id, "id": event_id})
+        # Clients holding an older sync token get a tombstone for it
+        record_calendar_change(family_id, EVENT, event_id, "delete")
+        activity_log.retire_activity(family_id, f"event:{event_id}")
+        if event.get("type") == "custody":
+            refresh_day(family_id, event["date"])
+
+        return {"message": "Event deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Delete calendar event: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/v1/calendar/events/batch")
+async def batch_calendar_events(
+    batch: CalendarBatch,
+    current_user: User = Depends(get_current_user)
+):
+    """Create, update and delete many calendar events in one request."""
+    try:
+        if len(batch.create) + len(batch.update) + len(batch.delete) > MAX_BATCH_OPERATIONS:
+            raise HTTPException(status_code=400, detail=f"A batch cannot exceed {MAX_BATCH_OPERATIONS} operations")
+
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        family_id = str(family["_id"])
+        now = datetime.utcnow()
+        results = []
+        changes = []
+        custody_changed = False
+
+        # One query for every event the batch touches
+        target_ids = [update.id for update in batch.update] + list(batch.delete)
+        existing: Dict[str, dict] = {}
+        if target_ids:
+            existing = {event["id"]: event for event in db.events.find({"family_id": family_id, "id": {"$in": target_ids}})}
+
+        new_events = [build_event_doc(family_id, event_data, current_user.email, now) for event_data in batch.create]
+        for index, event_doc in enumerate(new_events):
+            results.append({"op": "create", "index": index, "id": event_doc["id"], "status": "created"})
+            changes.append((EVENT, event_doc["id"], "upsert"))
+            custody_changed = custody_changed or event_doc["type"] == "custody"
+
+        deleting = set(batch.delete)
+        updates = []
+        for index, update in enumerate(batch.update):
+            event = existing.get(update.id)
+            if not event:
+                results.append({"op": "update", "index": index, "id": update.id, "status": "not_found"})
+                continue
+            if update.id in deleting:
+                results.append({"op": "update", "index": index, "id": update.id, "status": "invalid", "error": "Event is also being deleted"})
+                continue
+
+            fields = {key: value for key, value in update.model_dump(exclude_unset=True).items() if key != "id"}
+            if fields.get("date"):
+                fields["date"] = to_utc_naive(fields["date"])
+            merged = dict(event, **fields)
+            fields["natural_key"] = natural_key(merged["date"], merged["type"], merged["title"])
+            fields["updated_at"] = now
+            updates.append(UpdateOne({"family_id": family_id, "id": update.id}, {"$set": fields}))
+            # Later updates to the same event in this batch see this one
+            existing[update.id] = merged
+
+            results.append({"op": "update", "index": index, "id": update.id, "status": "updated"})
+            changes.append((EVENT, update.id, "upsert"))
+            custody_changed = custody_changed or "custody" in (event.get("type"), merged["type"])
+
+        deleted_ids = []
+        for index, event_id in enumerate(batch.delete):
+            event = existing.get(event_id)
+            if not event or event_id in deleted_ids:
+                results.append({"op": "delete", "index": index, "id": event_id, "status": "not_found"})
+                continue
+            deleted_ids.append(event_id)
+            results.append({"op": "delete", "index": index, "id": event_id, "status": "deleted"})
+            changes.append((EVENT, event_id, "delete"))
+            custody_changed = custody_changed or event.get("type") == "custody"
+
+        if new_events:
+            db.events.insert_many(new_events)
+        if updates:
+            db.events.bulk_write(updates, ordered=False)
+        if deleted_ids:
+            db.events.delete_many({"family_id": family_id, "id": {"$in": deleted_ids}})
+            activity_log.retire_activities(family_id, [f"event:{event_id}" for event_id in deleted_ids])
+
+        record_calendar_changes(family_id, changes)
+        if custody_changed:
+            invalidate_custody_map(family_id)
+        # One feed entry for the whole batch rather than one per event
+        if new_events:
+            activity_log.record_activity(
+                family_id, activity_log.CALENDAR_IMPORT, f"batch:{uuid.uuid4()}", current_user.email,
+                count=len(new_events), source="Batch update"
+            )
+
+        return {
+            "created": len(new_events),
+            "updated": len(updates),
+            "deleted": len(deleted_ids),
+            "results": results
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Batch calendar events: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/v1/calendar/import")
+async def import_calendar(
+    import_data: CalendarImport,
+    current_user: User = Depends(get_current_user)
+):
+    """Import events from an .ics or .csv file, skipping events the calendar already has."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        family_id = str(family["_id"])
+
+        try:
+            content = base64.b64decode(import_data.fileContent)
+            if not content.strip():
+                raise ValueError("the file is empty")
+            rows = parse_calendar_file(content, import_data.fileName, import_data.format)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Could not read calendar file: {e}")
+
+        now = datetime.utcnow()
+        results = []
+        changes = []
+        seen_keys = set()
+        counts = {"created": 0, "duplicate": 0, "invalid": 0}
+        custody_changed = False
+        chunk: List[Tuple[dict, dict]] = []
+
+        def flush():
+            nonlocal custody_changed
+            keys = [event_doc["natural_key"] for _, event_doc in chunk]
+            # De-duplicate the whole chunk against the calendar with one query
+            seen_keys.update(
+                event["natural_key"]
+                for event in db.events.find({"family_id": family_id, "natural_key": {"$in": keys}})
+            )
+            new_events = []
+            for result, event_doc in chunk:
+                if event_doc["natural_key"] in seen_keys:
+                    result["status"] = "duplicate"
+                else:
+                    seen_keys.add(event_doc["natural_key"])
+                    result["status"] = "created"
+                    if not import_data.dryRun:
+                        result["id"] = event_doc["id"]
+                    new_events.append(event_doc)
+                counts[result["status"]] += 1
+
+            if new_events and not import_data.dryRun:
+                db.events.insert_many(new_events)
+                changes.extend((EVENT, event_doc["id"], "upsert") for event_doc in new_events)
+                custody_changed = custody_changed or any(event_doc["type"] == "custody" for event_doc in new_events)
+            chunk.clear()
+
+        parsed = 0
+        for line, fields, error in rows:
+            if fields is None:
+                status = "warning" if error.startswith("Warning: ") else "invalid"
+                if status == "invalid":
+                    counts["invalid"] += 1
+                results.append({"line": line, "status": status, "error": error})
+                continue
+
+            parsed += 1
+            if parsed > MAX_IMPORT_EVENTS:
+                results.append({"line": line, "status": "invalid", "error": f"Import stopped after {MAX_IMPORT_EVENTS} events"})
+                counts["invalid"] += 1
+                break
+
+            event_doc = build_event_doc(family_id, EventCreate(**fields), current_user.email, now)
+            event_doc["source"] = "import"
+            if fields["import_uid"]:
+                event_doc["natural_key"] = natural_key(event_doc["date"], event_doc["type"], event_doc["title"], fields["import_uid"])
+
+            result = {"line": line, "title": event_doc["title"], "date": event_doc["date"].isoformat()}
+            results.append(result)
+            chunk.append((result, event_doc))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                flush()
+        if chunk:
+            flush()
+
+        record_calendar_changes(family_id, changes)
+        if custody_changed:
+            invalidate_custody_map(family_id)
+        if changes:
+            activity_log.record_activity(
+                family_id, activity_log.CALENDAR_IMPORT, f"import:{uuid.uuid4()}", current_user.email,
+                count=len(changes), source=import_data.fileName
+            )
+
+        return dict(counts, dryRun=import_data.dryRun, results=results)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Import calendar: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/api/v1/calendar/change-requests", response_model=ChangeRequest)
 async def create_change_request(
-    request_data: ChangeRequestCreate
-    # TODO: Re-enable authentication: current_user: User = Depends(get_current_user)
+    request_data: ChangeRequestCreate,
+    current_user: User = Depends(get_current_user)
 ):
     """Submit a change request for a calendar event."""
-    # In a real implementation, we would:
-    # 1. Verify the event exists
-    # 2. Verify the user has permission to request changes
-    # 3. Get the user's email from the current_user
-    
-    # Check if event exists
-    if request_data.event_id not in fake_events_db:
-        raise HTTPException(status_code=404, detail="Event not found")
-    
-    # For now, use a placeholder email
-    user_email = "placeholder@example.com"
-    
-    request_id = str(uuid.uuid4())
-    change_request = ChangeRequest(
-        id=request_id,
-        event_id=request_data.event_id,
-        requestedBy_email=user_email,
-        status="pending",
-        requestedDate=request_data.requestedDate,
-        reason=request_data.reason,
-        createdAt=datetime.utcnow()
-    )
-    
-    fake_change_requests_db[request_id] = change_request
-    return change_request
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        family_id = str(family["_id"])
+
+        # The event must belong to the same family, or be a day of its recurring schedule
+        event = resolve_event(family_id, request_data.event_id)
+        if not event:
+            raise HTTPException(status_code=404, detail="Event not found")
+
+        requested_date = to_utc_naive(request_data.requestedDate) if request_data.requestedDate else None
+        conflicts = find_conflicts(family_id, event, requested_date) if requested_date else []
+
+        now = datetime.utcnow()
+        request_doc = {
+            "id": str(uuid.uuid4()),
+            "family_id": family_id,
+            "event_id": request_data.event_id,
+            "requested_by_email": current_user.email,
+            "status": "pending",
+            "requestedDate": requested_date,
+            "reason": request_data.reason,
+            "created_at": now,
+            "updated_at": now
+        }
+
+        db.change_requests.insert_one(request_doc)
+        record_calendar_change(family_id, CHANGE_REQUEST, request_doc["id"])
+        activity_log.record_activity(
+            family_id, activity_log.CHANGE_REQUEST, f"change_request:{request_doc['id']}", current_user.email,
+            eventTitle=event.get("title") or "Custody day", reason=request_data.reason
+        )
+        return format_change_request(request_doc).model_copy(update={"conflicts": conflicts})
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Create change request: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/api/v1/calendar/change-requests/{request_id}", response_model=ChangeRequest)
 async def update_change_request(
     request_id: str,
-    update_data: ChangeRequestUpdate
-    # TODO: Re-enable authentication: current_user: User = Depends(get_current_user)
+    update_data: ChangeRequestUpdate,
+    current_user: User = Depends(get_current_user)
 ):
     """Approve or reject a change request."""
-    # In a real implementation, we would:
-    # 1. Verify the change request exists
-    # 2. Verify the user has permission to approve/reject (is the other parent)
-    # 3. If approved and requestedDate is set, update the event's date
-    
-    # Check if change request exists
-    if request_id not in fake_change_requests_db:
-        raise HTTPException(status_code=404, detail="Change request not found")
-    
-    change_request = fake_change_requests_db[request_id]
-    
-    # Validate status
-    if update_data.status not in ["approved", "rejected"]:
-        raise HTTPException(status_code=400, detail="Status must be 'approved' or 'rejected'")
-    
-    # Update the status
-    change_request.status = update_data.status
-    
-    # If approved and there's a requested date, update the event
-    if update_data.status == "approved" and change_request.requestedDate:
-        event_id = change_request.event_id
-        if event_id in fake_events_db:
-            fake_events_db[event_id].date = change_request.requestedDate
-    
-    fake_change_requests_db[request_id] = change_request
-    return change_request
+    try:
+        # Validate status
+        if update_data.status not in ["approved", "rejected"]:
+            raise HTTPException(status_code=400, detail="Status must be 'approved' or 'rejected'")
+
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        family_id = str(family["_id"])
+
+        change_request = db.change_requests.find_one({"family_id": family_id, "id": request_id})
+        if not change_request:
+            raise HTTPException(status_code=404, detail="Change request not found")
+
+        if change_request.get("status") != "pending":
+            raise HTTPException(status_code=400, detail="Change request has already been reviewed")
+
+        # Only the other parent can review a request
+        if change_request["requested_by_email"] == current_user.email:
+            raise HTTPException(status_code=403, detail="You cannot review your own change request")
+
+        # Re-check at approval time: the calendar may have changed since the request was made
+        if update_data.status == "approved" and change_request.get("requestedDate") and not update_data.force:
+            event = resolve_event(family_id, change_request["event_id"])
+            if not event:
+                raise HTTPException(status_code=409, detail={"message": "The event no longer exists", "conflicts": []})
+            conflicts = find_conflicts(family_id, event, change_request["requestedDate"], exclude_request_id=request_id)
+            if conflicts:
+                raise HTTPException(status_code=409, detail={
+                    "message": "The change conflicts with the calendar. Approve with force to override",
+                    "conflicts": conflicts
+                })
+
+        now = datetime.utcnow()
+        db.change_requests.update_one(
+            {"id": request_id},
+            {"$set": {"status": update_data.status, "reviewed_by_email": current_user.email, "updated_at": now}}
+        )
+        record_calendar_change(family_id, CHANGE_REQUEST, request_id)
+        reviewed_event = resolve_event(family_id, change_request["event_id"])
+        activity_log.record_activity(
+            family_id, activity_log.CHANGE_REQUEST_REVIEWED, f"change_request:{request_id}", current_user.email,
+            eventTitle=(reviewed_event or {}).get("title") or "Custody day", status=update_data.status
+        )
+
+        # Recurring custody days are never rewritten: the approval becomes exceptions
+        if update_data.status == "approved" and parse_custody_event_id(change_request["event_id"]):
+            for exception in apply_custody_swap(family_id, change_request, current_user.email):
+                refresh_day(family_id, exception["date"])
+                record_calendar_change(family_id, SCHEDULE, exception["id"])
+        # If approved and there's a requested date, move the event
+        elif update_data.status == "approved" and change_request.get("requestedDate"):
+            event = db.events.find_one({"family_id": family_id, "id": change_request["event_id"]})
+            if event:
+                db.events.update_one(
+                    {"family_id": family_id, "id": change_request["event_id"]},
+                    {"$set": {
+                        "date": change_request["requestedDate"],
+                        # Re-importing the calendar must match the event on its new date
+                        "natural_key": natural_key(change_request["requestedDate"], event["type"], event["title"]),
+                        "updated_at": now
+                    }}
+                )
+                record_calendar_change(family_id, EVENT, change_request["event_id"])
+            if event and event.get("type") == "custody":
+                refresh_day(family_id, event["date"])
+                refresh_day(family_id, change_request["requestedDate"])
+
+        change_request.update({"status": update_data.status, "updated_at": now})
+        return format_change_request(change_request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Update change request: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/v1/calendar/change-requests/validate")
+async def validate_change_requests(
+    validation: SwapSetValidation,
+    current_user: User = Depends(get_current_user)
+):
+    """Check a set of proposed moves against the calendar and each other without creating them."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        if any(proposal.requestedDate is None for proposal in validation.proposals):
+            raise HTTPException(status_code=400, detail="Every proposal needs a requestedDate")
+
+        proposals = [
+            {"event_id": proposal.event_id, "requestedDate": to_utc_naive(proposal.requestedDate)}
+            for proposal in validation.proposals
+        ]
+        results = validate_swap_set(str(family["_id"]), proposals)
+        return {"valid": not any(result["conflicts"] for result in results), "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Validate change requests: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/api/v1/calendar/change-requests", response_model=List[ChangeRequest])
 async def get_change_requests(
-    # TODO: Re-enable authentication: current_user: User = Depends(get_current_user)
+    status: Optional[str] = Query(None, description="Only return requests with this status"),
+    current_user: User = Depends(get_current_user)
 ):
     """Get all change requests for the user's family."""
-    # In a real implementation, we would:
-    # 1. Get the user's family_id
-    # 2. Query change requests for events belonging to that family
-    
-    # For now, return all change requests
-    return list(fake_change_requests_db.values())
\ No newline at end of file
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        query = {"family_id": str(family["_id"])}
+        if status:
+            query["status"] = status
+
+        requests = db.change_requests.find(query).sort("created_at", -1)
+        return [format_change_request(request) for request in requests]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Get change requests: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/v1/calendar/schedules", response_model=List[CustodyRule])
+async def get_custody_rules(current_user: User = Depends(get_current_user)):
+    """Get the recurring custody rules for the user's family."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        rules = db.custody_rules.find({"family_id": str(family["_id"])}).sort("startDate", 1)
+        return [CustodyRule(**rule) for rule in rules]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Get custody rules: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/v1/calendar/schedules", response_model=CustodyRule)
+async def create_custody_rule(
+    rule_data: CustodyRuleCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Add a repeating custody pattern or a yearly holiday override."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        rule = rule_data.model_dump()
+        if rule["kind"] == "base" and not rule.get("pattern"):
+            # Fall back to the pattern named in the custody agreement or arrangement
+            agreement = family.get("custodyAgreement") or {}
+            rule["pattern"] = pattern_from_text(agreement.get("custodySchedule")) or pattern_from_text(family.get("custodyArrangement"))
+            if not rule["pattern"]:
+                raise HTTPException(status_code=400, detail="No pattern given and none found in the custody agreement")
+
+        try:
+            validate_rule(rule)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        rule.update({
+            "id": str(uuid.uuid4()),
+            "family_id": str(family["_id"]),
+            "startDate": to_datetime(rule["startDate"]),
+            "untilDate": to_datetime(rule["untilDate"]) if rule.get("untilDate") else None,
+            "createdAt": datetime.utcnow()
+        })
+        db.custody_rules.insert_one(rule)
+        invalidate_custody_map(rule["family_id"])
+        record_calendar_change(rule["family_id"], SCHEDULE, rule["id"])
+        return CustodyRule(**rule)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Create custody rule: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/api/v1/calendar/schedules/{rule_id}")
+async def delete_custody_rule(rule_id: str, current_user: User = Depends(get_current_user)):
+    """Remove a custody rule. Exceptions are kept."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        result = db.custody_rules.delete_one({"family_id": str(family["_id"]), "id": rule_id})
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Custody rule not found")
+        invalidate_custody_map(str(family["_id"]))
+        record_calendar_change(str(family["_id"]), SCHEDULE, rule_id, "delete")
+
+        return {"message": "Custody rule deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Delete custody rule: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/v1/calendar/schedule-exceptions", response_model=List[ScheduleException])
+async def get_schedule_exceptions(
+    start: datetime = Query(..., description="Start of the range (inclusive)"),
+    end: datetime = Query(..., description="End of the range (exclusive)"),
+    current_user: User = Depends(get_current_user)
+):
+    """Get one-off overrides of the custody schedule in a date range."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        range_start, range_end = resolve_date_range(None, None, start, end)
+        exceptions = db.custody_exceptions.find({
+            "family_id": str(family["_id"]),
+            "date": {"$gte": range_start, "$lt": range_end}
+        }).sort("date", 1)
+        return [ScheduleException(**dict(exception, date=to_date(exception["date"]))) for exception in exceptions]
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Get schedule exceptions: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/v1/calendar/schedule-exceptions", response_model=ScheduleException)
+async def create_schedule_exception(
+    exception_data: ScheduleExceptionCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Give a single day to a parent, overriding the recurring schedule."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        parents = schedule_parents(str(family["_id"]))
+        if exception_data.parent not in parents:
+            raise HTTPException(status_code=400, detail=f"parent must be one of: {', '.join(parents)}")
+
+        exception = add_exception(
+            str(family["_id"]),
+            exception_data.date,
+            exception_data.parent,
+            exception_data.reason,
+            created_by=current_user.email
+        )
+        refresh_day(str(family["_id"]), exception["date"])
+        record_calendar_change(str(family["_id"]), SCHEDULE, exception["id"])
+        return ScheduleException(**dict(exception, date=exception_data.date))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Create schedule exception: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/v1/calendar/custody")
+async def get_custody_on(
+    day: date = Query(..., alias="date", description="Day to look up"),
+    current_user: User = Depends(get_current_user)
+):
+    """Which parent has the children on a given day."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        return {"date": day.isoformat(), "parent": parent_on(str(family["_id"]), day)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Get custody: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/v1/calendar/custody/stats")
+async def get_custody_stats(
+    start: date = Query(..., description="First day of the period"),
+    end: date = Query(..., description="Day after the last day of the period"),
+    current_user: User = Depends(get_current_user)
+):
+    """Nights per parent and percentage time-share for a period."""
+    try:
+        if end <= start:
+            raise HTTPException(status_code=400, detail="end must be after start")
+        if (end - start).days > MAX_RANGE_DAYS:
+            raise HTTPException(status_code=400, detail=f"Range cannot exceed {MAX_RANGE_DAYS} days")
+
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        return custody_stats(str(family["_id"]), start, end)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Get custody stats: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/v1/calendar/sync")
+async def sync_calendar(
+    sync_token: Optional[str] = Query(None, alias="syncToken", description="Token from the previous sync; omit for a full sync"),
+    current_user: User = Depends(get_current_user)
+):
+    """Return calendar changes since a sync token, or everything when no token is given."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        family_id = str(family["_id"])
+
+        if not sync_token:
+            latest = current_sequence(family_id)
+            return {
+                "syncToken": encode_sync_token(latest),
+                "fullSync": True,
+                "events": [format_event(event) for event in db.events.find({"family_id": family_id}).sort("date", 1)],
+                "deletedEvents": [],
+                "changeRequests": [format_change_request(request) for request in db.change_requests.find({"family_id": family_id})],
+                "scheduleChanged": True
+            }
+
+        try:
+            latest, changes = changes_since(family_id, sync_token)
+        except SyncTokenExpired as e:
+            # Like CalDAV, an unusable token means the client must start over with a full sync
+            raise HTTPException(status_code=410, detail=f"{e}. Sync again without a token")
+
+        upserted = {entity: [] for entity in (EVENT, CHANGE_REQUEST)}
+        deleted_events = []
+        for (entity, entity_id), op in changes.items():
+            if entity == EVENT and op == "delete":
+                deleted_events.append(entity_id)
+            elif entity in upserted:
+                upserted[entity].append(entity_id)
+
+        events = db.events.find({"family_id": family_id, "id": {"$in": upserted[EVENT]}}) if upserted[EVENT] else []
+        requests = db.change_requests.find({"family_id": family_id, "id": {"$in": upserted[CHANGE_REQUEST]}}) if upserted[CHANGE_REQUEST] else []
+
+        return {
+            "syncToken": encode_sync_token(latest),
+            "fullSync": False,
+            "events": [format_event(event) for event in events],
+            "deletedEvents": deleted_events,
+            "changeRequests": [format_change_request(request) for request in requests],
+            # Custody days are derived, so a rule or exception change means re-fetching the visible range
+            "scheduleChanged": any(entity == SCHEDULE for entity, _ in changes)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Sync calendar: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/v1/calendar/ics-subscription")
+async def create_ics_subscription(request: Request, current_user: User = Depends(get_current_user)):
+    """Create or rotate the user's private iCalendar subscription URL."""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+
+        # Calendar apps can't send a bearer token, so the URL itself is the secret
+        ics_token = secrets.token_urlsafe(24)
+        db.users.update_one({"email": current_user.email}, {"$set": {"ics_token": ics_token}})
+
+        path = f"/api/v1/calendar/ics/{ics_token}.ics"
+        return {"path": path, "url": str(request.base_url).rstrip("/") + path}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Create ICS subscription: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/api/v1/calendar/ics-subscription")
+async def delete_ics_subscription(current_user: User = Depends(get_current_user)):
+    """Revoke the user's iCalendar subscription URL."""
+    db.users.update_one({"email": current_user.email}, {"$set": {"ics_token": None}})
+    return {"message": "Calendar subscription revoked"}
+
+@router.get("/api/v1/calendar/ics/{ics_token}.ics")
+async def get_ics_feed(ics_token: str, request: Request):
+    """iCalendar feed for external calendar apps. Unchanged feeds are answered with 304."""
+    try:
+        user = db.users.find_one({"ics_token": ics_token}) if ics_token else None
+        if not user:
+            raise HTTPException(status_code=404, detail="Calendar not found")
+
+        family = db.families.find_one({"$or": [
+            {"parent1_email": user["email"]},
+            {"parent2_email": user["email"]}
+        ]})
+
+        if not family:
+            raise HTTPException(status_code=404, detail="Calendar not found")
+
+        family_id = str(family["_id"])
+        etag = ics_etag(family_id, user["email"])
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+
+        # Polling apps mostly hit this: no rendering and no event queries
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+
+        return StreamingResponse(
+            render_ics(family_id, f"{family.get('familyName', 'Family')} calendar"),
+            media_type="text/calendar; charset=utf-8",
+            headers=headers
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Get ICS feed: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+ensure_calendar_indexes()
\ No newline at end of file
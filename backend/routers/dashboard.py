@@ -0,0 +1,109 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Optional
+from datetime import datetime
+import asyncio
+
+from models import Child, Family, User
+from routers.auth import get_current_user
+from routers.activity import activity_cache_vary, build_activity_feed
+from routers.documents import build_folder_list
+from routers.expenses import build_expense_summary
+from routers.messaging import build_conversation_list
+from database import db
+from services.response_cache import CachedEndpoint
+
+router = APIRouter(prefix="/api/v1/dashboard", tags=["dashboard"])
+
+DASHBOARD_SECTIONS = ["user", "family", "children", "activity", "expenseSummary", "conversations", "folders"]
+
+def parse_fields(fields: Optional[str]) -> list:
+    if not fields:
+        return DASHBOARD_SECTIONS
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown dashboard field(s): {', '.join(unknown)}. Choose from: {', '.join(DASHBOARD_SECTIONS)}"
+        )
+    # Keep a stable order so equivalent requests share a cache entry
+    return [section for section in DASHBOARD_SECTIONS if section in requested]
+
+@router.get("", response_model=dict)
+async def get_dashboard(
+    request: Request,
+    fields: Optional[str] = Query(None, description=f"Comma-separated sections to include: {', '.join(DASHBOARD_SECTIONS)}. Omit for all"),
+    current_user: User = Depends(get_current_user)
+):
+    """Everything the home screen needs in one request"""
+    try:
+        sections = parse_fields(fields)
+        user = {
+            "firstName": current_user.firstName,
+            "lastName": current_user.lastName,
+            "email": current_user.email,
+            "role": current_user.role,
+        }
+
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+
+        if not family:
+            # Users who haven't created or joined a family yet still get their profile
+            return {"user": user, "family": None} if "user" in sections else {"family": None}
+
+        family_id = str(family["_id"])
+        now = datetime.utcnow()
+        endpoint = CachedEndpoint(
+            request, family_id, current_user.email,
+            vary=activity_cache_vary(now) if "activity" in sections else ""
+        )
+        cached = endpoint.cached()
+        if cached:
+            return cached
+
+        # The family document is already loaded; the rest are independent queries
+        builders = {
+            "activity": lambda: build_activity_feed(family, current_user.email, now=now),
+            "expenseSummary": lambda: build_expense_summary(family, current_user.email),
+            "conversations": lambda: build_conversation_list(family_id, current_user.email),
+            "folders": lambda: build_folder_list(family_id),
+        }
+        pending = [section for section in sections if section in builders]
+        results = await asyncio.gather(
+            *(asyncio.to_thread(builders[section]) for section in pending),
+            return_exceptions=True
+        )
+
+        payload = {}
+        errors = {}
+        if "user" in sections:
+            payload["user"] = user
+        if "family" in sections:
+            payload["family"] = Family(**family)
+        if "children" in sections:
+            payload["children"] = [Child(**child) for child in family.get("children", [])]
+        for section, result in zip(pending, results):
+            if isinstance(result, Exception):
+                # One failing section shouldn't blank the whole screen
+                print(f"[ERROR] Dashboard section {section}: {result}")
+                payload[section] = None
+                errors[section] = str(result)
+            else:
+                payload[section] = result
+
+        if errors:
+            payload["errors"] = errors
+            # Don't cache a partial payload
+            return payload
+        return endpoint.store(payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Get dashboard: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
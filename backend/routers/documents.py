@@ -1,19 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
 import uuid
 import base64
+import mimetypes
 import os
-from pathlib import Path
 
 from models import Document, DocumentUpload, DocumentFolder, DocumentFolderCreate, DocumentFolderUpdate, User
 from routers.auth import get_current_user
 from database import db
+from services import document_search
+from services.text_extraction import is_extractable
+from services.platform_stats import record_stats
+from services.response_cache import CachedEndpoint, bump_family_version
+from services.storage import storage, storage_file_response
+from services.zip_stream import stream_zip, unique_name
 
 router = APIRouter(prefix="/api/v1/documents", tags=["documents"])
 
+DOCUMENTS_PREFIX = "documents"
+
 # Default folders configuration
 DEFAULT_FOLDERS = [
     {
@@ -71,24 +79,24 @@ DEFAULT_FOLDERS = [
 
 def save_document_file(file_content: str, file_name: str, document_id: str) -> str:
     """Save document file and return URL/path"""
-    documents_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "documents")
-    if not os.path.exists(documents_dir):
-        os.makedirs(documents_dir)
-    
     # Get file extension
     file_extension = file_name.split('.')[-1] if '.' in file_name else 'pdf'
-    file_path = os.path.join(documents_dir, f"{document_id}.{file_extension}")
+    storage_key = f"{DOCUMENTS_PREFIX}/{document_id}.{file_extension}"
     
     try:
         decoded_content = base64.b64decode(file_content)
-        with open(file_path, 'wb') as f:
-            f.write(decoded_content)
+        storage.save(storage_key, decoded_content, content_type=mimetypes.guess_type(file_name)[0])
         # Return API endpoint path
         return f"/api/v1/documents/files/{document_id}.{file_extension}"
     except Exception as e:
         print(f"Error saving document: {e}")
         return ""
 
+def get_document_storage_key(file_url: str) -> str:
+    """Resolve a document's API file URL to its storage key"""
+    file_name = file_url.replace("/api/v1/documents/files/", "")
+    return f"{DOCUMENTS_PREFIX}/{file_name}"
+
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human-readable format"""
     if size_bytes < 1024:
@@ -114,8 +122,109 @@ def get_file_type(file_name: str) -> str:
     else:
         return 'other'
 
+def build_folder_query(family_id: str, folder_id: Optional[str]) -> dict:
+    """Build the documents query for a family, optionally scoped to a folder"""
+    query = {"family_id": family_id}
+    
+    if folder_id:
+        # Check if it's a default folder or custom folder
+        default_folder = next((f for f in DEFAULT_FOLDERS if f["id"] == folder_id), None)
+        
+        if default_folder:
+            # Filter by document types
+            query["type"] = {"$in": default_folder["document_types"]}
+        else:
+            # Custom folder - get custom category
+            custom_folder = db.document_folders.find_one({
+                "family_id": family_id,
+                "id": folder_id
+            })
+            if custom_folder:
+                query["custom_category"] = custom_folder.get("custom_category", "")
+            else:
+                raise HTTPException(status_code=404, detail="Folder not found")
+    
+    return query
+
+def format_document(doc: dict) -> dict:
+    """Format a stored document for API responses"""
+    return {
+        "id": doc.get("id") or str(doc.get("_id", "")),
+        "name": doc["name"],
+        "type": doc["type"],
+        "customCategory": doc.get("custom_category"),
+        "uploadDate": doc.get("created_at").isoformat() if doc.get("created_at") else datetime.utcnow().isoformat(),
+        "size": format_file_size(doc.get("file_size", 0)),
+        "status": doc.get("status", "processed"),
+        "tags": doc.get("tags", []),
+        "description": doc.get("description"),
+        "isProtected": doc.get("is_protected", False),
+        "protectionReason": doc.get("protection_reason"),
+        "fileType": doc.get("file_type", "other"),
+        "fileUrl": doc.get("file_url"),
+        "fileName": doc.get("file_name"),
+    }
+
+def build_folder_list(family_id: str) -> List[dict]:
+    """Default and custom folders with their document counts"""
+    # Get custom folders from database
+    custom_folders = list(db.document_folders.find({"family_id": family_id}))
+    
+    # Get document counts for each folder
+    all_documents = list(db.documents.find({"family_id": family_id}))
+    
+    # Build folder list with counts
+    folders = []
+    
+    # Add default folders
+    for default_folder in DEFAULT_FOLDERS:
+        folder_id = default_folder["id"]
+        document_types = default_folder["document_types"]
+        
+        # Count documents in this folder
+        if folder_id == "memories":
+            count = sum(1 for doc in all_documents if doc.get("type") == "memories")
+        else:
+            count = sum(1 for doc in all_documents if doc.get("type") in document_types)
+        
+        folders.append({
+            "id": folder_id,
+            "name": default_folder["name"],
+            "description": default_folder["description"],
+            "icon": default_folder["icon"],
+            "color": default_folder["color"],
+            "bgColor": default_folder["bg_color"],
+            "documentTypes": document_types,
+            "count": count,
+            "isCustom": False,
+            "isSpecial": default_folder.get("is_special", False)
+        })
+    
+    # Add custom folders
+    for custom_folder in custom_folders:
+        folder_id = custom_folder.get("id") or str(custom_folder.get("_id", ""))
+        custom_category = custom_folder.get("custom_category", "")
+        
+        # Count documents in this custom folder
+        count = sum(1 for doc in all_documents if doc.get("custom_category") == custom_category)
+        
+        folders.append({
+            "id": folder_id,
+            "name": custom_folder["name"],
+            "description": custom_folder["description"],
+            "icon": custom_folder["icon"],
+            "color": custom_folder["color"],
+            "bgColor": custom_folder["bg_color"],
+            "documentTypes": ["custom"],
+            "count": count,
+            "isCustom": True,
+            "customCategory": custom_category
+        })
+    
+    return folders
+
 @router.get("/folders", response_model=List[dict])
-async def get_folders(current_user: User = Depends(get_current_user)):
+async def get_folders(request: Request, current_user: User = Depends(get_current_user)):
     """Get all folders (default + custom) for the current user's family"""
     try:
         # Get user's family
@@ -129,61 +238,12 @@ async def get_folders(current_user: User = Depends(get_current_user)):
         
         family_id = str(family["_id"])
         
-        # Get custom folders from database
-        custom_folders = list(db.document_folders.find({"family_id": family_id}))
-        
-        # Get document counts for each folder
-        all_documents = list(db.documents.find({"family_id": family_id}))
-        
-        # Build folder list with counts
-        folders = []
-        
-        # Add default folders
-        for default_folder in DEFAULT_FOLDERS:
-            folder_id = default_folder["id"]
-            document_types = default_folder["document_types"]
-            
-            # Count documents in this folder
-            if folder_id == "memories":
-                count = sum(1 for doc in all_documents if doc.get("type") == "memories")
-            else:
-                count = sum(1 for doc in all_documents if doc.get("type") in document_types)
-            
-            folders.append({
-                "id": folder_id,
-                "name": default_folder["name"],
-                "description": default_folder["description"],
-                "icon": default_folder["icon"],
-                "color": default_folder["color"],
-                "bgColor": default_folder["bg_color"],
-                "documentTypes": document_types,
-                "count": count,
-                "isCustom": False,
-                "isSpecial": default_folder.get("is_special", False)
-            })
-        
-        # Add custom folders
-        for custom_folder in custom_folders:
-            folder_id = custom_folder.get("id") or str(custom_folder.get("_id", ""))
-            custom_category = custom_folder.get("custom_category", "")
-            
-            # Count documents in this custom folder
-            count = sum(1 for doc in all_documents if doc.get("custom_category") == custom_category)
-            
-            folders.append({
-                "id": folder_id,
-                "name": custom_folder["name"],
-                "description": custom_folder["description"],
-                "icon": custom_folder["icon"],
-                "color": custom_folder["color"],
-                "bgColor": custom_folder["bg_color"],
-                "documentTypes": ["custom"],
-                "count": count,
-                "isCustom": True,
-                "customCategory": custom_category
-            })
+        endpoint = CachedEndpoint(request, family_id, current_user.email)
+        cached = endpoint.cached()
+        if cached:
+            return cached
         
-        return folders
+        return endpoint.store(build_folder_list(family_id))
         
     except HTTPException:
         raise
@@ -239,6 +299,7 @@ async def create_folder(
         }
         
         db.document_folders.insert_one(folder_doc)
+        bump_family_version(family_id)
         
         return {
             "id": folder_id,
@@ -304,6 +365,7 @@ async def update_folder(
             {"id": folder_id, "family_id": family_id},
             {"$set": update_data}
         )
+        bump_family_version(family_id)
         
         # Get updated folder
         updated_folder = db.document_folders.find_one({
@@ -379,6 +441,7 @@ async def delete_folder(
             "id": folder_id,
             "family_id": family_id
         })
+        bump_family_version(family_id)
         
         return {"message": "Folder deleted successfully"}
         
@@ -407,47 +470,12 @@ async def get_documents(
         family_id = str(family["_id"])
         
         # Build query
-        query = {"family_id": family_id}
-        
-        if folder_id:
-            # Check if it's a default folder or custom folder
-            default_folder = next((f for f in DEFAULT_FOLDERS if f["id"] == folder_id), None)
-            
-            if default_folder:
-                # Filter by document types
-                query["type"] = {"$in": default_folder["document_types"]}
-            else:
-                # Custom folder - get custom category
-                custom_folder = db.document_folders.find_one({
-                    "family_id": family_id,
-                    "id": folder_id
-                })
-                if custom_folder:
-                    query["custom_category"] = custom_folder.get("custom_category", "")
-                else:
-                    raise HTTPException(status_code=404, detail="Folder not found")
+        query = build_folder_query(family_id, folder_id)
         
         # Get documents
         documents = list(db.documents.find(query).sort("created_at", -1))
         
-        result = []
-        for doc in documents:
-            result.append({
-                "id": doc.get("id") or str(doc.get("_id", "")),
-                "name": doc["name"],
-                "type": doc["type"],
-                "customCategory": doc.get("custom_category"),
-                "uploadDate": doc.get("created_at").isoformat() if doc.get("created_at") else datetime.utcnow().isoformat(),
-                "size": format_file_size(doc.get("file_size", 0)),
-                "status": doc.get("status", "processed"),
-                "tags": doc.get("tags", []),
-                "description": doc.get("description"),
-                "isProtected": doc.get("is_protected", False),
-                "protectionReason": doc.get("protection_reason"),
-                "fileType": doc.get("file_type", "other"),
-                "fileUrl": doc.get("file_url"),
-                "fileName": doc.get("file_name"),
-            })
+        result = [format_document(doc) for doc in documents]
         
         return result
         
@@ -459,6 +487,134 @@ async def get_documents(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/search", response_model=dict)
+async def search_documents(
+    q: str = Query(..., min_length=1, description="Search terms"),
+    folder_id: Optional[str] = Query(None),
+    document_type: Optional[str] = Query(None, alias="type"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user)
+):
+    """Full-text search inside the current user's family documents"""
+    try:
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+        
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+        
+        family_id = str(family["_id"])
+        
+        # Apply the same folder/type filters as the document list
+        query = build_folder_query(family_id, folder_id)
+        if document_type:
+            query["type"] = document_type
+        
+        total, matches = document_search.search_documents(
+            family_id,
+            q,
+            query,
+            skip=(page - 1) * page_size,
+            limit=page_size
+        )
+        
+        results = []
+        for match in matches:
+            result = format_document(match["document"])
+            result["score"] = match["score"]
+            result["matches"] = match["matches"]
+            results.append(result)
+        
+        return {
+            "query": q,
+            "total": total,
+            "page": page,
+            "pageSize": page_size,
+            "results": results
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Search documents: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/archive")
+async def download_archive(
+    folder_id: Optional[str] = Query(None),
+    tag: Optional[str] = Query(None),
+    ids: Optional[str] = Query(None, description="Comma-separated document IDs"),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream a ZIP of a folder, a tag or a selection of documents"""
+    try:
+        if not (folder_id or tag or ids):
+            raise HTTPException(status_code=400, detail="Provide a folder_id, tag or ids to download")
+        
+        # Get user's family
+        family = db.families.find_one({"$or": [
+            {"parent1_email": current_user.email},
+            {"parent2_email": current_user.email}
+        ]})
+        
+        if not family:
+            raise HTTPException(status_code=404, detail="Family not found")
+        
+        family_id = str(family["_id"])
+        
+        query = build_folder_query(family_id, folder_id)
+        if tag:
+            query["tags"] = tag
+        if ids:
+            query["id"] = {"$in": [document_id.strip() for document_id in ids.split(",") if document_id.strip()]}
+        
+        documents = list(db.documents.find(query).sort("created_at", -1))
+        
+        # Only include documents whose file is actually on disk
+        entries = []
+        used_names = set()
+        for doc in documents:
+            storage_key = get_document_storage_key(doc.get("file_url", ""))
+            if not doc.get("file_url") or not storage.exists(storage_key):
+                print(f"Warning: Skipping document {doc.get('id')} with missing file")
+                continue
+            entries.append((
+                unique_name(doc.get("file_name") or os.path.basename(storage_key), used_names),
+                doc.get("file_size", 0),
+                doc.get("created_at") or datetime.utcnow(),
+                lambda storage_key=storage_key: storage.open(storage_key)
+            ))
+        
+        if not entries:
+            raise HTTPException(status_code=404, detail="No documents found to download")
+        
+        if folder_id:
+            archive_name = folder_id
+        elif tag:
+            archive_name = tag
+        else:
+            archive_name = "documents"
+        
+        return StreamingResponse(
+            stream_zip(entries),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{archive_name}.zip"'}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Download archive: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/upload", response_model=dict)
 async def upload_document(
     document_data: DocumentUpload,
@@ -482,7 +638,8 @@ async def upload_document(
         
         # Determine file type and size
         file_type = get_file_type(document_data.file_name)
-        file_size = len(base64.b64decode(document_data.file_content))
+        decoded_content = base64.b64decode(document_data.file_content)
+        file_size = len(decoded_content)
         
         # Save file
         file_url = save_document_file(
@@ -536,7 +693,7 @@ async def upload_document(
             "file_size": file_size,
             "description": document_data.description,
             "tags": document_data.tags or [],
-            "status": "processed",
+            "status": "processing" if is_extractable(document_data.file_name) else "processed",
             "is_protected": is_protected,
             "protection_reason": protection_reason,
             "uploaded_by": current_user.email,
@@ -545,7 +702,18 @@ async def upload_document(
             "updated_at": datetime.utcnow()
         }
         
-        db.documents.insert_one(document_doc)
+        try:
+            db.documents.insert_one(document_doc)
+        except Exception:
+            # Don't leave the file behind with no record pointing at it
+            storage.delete(get_document_storage_key(file_url))
+            raise
+        bump_family_version(family_id)
+        record_stats({"storageBytes": file_size})
+        
+        # Extract text in the background so the upload returns immediately
+        if document_doc["status"] == "processing":
+            document_search.schedule_extraction(family_id, document_id, document_data.file_name, decoded_content)
         
         return {
             "id": document_id,
@@ -554,7 +722,7 @@ async def upload_document(
             "customCategory": custom_category,
             "uploadDate": document_doc["created_at"].isoformat(),
             "size": format_file_size(file_size),
-            "status": "processed",
+            "status": document_doc["status"],
             "tags": document_data.tags or [],
             "description": document_data.description,
             "isProtected": is_protected,
@@ -613,14 +781,11 @@ async def delete_document(
         # Delete file from filesystem
         file_url = document.get("file_url", "")
         if file_url and file_url.startswith("/api/v1/documents/files/"):
-            file_name = file_url.replace("/api/v1/documents/files/", "")
-            documents_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "documents")
-            file_path = os.path.join(documents_dir, file_name)
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete file {file_path}: {e}")
+            storage_key = get_document_storage_key(file_url)
+            try:
+                storage.delete(storage_key)
+            except Exception as e:
+                print(f"Warning: Could not delete file {storage_key}: {e}")
         
         # Delete document from database
         db.documents.delete_one({
@@ -629,6 +794,12 @@ async def delete_document(
                 {"_id": document.get("_id")}
             ]
         })
+        bump_family_version(family_id)
+        record_stats({"storageBytes": -document.get("file_size", 0)})
+        
+        # Remove the document from the search index
+        if document.get("id"):
+            document_search.remove_document(document["id"])
         
         return {"message": "Document deleted successfully"}
         
@@ -668,11 +839,10 @@ async def get_document_file(
         if not family or str(family["_id"]) != document["family_id"]:
             raise HTTPException(status_code=403, detail="Access denied")
         
-        # Get file path
-        documents_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "documents")
-        file_path = os.path.join(documents_dir, file_name)
+        # Get storage key
+        storage_key = f"{DOCUMENTS_PREFIX}/{file_name}"
         
-        if not os.path.exists(file_path):
+        if not storage.exists(storage_key):
             raise HTTPException(status_code=404, detail="Document file not found")
         
         # Determine media type
@@ -691,8 +861,9 @@ async def get_document_file(
         }
         media_type = media_types.get(file_extension, 'application/octet-stream')
         
-        return FileResponse(
-            file_path,
+        # Redirects to a presigned URL when the backend supports it
+        return storage_file_response(
+            storage_key,
             media_type=media_type,
             filename=document.get("file_name", file_name)
         )
@@ -1,19 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from fastapi.responses import FileResponse
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Response
+from typing import List, Tuple
 from datetime import datetime, date
 from bson import ObjectId
 import uuid
 import base64
-import os
-from pathlib import Path
+import mimetypes
 
 from models import Expense, ExpenseCreate, ExpenseUpdate, User
 from routers.auth import get_current_user
 from database import db
+from services.storage import storage, storage_file_response
+from services.custody_map import parent_on
+from services import activity_log
+from services.platform_stats import record_stats
+from services.response_cache import CachedEndpoint, bump_family_version
 
 router = APIRouter(prefix="/api/v1/expenses", tags=["expenses"])
 
+RECEIPTS_PREFIX = "receipts"
+
 def get_family_expense_split(family: dict) -> dict:
     """Get expense split ratio from family's custody agreement"""
     if family.get("custodyAgreement") and family["custodyAgreement"].get("expenseSplit"):
@@ -25,26 +30,20 @@ def get_family_expense_split(family: dict) -> dict:
     # Default to 50-50 if no agreement
     return {"parent1": 50, "parent2": 50}
 
-def save_receipt(receipt_content: str, receipt_file_name: str, expense_id: str) -> str:
-    """Save receipt file and return URL/path"""
-    # In production, this would upload to S3 or similar
-    # For now, we'll store in a receipts directory
-    receipts_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "receipts")
-    if not os.path.exists(receipts_dir):
-        os.makedirs(receipts_dir)
-    
+def save_receipt(receipt_content: str, receipt_file_name: str, expense_id: str) -> Tuple[str, int]:
+    """Save receipt file and return its URL/path and size in bytes"""
+    # Stored through the configured backend (local disk or S3-compatible)
     file_extension = receipt_file_name.split('.')[-1] if '.' in receipt_file_name else 'jpg'
-    file_path = f"{receipts_dir}/{expense_id}.{file_extension}"
+    storage_key = f"{RECEIPTS_PREFIX}/{expense_id}.{file_extension}"
     
     try:
         decoded_content = base64.b64decode(receipt_content)
-        with open(file_path, 'wb') as f:
-            f.write(decoded_content)
+        storage.save(storage_key, decoded_content, content_type=mimetypes.guess_type(receipt_file_name)[0])
         # Return API endpoint path instead of relative path
-        return f"/api/v1/expenses/receipts/{expense_id}.{file_extension}"
+        return f"/api/v1/expenses/receipts/{expense_id}.{file_extension}", len(decoded_content)
     except Exception as e:
         print(f"Error saving receipt: {e}")
-        return ""
+        return "", 0
 
 @router.get("", response_model=List[dict])
 async def get_expenses(current_user: User = Depends(get_current_user)):
@@ -88,6 +87,7 @@ async def get_expenses(current_user: User = Depends(get_current_user)):
                 "receiptUrl": receipt_url,
                 "receiptFileName": exp.get("receipt_file_name"),
                 "childrenIds": exp.get("children_ids", []),
+                "custodyParent": exp.get("custody_parent"),
                 "disputeReason": exp.get("dispute_reason"),
                 "disputeCreatedAt": exp.get("dispute_created_at").isoformat() if exp.get("dispute_created_at") else None,
                 "disputeCreatedBy": exp.get("dispute_created_by"),
@@ -127,10 +127,11 @@ async def create_expense(
         # Create expense document
         expense_id = str(uuid.uuid4())
         receipt_url = None
+        receipt_size = 0
         
         # Save receipt if provided
         if expense_data.receipt_content and expense_data.receipt_file_name:
-            receipt_url = save_receipt(
+            receipt_url, receipt_size = save_receipt(
                 expense_data.receipt_content,
                 expense_data.receipt_file_name,
                 expense_id
@@ -151,12 +152,30 @@ async def create_expense(
             "split_ratio": split_ratio,
             "receipt_url": receipt_url,
             "receipt_file_name": expense_data.receipt_file_name,
+            "receipt_size": receipt_size,
             "children_ids": expense_data.children_ids or [],
+            # Which parent had the children that day, from the custody map
+            "custody_parent": parent_on(family_id, expense_data.date),
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
         
-        db.expenses.insert_one(expense_doc)
+        try:
+            db.expenses.insert_one(expense_doc)
+        except Exception:
+            # Don't leave the receipt behind with no record pointing at it
+            if receipt_url:
+                storage.delete(receipt_url.replace("/api/v1/expenses/receipts/", f"{RECEIPTS_PREFIX}/"))
+            raise
+        bump_family_version(family_id)
+        expense_volume = {"expenseCount": 1, "expenseAmount": expense_data.amount}
+        record_stats(dict(expense_volume, storageBytes=receipt_size), expense_volume, day=expense_doc["created_at"])
+        
+        activity_log.record_activity(
+            family_id, activity_log.EXPENSE, f"expense:{expense_id}", current_user.email,
+            created_at=expense_doc["created_at"], expenseId=expense_id, description=expense_data.description,
+            amount=expense_data.amount, status="pending", paidBy=current_user.email
+        )
         
         return {
             "id": expense_id,
@@ -170,6 +189,7 @@ async def create_expense(
             "receiptUrl": receipt_url,
             "receiptFileName": expense_data.receipt_file_name,
             "childrenIds": expense_data.children_ids or [],
+            "custodyParent": expense_doc["custody_parent"],
         }
     except HTTPException:
         raise
@@ -237,6 +257,8 @@ async def update_expense(
                 {"$set": update_data}
             )
         
+        bump_family_version(expense["family_id"])
+        
         # Get updated expense using the same lookup logic
         updated_expense = db.expenses.find_one({"id": expense_id})
         if not updated_expense:
@@ -246,6 +268,15 @@ async def update_expense(
             except:
                 pass
         
+        if expense_update.status:
+            activity_log.record_activity(
+                expense["family_id"], activity_log.EXPENSE, f"expense:{expense.get('id') or str(expense.get('_id', ''))}",
+                current_user.email, created_at=update_data["updated_at"], expenseId=expense_id,
+                description=updated_expense["description"], amount=updated_expense["amount"],
+                status=updated_expense["status"], paidBy=updated_expense["paid_by_email"],
+                reason=updated_expense.get("dispute_reason")
+            )
+        
         # Normalize receipt URL to use API endpoint
         receipt_url = updated_expense.get("receipt_url")
         if receipt_url and receipt_url.startswith("/receipts/"):
@@ -308,6 +339,11 @@ async def delete_expense(
             db.expenses.delete_one({"id": expense_id})
         else:
             db.expenses.delete_one({"_id": expense.get("_id")})
+        bump_family_version(expense["family_id"])
+        # Taken back off the day it was added
+        expense_volume = {"expenseCount": -1, "expenseAmount": -expense.get("amount", 0.0)}
+        record_stats(dict(expense_volume, storageBytes=-expense.get("receipt_size", 0)), expense_volume, day=expense.get("created_at"))
+        activity_log.retire_activity(expense["family_id"], f"expense:{expense.get('id') or str(expense.get('_id', ''))}")
         
         return {"message": "Expense deleted successfully"}
     except HTTPException:
@@ -316,8 +352,54 @@ async def delete_expense(
         print(f"[ERROR] Delete expense: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def build_expense_summary(family: dict, user_email: str) -> dict:
+    """Totals, balances and counts by status for `user_email`"""
+    family_id = str(family["_id"])
+    
+    # Get all expenses
+    expenses = list(db.expenses.find({"family_id": family_id}))
+    
+    # Calculate totals
+    total_amount = sum(exp["amount"] for exp in expenses)
+    
+    # Calculate what current user owes and is owed
+    user_owes = 0
+    user_owed = 0
+    
+    user_is_parent1 = family["parent1_email"] == user_email
+    
+    for exp in expenses:
+        if exp["status"] == "approved":
+            # Use the expense's split_ratio (which is 50/50 for approved expenses)
+            expense_split = exp.get("split_ratio", {"parent1": 50, "parent2": 50})
+            user_ratio = expense_split["parent1"] if user_is_parent1 else expense_split["parent2"]
+            partner_ratio = expense_split["parent2"] if user_is_parent1 else expense_split["parent1"]
+            
+            if exp["paid_by_email"] == user_email:
+                # User paid, partner owes
+                user_owed += (exp["amount"] * partner_ratio) / 100
+            else:
+                # Partner paid, user owes
+                user_owes += (exp["amount"] * user_ratio) / 100
+    
+    # Count by status
+    pending_count = sum(1 for exp in expenses if exp["status"] == "pending")
+    disputed_count = sum(1 for exp in expenses if exp["status"] == "disputed")
+    approved_count = sum(1 for exp in expenses if exp["status"] == "approved")
+    paid_count = sum(1 for exp in expenses if exp["status"] == "paid")
+    
+    return {
+        "totalAmount": total_amount,
+        "userOwes": user_owes,
+        "userOwed": user_owed,
+        "pendingCount": pending_count,
+        "disputedCount": disputed_count,
+        "approvedCount": approved_count,
+        "paidCount": paid_count,
+    }
+
 @router.get("/summary", response_model=dict)
-async def get_expense_summary(current_user: User = Depends(get_current_user)):
+async def get_expense_summary(request: Request, current_user: User = Depends(get_current_user)):
     """Get expense summary statistics"""
     try:
         # Get user's family
@@ -331,47 +413,12 @@ async def get_expense_summary(current_user: User = Depends(get_current_user)):
         
         family_id = str(family["_id"])
         
-        # Get all expenses
-        expenses = list(db.expenses.find({"family_id": family_id}))
-        
-        # Calculate totals
-        total_amount = sum(exp["amount"] for exp in expenses)
-        
-        # Calculate what current user owes and is owed
-        user_owes = 0
-        user_owed = 0
+        endpoint = CachedEndpoint(request, family_id, current_user.email)
+        cached = endpoint.cached()
+        if cached:
+            return cached
         
-        user_is_parent1 = family["parent1_email"] == current_user.email
-        
-        for exp in expenses:
-            if exp["status"] == "approved":
-                # Use the expense's split_ratio (which is 50/50 for approved expenses)
-                expense_split = exp.get("split_ratio", {"parent1": 50, "parent2": 50})
-                user_ratio = expense_split["parent1"] if user_is_parent1 else expense_split["parent2"]
-                partner_ratio = expense_split["parent2"] if user_is_parent1 else expense_split["parent1"]
-                
-                if exp["paid_by_email"] == current_user.email:
-                    # User paid, partner owes
-                    user_owed += (exp["amount"] * partner_ratio) / 100
-                else:
-                    # Partner paid, user owes
-                    user_owes += (exp["amount"] * user_ratio) / 100
-        
-        # Count by status
-        pending_count = sum(1 for exp in expenses if exp["status"] == "pending")
-        disputed_count = sum(1 for exp in expenses if exp["status"] == "disputed")
-        approved_count = sum(1 for exp in expenses if exp["status"] == "approved")
-        paid_count = sum(1 for exp in expenses if exp["status"] == "paid")
-        
-        return {
-            "totalAmount": total_amount,
-            "userOwes": user_owes,
-            "userOwed": user_owed,
-            "pendingCount": pending_count,
-            "disputedCount": disputed_count,
-            "approvedCount": approved_count,
-            "paidCount": paid_count,
-        }
+        return endpoint.store(build_expense_summary(family, current_user.email))
     except HTTPException:
         raise
     except Exception as e:
@@ -411,10 +458,9 @@ async def get_receipt(
             raise HTTPException(status_code=403, detail="Access denied")
         
         # Get file path
-        receipts_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "receipts")
-        file_path = os.path.join(receipts_dir, receipt_filename)
+        storage_key = f"{RECEIPTS_PREFIX}/{receipt_filename}"
         
-        if not os.path.exists(file_path):
+        if not storage.exists(storage_key):
             raise HTTPException(status_code=404, detail="Receipt file not found")
         
         # Determine media type
@@ -428,8 +474,9 @@ async def get_receipt(
         }
         media_type = media_types.get(file_extension, 'application/octet-stream')
         
-        return FileResponse(
-            file_path,
+        # Redirects to a presigned URL when the backend supports it
+        return storage_file_response(
+            storage_key,
             media_type=media_type,
             filename=expense.get("receipt_file_name", receipt_filename)
         )
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from typing import List
 import uuid
 import random
@@ -7,9 +7,13 @@ from datetime import datetime, date
 import base64
 import re
 
-from models import Family, FamilyCreate, FamilyLink, ContractUpload, CustodyAgreement, Child, ChildCreate, ChildUpdate, User
+from models import Family, FamilyCreate, FamilyLink, ContractUpload, Child, ChildCreate, ChildUpdate, User
 from routers.auth import get_current_user
 from database import db
+from services.contract_jobs import create_contract_job, get_contract_job
+from services.admin_search import search_fields
+from services.platform_stats import record_stats
+from services.response_cache import CachedEndpoint, bump_family_version
 
 router = APIRouter()
 
@@ -45,7 +49,9 @@ async def create_family(family_data: FamilyCreate, current_user: User = Depends(
         custodyArrangement=family_data.custodyArrangement,
         createdAt=datetime.utcnow()
     )
-    db.families.insert_one(family.model_dump())
+    family_doc = family.model_dump()
+    db.families.insert_one({**family_doc, **search_fields("family", family_doc)})
+    record_stats({"families": 1, "linkedFamilies": 1 if family.parent2_email else 0}, {"newFamilies": 1})
     return family
 
 @router.post("/api/v1/family/link", response_model=Family)
@@ -66,16 +72,20 @@ async def link_to_family(link_data: FamilyLink, current_user: User = Depends(get
         raise HTTPException(status_code=400, detail="This family already has two parents linked")
     
     # Link the current user as parent2
-    db.families.update_one(
+    result = db.families.update_one(
         {"familyCode": link_data.familyCode},
         {
             "$set": {
                 "parent2_email": current_user.email,
                 "parent2_name": link_data.parent2_name,
-                "linkedAt": datetime.utcnow()
+                "linkedAt": datetime.utcnow(),
+                **search_fields("family", {**family, "parent2_email": current_user.email})
             }
         }
     )
+    bump_family_version(str(family["_id"]))
+    if result.modified_count:
+        record_stats({"linkedFamilies": 1})
     
     updated_family = db.families.find_one({"familyCode": link_data.familyCode})
     return Family(**updated_family)
@@ -90,18 +100,20 @@ async def get_family(current_user: User = Depends(get_current_user)):
     raise HTTPException(status_code=404, detail="Family profile not found")
 
 @router.get("/api/v1/children", response_model=List[Child])
-async def get_children(current_user: User = Depends(get_current_user)):
+async def get_children(request: Request, current_user: User = Depends(get_current_user)):
     """Get all children for the current user's family."""
     user_family = db.families.find_one({"$or": [{"parent1_email": current_user.email}, {"parent2_email": current_user.email}]})
     
     if not user_family:
         raise HTTPException(status_code=404, detail="Family profile not found")
     
+    endpoint = CachedEndpoint(request, str(user_family["_id"]), current_user.email)
+    cached = endpoint.cached()
+    if cached:
+        return cached
+    
     children = user_family.get("children", [])
-    print(f"DEBUG: Found family for {current_user.email}")
-    print(f"DEBUG: Family has {len(children)} children")
-    print(f"DEBUG: Children data: {children}")
-    return children
+    return endpoint.store([Child(**child) for child in children])
 
 @router.post("/api/v1/children", response_model=Child)
 async def add_child(child_data: ChildCreate, current_user: User = Depends(get_current_user)):
@@ -135,6 +147,8 @@ async def add_child(child_data: ChildCreate, current_user: User = Depends(get_cu
             {"_id": user_family["_id"]},
             {"$push": {"children": child_doc}}
         )
+        bump_family_version(str(user_family["_id"]))
+        record_stats({"children": 1})
         
         # Return Child model for response
         child = Child(
@@ -174,6 +188,7 @@ async def update_child(child_id: str, child_data: ChildUpdate, current_user: Use
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Child not found")
+    bump_family_version(str(user_family["_id"]))
 
     # Retrieve the updated child
     updated_family = db.families.find_one({"_id": user_family["_id"]})
@@ -200,71 +215,14 @@ async def delete_child(child_id: str, current_user: User = Depends(get_current_u
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Child not found")
+    bump_family_version(str(user_family["_id"]))
+    record_stats({"children": -1})
         
     return {"message": "Child removed successfully"}
 
-def parse_contract_with_ai(file_content: str, file_type: str):
-    """
-    Simulate AI parsing of custody agreement.
-    In production, this would use GPT-4, Claude, or a specialized legal AI.
-    """
-    # This is a simulation - in production, you'd send to an AI API
-    # For now, we'll extract some common patterns
-    
-    parsed_data = {
-        "parsed": True,
-        "confidence": 0.85,
-        "extractedTerms": []
-    }
-    
-    # Simulate extracting key information
-    content_lower = file_content.lower()
-    
-    # Check for custody split patterns
-    if "50/50" in content_lower or "50-50" in content_lower or "equal time" in content_lower:
-        parsed_data["extractedTerms"].append({
-            "term": "Custody Split",
-            "value": "50/50 Equal Time",
-            "confidence": 0.9
-        })
-        expense_split = {"ratio": "50-50", "parent1": 50, "parent2": 50}
-    elif "primary" in content_lower and "secondary" in content_lower:
-        parsed_data["extractedTerms"].append({
-            "term": "Custody Split",
-            "value": "Primary/Secondary",
-            "confidence": 0.8
-        })
-        expense_split = {"ratio": "60-40", "parent1": 60, "parent2": 40}
-    else:
-        expense_split = {"ratio": "custom", "parent1": 50, "parent2": 50}
-    
-    # Check for decision-making terms
-    if "joint legal custody" in content_lower:
-        parsed_data["extractedTerms"].append({
-            "term": "Legal Custody",
-            "value": "Joint Legal Custody",
-            "confidence": 0.95
-        })
-    
-    # Check for holiday scheduling
-    if "alternate" in content_lower and "holiday" in content_lower:
-        parsed_data["extractedTerms"].append({
-            "term": "Holiday Schedule",
-            "value": "Alternating Holidays",
-            "confidence": 0.85
-        })
-    
-    return {
-        "custodySchedule": "Extracted from agreement",
-        "holidaySchedule": "Alternating holidays as specified",
-        "decisionMaking": "Joint legal custody",
-        "expenseSplit": expense_split,
-        "parsedData": parsed_data
-    }
-
 @router.post("/api/v1/family/contract")
 async def upload_contract(contract: ContractUpload, current_user: User = Depends(get_current_user)):
-    """Upload and parse custody agreement document."""
+    """Upload a custody agreement and queue it for parsing."""
     # Find the user's family
     user_family = db.families.find_one({"$or": [{"parent1_email": current_user.email}, {"parent2_email": current_user.email}]})
     
@@ -273,36 +231,60 @@ async def upload_contract(contract: ContractUpload, current_user: User = Depends
     
     # Decode base64 content
     try:
-        file_content = base64.b64decode(contract.fileContent).decode('utf-8', errors='ignore')
+        file_bytes = base64.b64decode(contract.fileContent)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid file content: {str(e)}")
     
-    # Parse the contract with AI
-    parsed_info = parse_contract_with_ai(file_content, contract.fileType)
-    
-    # Create custody agreement object
-    custody_agreement = CustodyAgreement(
-        uploadDate=datetime.utcnow(),
-        fileName=contract.fileName,
-        custodySchedule=parsed_info["custodySchedule"],
-        holidaySchedule=parsed_info["holidaySchedule"],
-        decisionMaking=parsed_info["decisionMaking"],
-        expenseSplit=parsed_info["expenseSplit"],
-        parsedData=parsed_info["parsedData"]
-    )
+    # Parsing runs in the background; identical re-uploads complete from the cache
+    job = create_contract_job(user_family["_id"], contract.fileName, contract.fileType, file_bytes)
+    bump_family_version(str(user_family["_id"]))
     
-    # Update family with custody agreement
-    db.families.update_one(
-        {"_id": user_family["_id"]},
-        {"$set": {"custodyAgreement": custody_agreement.model_dump()}}
-    )
+    updated_family = db.families.find_one({"_id": user_family["_id"]})
+    custody_agreement = updated_family.get("custodyAgreement")
     
     return {
-        "message": "Contract uploaded and parsed successfully",
+        "message": "Contract uploaded and parsed successfully" if job["status"] == "completed" else "Contract uploaded - parsing in progress",
+        "jobId": job["id"],
+        "status": job["status"],
         "custodyAgreement": custody_agreement,
-        "aiAnalysis": parsed_info["parsedData"]
+        "aiAnalysis": custody_agreement.get("parsedData") if custody_agreement else None
     }
 
+@router.get("/api/v1/family/contract/jobs/{job_id}")
+async def get_contract_job_status(job_id: str, current_user: User = Depends(get_current_user)):
+    """Get the progress of a contract-parsing job."""
+    user_family = db.families.find_one({"$or": [{"parent1_email": current_user.email}, {"parent2_email": current_user.email}]})
+    
+    if not user_family:
+        raise HTTPException(status_code=404, detail="Family profile not found")
+    
+    job = get_contract_job(job_id, str(user_family["_id"]))
+    if not job:
+        raise HTTPException(status_code=404, detail="Contract job not found")
+    
+    response = {
+        "jobId": job["id"],
+        "status": job["status"],
+        "progress": job.get("progress", 0),
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "cached": job.get("cached", False),
+        "createdAt": job["created_at"].isoformat() if job.get("created_at") else None,
+        "completedAt": job["completed_at"].isoformat() if job.get("completed_at") else None,
+    }
+    
+    # Include the parsed agreement once it is ready, in the shape the upload used to return.
+    # The family read above can predate the job finishing, so the agreement is read again:
+    # a job is only marked completed after its result is written to the family.
+    if job["status"] == "completed":
+        family = db.families.find_one({"_id": user_family["_id"]}) or {}
+        custody_agreement = family.get("custodyAgreement") or {}
+        if (custody_agreement.get("parsedData") or {}).get("jobId") == job_id:
+            response["custodyAgreement"] = custody_agreement
+            response["aiAnalysis"] = custody_agreement.get("parsedData")
+    
+    return response
+
 @router.get("/api/v1/family/contract")
 async def get_contract(current_user: User = Depends(get_current_user)):
     """Get the parsed custody agreement for the current family."""
@@ -325,6 +307,13 @@ async def delete_family(current_user: User = Depends(get_current_user)):
     if not user_family:
         raise HTTPException(status_code=404, detail="Family profile not found")
     
-    db.families.delete_one({"_id": user_family["_id"]})
+    result = db.families.delete_one({"_id": user_family["_id"]})
+    bump_family_version(str(user_family["_id"]))
+    if result.deleted_count:
+        record_stats({
+            "families": -1,
+            "linkedFamilies": -1 if user_family.get("parent2_email") else 0,
+            "children": -len(user_family.get("children", []))
+        })
     
     return {"message": "Family profile deleted successfully"}
\ No newline at end of file
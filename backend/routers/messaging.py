@@ -1,16 +1,57 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from typing import List
 from datetime import datetime
 from bson import ObjectId
 from models import MessageCreate, ConversationCreate, Message, Conversation, User
 from routers.auth import get_current_user
 from database import db
+from services import activity_log
+from services.platform_stats import record_stats
+from services.response_cache import CachedEndpoint, bump_family_version
 
 router = APIRouter(prefix="/api/v1/messaging", tags=["messaging"])
 
+def build_conversation_list(family_id: str, user_email: str) -> List[dict]:
+    """The family's open conversations with counts for `user_email`, most recent first"""
+    # Get all conversations for this family
+    conversations = list(db.conversations.find({"family_id": family_id, "is_archived": False}))
+    
+    # For each conversation, get message count and unread count
+    result = []
+    for conv in conversations:
+        conv_id = str(conv["_id"])
+        
+        # Get all messages for this conversation
+        messages = list(db.messages.find({"conversation_id": conv_id}).sort("timestamp", 1))
+        
+        # Count unread messages for current user
+        unread_count = sum(1 for msg in messages 
+                         if msg.get("sender_email") != user_email 
+                         and msg.get("status") != "read")
+        
+        # Get last message timestamp
+        last_message_at = messages[-1]["timestamp"] if messages else conv.get("created_at")
+        
+        result.append({
+            "id": conv_id,
+            "subject": conv["subject"],
+            "category": conv["category"],
+            "participants": conv["participants"],
+            "messageCount": len(messages),
+            "unreadCount": unread_count,
+            "lastMessageAt": last_message_at.isoformat() if last_message_at else None,
+            "isStarred": conv.get("is_starred", False),
+            "isArchived": conv.get("is_archived", False),
+            "createdAt": conv.get("created_at").isoformat() if conv.get("created_at") else None
+        })
+    
+    # Sort by last message time (most recent first)
+    result.sort(key=lambda x: x["lastMessageAt"] or x["createdAt"], reverse=True)
+    return result
+
 # Get all conversations for the current user's family
 @router.get("/conversations", response_model=List[dict])
-async def get_conversations(current_user: User = Depends(get_current_user)):
+async def get_conversations(request: Request, current_user: User = Depends(get_current_user)):
     """
     Get all conversations for the current user's family
     """
@@ -30,44 +71,15 @@ async def get_conversations(current_user: User = Depends(get_current_user)):
         family_id = str(family["_id"])
         print(f"[GET /conversations] Family ID: {family_id}")
         
-        # Get all conversations for this family
-        conversations = list(db.conversations.find({"family_id": family_id, "is_archived": False}))
+        endpoint = CachedEndpoint(request, family_id, current_user.email)
+        cached = endpoint.cached()
+        if cached:
+            return cached
         
-        print(f"[GET /conversations] Found {len(conversations)} conversations")
+        result = build_conversation_list(family_id, current_user.email)
+        print(f"[GET /conversations] Found {len(result)} conversations")
         
-        # For each conversation, get message count and unread count
-        result = []
-        for conv in conversations:
-            conv_id = str(conv["_id"])
-            
-            # Get all messages for this conversation
-            messages = list(db.messages.find({"conversation_id": conv_id}).sort("timestamp", 1))
-            
-            # Count unread messages for current user
-            unread_count = sum(1 for msg in messages 
-                             if msg.get("sender_email") != current_user.email 
-                             and msg.get("status") != "read")
-            
-            # Get last message timestamp
-            last_message_at = messages[-1]["timestamp"] if messages else conv.get("created_at")
-            
-            result.append({
-                "id": conv_id,
-                "subject": conv["subject"],
-                "category": conv["category"],
-                "participants": conv["participants"],
-                "messageCount": len(messages),
-                "unreadCount": unread_count,
-                "lastMessageAt": last_message_at.isoformat() if last_message_at else None,
-                "isStarred": conv.get("is_starred", False),
-                "isArchived": conv.get("is_archived", False),
-                "createdAt": conv.get("created_at").isoformat() if conv.get("created_at") else None
-            })
-        
-        # Sort by last message time (most recent first)
-        result.sort(key=lambda x: x["lastMessageAt"] or x["createdAt"], reverse=True)
-        
-        return result
+        return endpoint.store(result)
     except Exception as e:
         print(f"[ERROR] Get conversations: {e}")
         import traceback
@@ -119,6 +131,7 @@ async def create_conversation(
         
         result = db.conversations.insert_one(conv_doc)
         conv_id = str(result.inserted_id)
+        bump_family_version(family_id)
         
         print(f"[POST /conversations] Created conversation: {conv_id}")
         
@@ -169,7 +182,7 @@ async def get_messages(
         print(f"[GET /messages] Found {len(messages)} messages")
         
         # Mark messages as read for current user
-        db.messages.update_many(
+        marked = db.messages.update_many(
             {
                 "conversation_id": conversation_id,
                 "sender_email": {"$ne": current_user.email},
@@ -177,6 +190,9 @@ async def get_messages(
             },
             {"$set": {"status": "read"}}
         )
+        # Unread counts in the conversation list changed
+        if marked.modified_count:
+            bump_family_version(conversation["family_id"])
         
         # Format messages for response (reflect read status without re-query)
         result = []
@@ -243,6 +259,14 @@ async def send_message(
             {"_id": ObjectId(message.conversation_id)},
             {"$set": {"last_message_at": timestamp}}
         )
+        bump_family_version(conversation["family_id"])
+        record_stats({"messages": 1}, {"messages": 1}, day=timestamp)
+        # One feed entry per conversation, replaced by each new message
+        activity_log.record_activity(
+            conversation["family_id"], activity_log.MESSAGE, f"conversation:{message.conversation_id}", current_user.email,
+            created_at=timestamp, subject=conversation.get("subject", "conversation"),
+            content=activity_log.preview(message.content), conversationId=message.conversation_id
+        )
         
         print(f"[POST /message] Sent message: {msg_id}")
         
@@ -288,6 +312,7 @@ async def toggle_star(
             {"_id": ObjectId(conversation_id)},
             {"$set": {"is_starred": new_star_status}}
         )
+        bump_family_version(conversation["family_id"])
         
         return {"isStarred": new_star_status}
     except HTTPException:
@@ -320,6 +345,7 @@ async def archive_conversation(
             {"_id": ObjectId(conversation_id)},
             {"$set": {"is_archived": True}}
         )
+        bump_family_version(conversation["family_id"])
         
         return {"message": "Conversation archived"}
     except HTTPException:
@@ -1,4 +1,5 @@
 from database import db
+from services.admin_search import search_fields
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -11,13 +12,14 @@ def seed_database():
 
     # Create admin user
     hashed_password = pwd_context.hash("adminpassword")
-    db.users.insert_one({
+    admin_user = {
         "firstName": "Admin",
         "lastName": "User",
         "email": "admin@bridge.com",
         "password": hashed_password,
         "role": "admin"
-    })
+    }
+    db.users.insert_one({**admin_user, **search_fields("user", admin_user)})
     print("Admin user created successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,260 @@
+"""
+Per-family activity feed.
+
+Entries are appended where things happen (a message is sent, an expense is
+created or reviewed, the calendar changes) and carry everything needed to
+render them, so the feed is a single indexed read by (family_id, created_at)
+with no lookups into the source collections.
+
+An entry describes the latest state of one entity (an expense, a change
+request, a conversation...). Appending a new entry for the same entity marks
+the previous one as no longer current, so the feed never shows an expense as
+pending after it was approved while the full history stays available.
+"""
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from database import db
+
+FEED_LIMIT = 6
+MAX_PAGE_SIZE = 100
+PREVIEW_LENGTH = 50
+
+# Entry kinds
+CALENDAR_UPDATE = "calendar_update"
+CALENDAR_IMPORT = "calendar_import"
+CHANGE_REQUEST = "change_request"
+CHANGE_REQUEST_REVIEWED = "change_request_reviewed"
+MESSAGE = "message"
+EXPENSE = "expense"
+
+
+def ensure_activity_indexes():
+    try:
+        db.activity.create_index([("family_id", 1), ("current", 1), ("created_at", -1)])
+        db.activity.create_index([("family_id", 1), ("created_at", -1)])
+        db.activity.create_index([("family_id", 1), ("entity", 1), ("current", 1)])
+    except Exception as e:
+        print(f"⚠️  Could not create activity indexes: {e}")
+
+
+def record_activity(family_id: str, kind: str, entity: str, actor_email: str,
+                    created_at: Optional[datetime] = None, **data) -> Optional[Dict[str, Any]]:
+    """
+    Append an entry for `entity` (e.g. "expense:<id>"). The feed is secondary
+    to the write that triggered it, so failures are logged rather than raised.
+    """
+    try:
+        db.activity.update_many(
+            {"family_id": family_id, "entity": entity, "current": True},
+            {"$set": {"current": False}}
+        )
+        entry = {
+            "id": str(uuid.uuid4()),
+            "family_id": family_id,
+            "kind": kind,
+            "entity": entity,
+            "actor_email": actor_email,
+            "data": data,
+            "current": True,
+            "created_at": created_at or datetime.utcnow()
+        }
+        db.activity.insert_one(entry)
+        return entry
+    except Exception as e:
+        print(f"⚠️  Could not record activity for {entity}: {e}")
+        return None
+
+
+def retire_activity(family_id: str, entity: str):
+    """Drop a deleted entity from the feed; its history is kept"""
+    retire_activities(family_id, [entity])
+
+
+def retire_activities(family_id: str, entities: List[str]):
+    """retire_activity for many entities with one update"""
+    try:
+        db.activity.update_many(
+            {"family_id": family_id, "entity": {"$in": entities}, "current": True},
+            {"$set": {"current": False}}
+        )
+    except Exception as e:
+        print(f"⚠️  Could not retire activity for {len(entities)} entities: {e}")
+
+
+def get_activity_page(family_id: str, limit: int = FEED_LIMIT, before: Optional[datetime] = None,
+                      history: bool = False) -> List[Dict[str, Any]]:
+    """Newest first. Page with the createdAt of the last entry as `before`."""
+    query: Dict[str, Any] = {"family_id": family_id}
+    if not history:
+        query["current"] = True
+    if before:
+        query["created_at"] = {"$lt": before}
+    return list(db.activity.find(query).sort("created_at", -1).limit(min(limit, MAX_PAGE_SIZE)))
+
+
+# Rendering
+
+def preview(text: str) -> str:
+    text = text or ""
+    return text[:PREVIEW_LENGTH] + "..." if len(text) > PREVIEW_LENGTH else text
+
+
+def relative_time(delta: timedelta) -> str:
+    if delta.days > 0:
+        if delta.days == 1:
+            return "Yesterday"
+        if delta.days < 7:
+            return f"{delta.days} days ago"
+        return f"{delta.days // 7} weeks ago"
+    if delta.seconds < 3600:
+        minutes = delta.seconds // 60
+        if minutes < 1:
+            return "Just now"
+        return f"{minutes} minute{'s' if minutes > 1 else ''} ago"
+    hours = delta.seconds // 3600
+    return f"{hours} hour{'s' if hours > 1 else ''} ago"
+
+
+def family_names(family: Dict[str, Any]) -> Dict[str, str]:
+    """Email -> display name for both parents"""
+    names = {}
+    if family.get("parent1_email"):
+        names[family["parent1_email"]] = family.get("parent1_name") or family.get("parent1", {}).get("firstName") or "Parent 1"
+    if family.get("parent2_email"):
+        names[family["parent2_email"]] = family.get("parent2_name") or (family.get("parent2") or {}).get("firstName") or "Parent 2"
+    return names
+
+
+def custody_parent_name(family: Dict[str, Any], parent: Optional[str]) -> Optional[str]:
+    if parent == "mom":
+        return family.get("parent1_name") or "Parent 1"
+    if parent == "dad":
+        return family.get("parent2_name") or "Parent 2"
+    return parent
+
+
+def _money(amount: float) -> str:
+    return f"${amount:.2f}"
+
+
+def render_activity(entry: Dict[str, Any], viewer_email: str, names: Dict[str, str],
+                    now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Turn an entry into a feed item as seen by `viewer_email`"""
+    data = entry.get("data", {})
+    kind = entry["kind"]
+    actor = entry.get("actor_email")
+    by_viewer = actor == viewer_email
+    actor_name = "You" if by_viewer else names.get(actor, "Your co-parent")
+    item: Dict[str, Any] = {"id": entry["id"], "type": kind, "color": "blue", "actionRequired": False}
+
+    if kind == CALENDAR_UPDATE:
+        item["title"] = f"Calendar updated: {data.get('title', 'Calendar event')}"
+        parent = data.get("parent")
+        if parent and parent != "both":
+            item["description"] = f"{data.get('parentName') or parent}'s custody day"
+        else:
+            item["description"] = f"{actor_name} {data.get('action', 'added')} {data.get('eventType', 'an event')}"
+    elif kind == CALENDAR_IMPORT:
+        count = data.get("count", 0)
+        item["title"] = f"{actor_name} added {count} event{'s' if count != 1 else ''} to the calendar"
+        item["description"] = data.get("source") or "Calendar import"
+    elif kind == CHANGE_REQUEST:
+        event_title = data.get("eventTitle") or "calendar event"
+        if by_viewer:
+            item["title"] = f"You requested a change to {event_title}"
+            item["description"] = "Waiting for review"
+        else:
+            item["title"] = f"PENDING: {actor_name} requested change to {event_title}"
+            item["description"] = data.get("reason") or "Change request"
+            item.update({"color": "red", "actionRequired": True})
+    elif kind == CHANGE_REQUEST_REVIEWED:
+        event_title = data.get("eventTitle") or "calendar event"
+        approved = data.get("status") == "approved"
+        item["type"] = "calendar_confirmed" if approved else "change_request_declined"
+        item["title"] = f"{actor_name} {'approved' if approved else 'declined'} the change to {event_title}"
+        item["description"] = event_title
+        item["color"] = "green" if approved else "gray"
+    elif kind == MESSAGE:
+        item["title"] = f"New message in {data.get('subject', 'conversation')}"
+        item["description"] = preview(data.get("content", ""))
+        item["conversationId"] = data.get("conversationId")
+    elif kind == EXPENSE:
+        description = data.get("description", "Expense")
+        amount = data.get("amount", 0.0)
+        status = data.get("status", "pending")
+        item.update({"type": f"expense_{status}", "amount": amount, "expenseId": data.get("expenseId")})
+        if status == "pending" and not by_viewer:
+            item["title"] = f"PENDING: {description} expense needs approval ({_money(amount)})"
+            item["description"] = f"{description} - {_money(amount)}"
+            item.update({"color": "red", "actionRequired": True})
+        elif status == "pending":
+            item["title"] = f"You added {description} ({_money(amount)})"
+            item["description"] = "Waiting for approval"
+        elif status == "disputed":
+            item["title"] = f"{actor_name} disputed {description} ({_money(amount)})"
+            item["description"] = data.get("reason") or "Expense disputed"
+            item.update({"color": "red", "actionRequired": not by_viewer})
+        else:
+            paid_by = data.get("paidBy")
+            paid_by_name = "You" if paid_by == viewer_email else names.get(paid_by, "Your co-parent")
+            item["title"] = f"Expense {status}: {description} ({_money(amount)})"
+            item["description"] = f"Paid by {paid_by_name}"
+            item["color"] = "green"
+    else:
+        item["title"] = data.get("title", "Activity")
+        item["description"] = data.get("description", "")
+
+    created_at = entry["created_at"]
+    item["createdAt"] = created_at.isoformat()
+    item["relativeTime"] = relative_time((now or datetime.utcnow()) - created_at)
+    return item
+
+
+# Seeding for families whose history predates the log
+
+def backfill_family_activity(family_id: str) -> int:
+    """Seed the log from a family's existing records; a no-op once it has entries"""
+    if db.activity.find_one({"family_id": family_id}):
+        return 0
+
+    entries = []
+    for event in db.events.find({"family_id": family_id}).sort("created_at", -1).limit(20):
+        entries.append((CALENDAR_UPDATE, f"event:{event.get('id')}", event.get("created_by_email"), event.get("created_at"), {
+            "title": event.get("title"), "parent": event.get("parent"), "eventType": event.get("type")
+        }))
+    for request in db.change_requests.find({"family_id": family_id}).sort("created_at", -1).limit(20):
+        event = db.events.find_one({"family_id": family_id, "id": request.get("event_id")})
+        event_title = event.get("title") if event else None
+        if request.get("status") == "pending":
+            entries.append((CHANGE_REQUEST, f"change_request:{request['id']}", request["requested_by_email"], request["created_at"], {
+                "eventTitle": event_title, "reason": request.get("reason")
+            }))
+        else:
+            entries.append((CHANGE_REQUEST_REVIEWED, f"change_request:{request['id']}", request.get("reviewed_by_email"),
+                            request.get("updated_at") or request["created_at"], {"eventTitle": event_title, "status": request.get("status")}))
+    for conversation in db.conversations.find({"family_id": family_id}).sort("last_message_at", -1).limit(10):
+        conversation_id = str(conversation["_id"])
+        message = next(iter(db.messages.find({"conversation_id": conversation_id}).sort("timestamp", -1).limit(1)), None)
+        if message:
+            entries.append((MESSAGE, f"conversation:{conversation_id}", message.get("sender_email"), message.get("timestamp"), {
+                "subject": conversation.get("subject"), "content": preview(message.get("content", "")), "conversationId": conversation_id
+            }))
+    for expense in db.expenses.find({"family_id": family_id}).sort("created_at", -1).limit(20):
+        expense_id = expense.get("id") or str(expense.get("_id", ""))
+        actor = expense.get("dispute_created_by") if expense.get("status") == "disputed" else expense.get("paid_by_email")
+        entries.append((EXPENSE, f"expense:{expense_id}", actor, expense.get("updated_at") or expense.get("created_at"), {
+            "expenseId": expense_id, "description": expense.get("description"), "amount": expense.get("amount", 0.0),
+            "status": expense.get("status", "pending"), "paidBy": expense.get("paid_by_email"), "reason": expense.get("dispute_reason")
+        }))
+
+    # Oldest first, so the newest entry for an entity ends up current
+    entries = [entry for entry in entries if entry[3]]
+    entries.sort(key=lambda entry: entry[3])
+    for kind, entity, actor, created_at, data in entries:
+        record_activity(family_id, kind, entity, actor, created_at=created_at, **data)
+    return len(entries)
+
+
+ensure_activity_indexes()
@@ -0,0 +1,164 @@
+"""
+Admin search over users and families.
+
+Users match on email and full name; families on name, code and either
+parent's email. A query matches a value exactly, as a prefix of the value or
+of a word in it, or anywhere inside it, and results are ranked in that order.
+
+In Mongo every searchable document carries lowercase `search_terms` (each
+value and each word in it) and their trigrams in `search_grams`, both with
+multikey indexes: prefixes are an anchored regex over the terms index and
+substrings an $all over the trigrams. The in-memory database keeps the same
+structures in process (SearchIndexedCollection).
+"""
+import itertools
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from database import FAMILY_SEARCH_FIELDS, USER_SEARCH_FIELDS, SearchIndexedCollection, db
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Candidates ranked per kind; broad queries ("gmail") report a truncated total
+MAX_CANDIDATES = 1000
+REINDEX_BATCH_SIZE = 500
+
+# Ranks, best first
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING = 0, 1, 2, 3
+MATCH_TYPES = {EXACT: "exact", PREFIX: "prefix", WORD_PREFIX: "word", SUBSTRING: "substring"}
+
+KINDS = {"user": USER_SEARCH_FIELDS, "family": FAMILY_SEARCH_FIELDS}
+
+
+def _collection(kind: str):
+    return db.users if kind == "user" else db.families
+
+
+def ensure_search_indexes():
+    try:
+        for collection in (db.users, db.families):
+            collection.create_index([("search_terms", 1)])
+            collection.create_index([("search_grams", 1)])
+    except Exception as e:
+        print(f"⚠️  Could not create search indexes: {e}")
+
+
+def search_fields(kind: str, doc: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    The normalised fields to store with a user or family on insert or when a
+    searchable field changes. In-memory collections index themselves.
+    """
+    if isinstance(_collection(kind), SearchIndexedCollection):
+        return {}
+    terms = SearchIndexedCollection.search_terms(SearchIndexedCollection.search_values(doc, KINDS[kind]))
+    grams = set()
+    for term in terms:
+        grams.update(SearchIndexedCollection.trigrams(term))
+    return {"search_terms": sorted(terms), "search_grams": sorted(grams)}
+
+
+def reindex(kind: str) -> int:
+    """Fill in search fields on documents stored before search existed. Returns the number updated"""
+    collection = _collection(kind)
+    if isinstance(collection, SearchIndexedCollection):
+        return 0
+    updated = 0
+    cursor = collection.find({"search_terms": {"$exists": False}})
+    while True:
+        batch = list(itertools.islice(cursor, REINDEX_BATCH_SIZE))
+        if not batch:
+            return updated
+        collection.bulk_write([UpdateOne({"_id": doc["_id"]}, {"$set": search_fields(kind, doc)}) for doc in batch], ordered=False)
+        updated += len(batch)
+
+
+def _rank(query: str, values: List[str]) -> Optional[int]:
+    best = None
+    for value in values:
+        if value == query:
+            return EXACT
+        if value.startswith(query):
+            rank = PREFIX
+        elif any(word.startswith(query) for word in value.split(" ")):
+            rank = WORD_PREFIX
+        elif query in value:
+            rank = SUBSTRING
+        else:
+            continue
+        best = rank if best is None else min(best, rank)
+    return best
+
+
+def _candidates(kind: str, query: str) -> Iterable[Dict[str, Any]]:
+    """Prefix matches first, then substring matches; may repeat documents"""
+    collection = _collection(kind)
+    if isinstance(collection, SearchIndexedCollection):
+        return itertools.chain(collection.prefix_search(query), collection.substring_search(query))
+
+    prefix = collection.find({"search_terms": {"$regex": f"^{re.escape(query)}"}}).limit(MAX_CANDIDATES)
+    grams = sorted(SearchIndexedCollection.trigrams(query))
+    substring_filter = {"search_grams": {"$all": grams}} if grams else {"search_terms": {"$regex": re.escape(query)}}
+    return itertools.chain(prefix, collection.find(substring_filter).limit(MAX_CANDIDATES))
+
+
+def _result(kind: str, doc: Dict[str, Any], rank: int) -> Dict[str, Any]:
+    if kind == "user":
+        item = {
+            "type": "user",
+            "id": str(doc["_id"]),
+            "email": doc.get("email"),
+            "firstName": doc.get("firstName"),
+            "lastName": doc.get("lastName"),
+            "role": doc.get("role", "user"),
+            "label": doc.get("email") or "",
+        }
+    else:
+        item = {
+            "type": "family",
+            "id": str(doc["_id"]),
+            "familyName": doc.get("familyName"),
+            "familyCode": doc.get("familyCode"),
+            "parent1_email": doc.get("parent1_email"),
+            "parent2_email": doc.get("parent2_email"),
+            "isLinked": bool(doc.get("parent2_email")),
+            "label": doc.get("familyName") or "",
+        }
+    item["match"] = MATCH_TYPES[rank]
+    return item
+
+
+def search(query: str, kinds: Iterable[str] = ("user", "family"), limit: int = DEFAULT_PAGE_SIZE,
+           offset: int = 0) -> Dict[str, Any]:
+    query = SearchIndexedCollection.normalize_text(query)
+    ranked = []
+    truncated = False
+    for kind in kinds:
+        fields = KINDS[kind]
+        seen = set()
+        for doc in _candidates(kind, query):
+            key = str(doc["_id"])
+            if key in seen:
+                continue
+            seen.add(key)
+            rank = _rank(query, SearchIndexedCollection.search_values(doc, fields))
+            if rank is None:
+                continue
+            if len(seen) > MAX_CANDIDATES:
+                truncated = True
+                break
+            ranked.append((rank, kind, doc))
+
+    ranked.sort(key=lambda entry: (entry[0], (entry[2].get("email") or entry[2].get("familyName") or "").lower(), entry[1]))
+    page = ranked[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(ranked) else None
+    return {
+        "items": [_result(kind, doc, rank) for rank, kind, doc in page],
+        "total": len(ranked),
+        "truncated": truncated,
+        "nextOffset": next_offset,
+    }
+
+
+ensure_search_indexes()
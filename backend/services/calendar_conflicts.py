@@ -0,0 +1,205 @@
+"""
+Change-request conflict detection.
+
+Each family's stored events and pending change requests are indexed in an
+interval tree, so checking a proposed move costs O(log n + k). The tree is
+cached per family and keyed by the calendar's change-log sequence number,
+which means any calendar write, from any worker, invalidates it.
+
+Custody days from the recurring schedule are checked against the custody
+map instead of the tree, since they are derived rather than stored.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import db
+from services.calendar_sync import current_sequence
+from services.custody_map import parent_on
+from services.custody_schedule import parse_custody_event_id, to_datetime
+from services.interval_tree import IntervalTree
+
+# Timed events have no end time, so they are assumed to last this long
+DEFAULT_EVENT_DURATION = timedelta(hours=1)
+MAX_CACHED_FAMILIES = 1024
+
+NON_ACTIVITY_TYPES = {"custody", "holiday"}
+
+_trees: "OrderedDict[str, Tuple[int, IntervalTree, Dict[str, List[Dict[str, Any]]]]]" = OrderedDict()
+_trees_lock = threading.Lock()
+
+
+def event_interval(event_date: datetime) -> Tuple[datetime, datetime]:
+    """Events at midnight are all-day; anything else is a timed event"""
+    if event_date.time() == datetime.min.time():
+        return event_date, event_date + timedelta(days=1)
+    return event_date, event_date + DEFAULT_EVENT_DURATION
+
+
+def _build_index(family_id: str) -> Tuple[IntervalTree, Dict[str, List[Dict[str, Any]]]]:
+    intervals = []
+    event_types = {}
+    for event in db.events.find({"family_id": family_id}):
+        start, end = event_interval(event["date"])
+        intervals.append((start, end, {"kind": "event", "doc": event}))
+        event_types[event.get("id")] = event.get("type")
+
+    pending_by_event: Dict[str, List[Dict[str, Any]]] = {}
+    for request in db.change_requests.find({"family_id": family_id, "status": "pending"}):
+        pending_by_event.setdefault(request["event_id"], []).append(request)
+        if request.get("requestedDate"):
+            start, end = event_interval(request["requestedDate"])
+            # The type of the event the request would move
+            event_type = "custody" if parse_custody_event_id(request["event_id"]) else event_types.get(request["event_id"])
+            intervals.append((start, end, {"kind": "request", "doc": request, "event_type": event_type}))
+
+    return IntervalTree(intervals), pending_by_event
+
+
+def get_conflict_index(family_id: str) -> Tuple[IntervalTree, Dict[str, List[Dict[str, Any]]]]:
+    seq = current_sequence(family_id)
+    with _trees_lock:
+        cached = _trees.get(family_id)
+        if cached and cached[0] == seq:
+            _trees.move_to_end(family_id)
+            return cached[1], cached[2]
+
+    tree, pending_by_event = _build_index(family_id)
+    with _trees_lock:
+        _trees[family_id] = (seq, tree, pending_by_event)
+        _trees.move_to_end(family_id)
+        while len(_trees) > MAX_CACHED_FAMILIES:
+            _trees.popitem(last=False)
+    return tree, pending_by_event
+
+
+def resolve_event(family_id: str, event_id: str) -> Optional[Dict[str, Any]]:
+    """A stored event, or a virtual custody day from the recurring schedule"""
+    custody_day = parse_custody_event_id(event_id)
+    if custody_day:
+        parent = parent_on(family_id, custody_day)
+        if parent is None:
+            return None
+        return {"id": event_id, "family_id": family_id, "date": to_datetime(custody_day), "type": "custody", "parent": parent, "virtual": True}
+    return db.events.find_one({"family_id": family_id, "id": event_id})
+
+
+def _conflict(kind: str, message: str, requested: datetime, **ids) -> Dict[str, Any]:
+    return dict({"type": kind, "message": message, "date": requested.isoformat()}, **ids)
+
+
+def find_conflicts(
+    family_id: str,
+    event: Dict[str, Any],
+    requested: datetime,
+    exclude_request_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Conflicts caused by moving `event` to `requested`"""
+    tree, pending_by_event = get_conflict_index(family_id)
+    start, end = event_interval(requested)
+    is_custody = event.get("type") == "custody"
+    is_activity = event.get("type") not in NON_ACTIVITY_TYPES
+    conflicts = []
+
+    for _, _, entry in tree.overlapping(start, end):
+        doc = entry["doc"]
+        if entry["kind"] == "event":
+            if doc.get("id") == event.get("id"):
+                continue
+            if is_custody and doc.get("type") == "custody" and doc.get("parent") not in (None, "both", event.get("parent")):
+                conflicts.append(_conflict(
+                    "custody_overlap",
+                    f"{doc.get('parent')} already has custody then ({doc.get('title')})",
+                    requested, eventId=doc.get("id")
+                ))
+            elif is_activity and doc.get("type") not in NON_ACTIVITY_TYPES:
+                conflicts.append(_conflict(
+                    "double_booked",
+                    f"Overlaps with {doc.get('title')}",
+                    requested, eventId=doc.get("id")
+                ))
+        elif doc.get("id") == exclude_request_id or doc.get("event_id") == event.get("id"):
+            continue
+        elif (is_custody and entry["event_type"] == "custody") or (is_activity and entry["event_type"] not in NON_ACTIVITY_TYPES):
+            conflicts.append(_conflict(
+                "competing_request",
+                "Another pending request asks for the same time",
+                requested, requestId=doc.get("id")
+            ))
+
+    # Other pending requests to move the same event
+    for request in pending_by_event.get(event.get("id"), []):
+        if request.get("id") != exclude_request_id:
+            conflicts.append(_conflict(
+                "competing_request",
+                "This event already has a pending change request",
+                requested, requestId=request.get("id")
+            ))
+
+    if is_custody and event.get("parent"):
+        scheduled = parent_on(family_id, requested.date())
+        if event.get("virtual") and scheduled == event["parent"]:
+            conflicts.append(_conflict(
+                "custody_overlap",
+                f"{scheduled} already has custody on the requested day",
+                requested
+            ))
+        elif not event.get("virtual") and scheduled not in (None, "both", event["parent"]):
+            conflicts.append(_conflict(
+                "custody_overlap",
+                f"The requested day is {scheduled}'s custody day",
+                requested
+            ))
+
+    return conflicts
+
+
+def validate_swap_set(family_id: str, proposals: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Check a whole set of proposed moves: each against the calendar, and the
+    proposals against each other.
+    """
+    results = []
+    proposed_intervals = []
+    seen_events: Dict[str, int] = {}
+
+    for index, proposal in enumerate(proposals):
+        event = resolve_event(family_id, proposal["event_id"])
+        if event is None:
+            results.append({"index": index, "eventId": proposal["event_id"], "conflicts": [
+                {"type": "not_found", "message": "Event not found"}
+            ]})
+            continue
+
+        requested = proposal["requestedDate"]
+        conflicts = find_conflicts(family_id, event, requested)
+        if event["id"] in seen_events:
+            conflicts.append(_conflict(
+                "duplicate_proposal",
+                f"Proposal {seen_events[event['id']]} already moves this event",
+                requested
+            ))
+        seen_events.setdefault(event["id"], index)
+
+        start, end = event_interval(requested)
+        proposed_intervals.append((start, end, (index, event)))
+        results.append({"index": index, "eventId": event["id"], "requestedDate": requested.isoformat(), "conflicts": conflicts})
+
+    # Proposals that land on top of each other
+    proposal_tree = IntervalTree(proposed_intervals)
+    results_by_index = {result["index"]: result for result in results}
+    for start, end, (index, event) in proposed_intervals:
+        for _, _, (other_index, other_event) in proposal_tree.overlapping(start, end):
+            if other_index == index:
+                continue
+            both_custody = event.get("type") == "custody" and other_event.get("type") == "custody"
+            both_activities = event.get("type") not in NON_ACTIVITY_TYPES and other_event.get("type") not in NON_ACTIVITY_TYPES
+            if (both_custody and event.get("parent") != other_event.get("parent")) or both_activities:
+                results_by_index[index]["conflicts"].append(_conflict(
+                    "proposal_overlap",
+                    f"Overlaps with proposal {other_index}",
+                    start
+                ))
+
+    return results
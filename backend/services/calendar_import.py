@@ -0,0 +1,307 @@
+"""
+Calendar import from iCalendar (.ics) and CSV files.
+
+Both parsers are generators over the decoded file, yielding one candidate
+event (or one error) at a time, so a school-year calendar is validated and
+written in chunks instead of being materialised up front.
+
+Events are de-duplicated by a natural key. For ICS that is the event's UID
+(plus the occurrence date for recurring events); otherwise it is the date,
+type and normalised title.
+"""
+import csv
+import hashlib
+import io
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+EVENT_TYPES = {"custody", "holiday", "school", "medical", "activity"}
+DEFAULT_EVENT_TYPE = "activity"
+
+# Upper bound on occurrences generated from a single RRULE
+MAX_OCCURRENCES = 400
+MAX_IMPORT_EVENTS = 5000
+
+WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+
+# (line number, event fields or None, error or warning message or None)
+ParsedRow = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+def natural_key(event_date: datetime, event_type: str, title: str, uid: Optional[str] = None) -> str:
+    if uid:
+        basis = f"uid|{uid}|{event_date.isoformat()}"
+    else:
+        basis = f"{event_date.isoformat()}|{event_type}|{' '.join(title.lower().split())}"
+    return hashlib.sha1(basis.encode("utf-8")).hexdigest()
+
+
+def normalize_type(value: Optional[str]) -> str:
+    value = (value or "").strip().lower()
+    return value if value in EVENT_TYPES else DEFAULT_EVENT_TYPE
+
+
+def detect_format(file_name: str, text_start: str) -> str:
+    if file_name.lower().endswith(".ics") or text_start.lstrip().upper().startswith("BEGIN:VCALENDAR"):
+        return "ics"
+    return "csv"
+
+
+def iter_text_lines(content: bytes) -> Iterator[str]:
+    """Decode lazily, line by line"""
+    stream = io.TextIOWrapper(io.BytesIO(content), encoding="utf-8-sig", errors="replace", newline="")
+    for line in stream:
+        yield line
+
+
+# iCalendar
+
+def _unfold(lines: Iterator[str]) -> Iterator[Tuple[int, str]]:
+    """Join RFC 5545 continuation lines, yielding (first line number, logical line)"""
+    current = None
+    current_number = 0
+    for number, raw in enumerate(lines, start=1):
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current_number, current
+        current, current_number = line, number
+    if current is not None:
+        yield current_number, current
+
+
+def _split_property(line: str) -> Tuple[str, Dict[str, str], str]:
+    name_part, _, value = line.partition(":")
+    name, *params = name_part.split(";")
+    parameters = {}
+    for param in params:
+        key, _, param_value = param.partition("=")
+        parameters[key.upper()] = param_value.strip('"')
+    return name.upper(), parameters, value
+
+
+def _unescape(value: str) -> str:
+    return value.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\")
+
+
+def parse_ics_datetime(value: str, parameters: Dict[str, str]) -> datetime:
+    """Return a naive UTC datetime; all-day values become midnight"""
+    value = value.strip()
+    if parameters.get("VALUE") == "DATE" or re.fullmatch(r"\d{8}", value):
+        return datetime.strptime(value[:8], "%Y%m%d")
+    if value.endswith("Z"):
+        return datetime.strptime(value, "%Y%m%dT%H%M%SZ")
+    local = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    tzid = parameters.get("TZID")
+    if tzid and ZoneInfo is not None:
+        try:
+            return local.replace(tzinfo=ZoneInfo(tzid)).astimezone(timezone.utc).replace(tzinfo=None)
+        except Exception:
+            pass
+    # Floating time or an unknown zone: keep the wall-clock time
+    return local
+
+
+def expand_rrule(start: datetime, rule: str) -> Tuple[List[datetime], Optional[str]]:
+    """
+    Expand the common RRULE forms (DAILY/WEEKLY/MONTHLY/YEARLY with INTERVAL,
+    COUNT, UNTIL and weekly BYDAY). Returns (occurrences, warning).
+    """
+    parts = dict(part.split("=", 1) for part in rule.split(";") if "=" in part)
+    freq = parts.get("FREQ", "").upper()
+    interval = int(parts.get("INTERVAL", "1") or 1)
+    count = int(parts["COUNT"]) if "COUNT" in parts else None
+    until = parse_ics_datetime(parts["UNTIL"], {}) if "UNTIL" in parts else None
+    if until and until.time() == datetime.min.time() and start.time() != datetime.min.time():
+        # A date-only UNTIL includes that whole day
+        until += timedelta(days=1) - timedelta(seconds=1)
+
+    unsupported = set(parts) - {"FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY", "WKST"}
+    if freq not in ("DAILY", "WEEKLY", "MONTHLY", "YEARLY") or unsupported or (
+        "BYDAY" in parts and freq != "WEEKLY"
+    ):
+        return [start], f"Recurrence '{rule}' is not supported; only the first occurrence was imported"
+
+    limit = min(count or MAX_OCCURRENCES, MAX_OCCURRENCES)
+    occurrences: List[datetime] = []
+
+    def accept(candidate: datetime) -> bool:
+        if until and candidate > until:
+            return False
+        occurrences.append(candidate)
+        return len(occurrences) < limit
+
+    if freq == "WEEKLY":
+        weekdays = sorted(WEEKDAYS[day[-2:]] for day in parts["BYDAY"].split(",")) if "BYDAY" in parts else [start.weekday()]
+        week_start = start - timedelta(days=start.weekday())
+        while True:
+            for weekday in weekdays:
+                candidate = week_start + timedelta(days=weekday)
+                if candidate < start:
+                    continue
+                if not accept(candidate):
+                    return occurrences, None
+            week_start += timedelta(weeks=interval)
+            if until is None and count is None and week_start > start + timedelta(days=366):
+                return occurrences, "Open-ended recurrence was imported for one year"
+
+    step = 0
+    while True:
+        if freq == "DAILY":
+            candidate = start + timedelta(days=interval * step)
+        else:
+            months = interval * step * (12 if freq == "YEARLY" else 1)
+            year, month = divmod(start.month - 1 + months, 12)
+            try:
+                candidate = start.replace(year=start.year + year, month=month + 1)
+            except ValueError:
+                # e.g. the 31st in a shorter month is skipped, as RFC 5545 requires
+                step += 1
+                continue
+        if not accept(candidate):
+            return occurrences, None
+        step += 1
+        if until is None and count is None and candidate > start + timedelta(days=366):
+            return occurrences, "Open-ended recurrence was imported for one year"
+
+
+def parse_ics(content: bytes) -> Iterator[ParsedRow]:
+    in_event = False
+    properties: Dict[str, Tuple[Dict[str, str], str]] = {}
+    event_line = 0
+
+    for number, line in _unfold(iter_text_lines(content)):
+        upper = line.upper()
+        if upper == "BEGIN:VEVENT":
+            in_event, properties, event_line = True, {}, number
+            continue
+        if upper == "END:VEVENT":
+            in_event = False
+            yield from _ics_event(event_line, properties)
+            continue
+        if in_event and ":" in line:
+            name, parameters, value = _split_property(line)
+            # Keep the first occurrence of each property
+            properties.setdefault(name, (parameters, value))
+
+
+def _ics_event(line: int, properties: Dict[str, Tuple[Dict[str, str], str]]) -> Iterator[ParsedRow]:
+    if "DTSTART" not in properties:
+        yield line, None, "Event has no DTSTART"
+        return
+    if properties.get("STATUS", ({}, ""))[1].upper() == "CANCELLED":
+        return
+
+    try:
+        start = parse_ics_datetime(properties["DTSTART"][1], properties["DTSTART"][0])
+    except ValueError:
+        yield line, None, f"Invalid DTSTART: {properties['DTSTART'][1]}"
+        return
+
+    title = _unescape(properties.get("SUMMARY", ({}, ""))[1]).strip() or "Imported event"
+    categories = _unescape(properties.get("CATEGORIES", ({}, ""))[1]).split(",")
+    event_type = normalize_type(categories[0] if categories else None)
+    uid = properties.get("UID", ({}, ""))[1].strip() or None
+
+    occurrences, warning = [start], None
+    if "RRULE" in properties:
+        occurrences, warning = expand_rrule(start, properties["RRULE"][1])
+    if warning:
+        yield line, None, f"Warning: {warning}"
+
+    for occurrence in occurrences:
+        yield line, {
+            "date": occurrence,
+            "type": event_type,
+            "title": title,
+            "parent": None,
+            "isSwappable": event_type == "custody",
+            "import_uid": uid,
+        }, None
+
+
+# CSV
+
+def _parse_csv_datetime(day_value: str, time_value: str) -> datetime:
+    day_value = day_value.strip()
+    for day_format in ("%Y-%m-%d", "%m/%d/%Y", "%d.%m.%Y"):
+        try:
+            parsed = datetime.strptime(day_value, day_format)
+            break
+        except ValueError:
+            continue
+    else:
+        # Full ISO timestamps in the date column
+        try:
+            parsed = datetime.fromisoformat(day_value.replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError(f"Unrecognised date '{day_value}'")
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+
+    time_value = (time_value or "").strip()
+    if time_value:
+        for time_format in ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p"):
+            try:
+                parsed_time = datetime.strptime(time_value.upper(), time_format).time()
+                return datetime.combine(parsed.date(), parsed_time)
+            except ValueError:
+                continue
+        raise ValueError(f"Unrecognised time '{time_value}'")
+    return parsed
+
+
+def parse_csv(content: bytes) -> Iterator[ParsedRow]:
+    """Columns: date (required), time, title (required), type, parent, swappable"""
+    reader = csv.DictReader(iter_text_lines(content))
+    if not reader.fieldnames:
+        return
+    columns = {name.strip().lower(): name for name in reader.fieldnames if name}
+    if "date" not in columns or "title" not in columns:
+        yield 1, None, "CSV needs at least 'date' and 'title' columns"
+        return
+
+    def column(row: Dict[str, str], name: str) -> str:
+        return (row.get(columns[name]) or "") if name in columns else ""
+
+    for row in reader:
+        line = reader.line_num
+        title = column(row, "title").strip()
+        if not title:
+            yield line, None, "Missing title"
+            continue
+        try:
+            event_date = _parse_csv_datetime(column(row, "date"), column(row, "time"))
+        except ValueError as e:
+            yield line, None, str(e)
+            continue
+
+        event_type = normalize_type(column(row, "type"))
+        parent = column(row, "parent").strip().lower() or None
+        swappable = column(row, "swappable").strip().lower() in ("1", "true", "yes", "y")
+        yield line, {
+            "date": event_date,
+            "type": event_type,
+            "title": title,
+            "parent": parent,
+            "isSwappable": swappable,
+            "import_uid": None,
+        }, None
+
+
+def parse_calendar_file(content: bytes, file_name: str, file_format: Optional[str] = None) -> Iterator[ParsedRow]:
+    file_format = (file_format or detect_format(file_name, content[:64].decode("utf-8", errors="ignore"))).lower()
+    if file_format == "ics":
+        return parse_ics(content)
+    if file_format == "csv":
+        return parse_csv(content)
+    raise ValueError("Format must be 'ics' or 'csv'")
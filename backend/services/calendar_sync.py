@@ -0,0 +1,238 @@
+"""
+Incremental calendar sync and iCalendar feeds.
+
+Every calendar write appends an entry to a per-family change log with a
+monotonically increasing sequence number. A sync token is that sequence
+number, so a client holding token X only needs the entries after X: the
+latest version of each changed event plus tombstones for deleted ones.
+
+The same sequence number versions the family's calendar as a whole, which
+is what the ICS feed's ETag is derived from.
+"""
+import hashlib
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from database import db
+from services.custody_schedule import custody_events
+from services.response_cache import bump_family_version
+
+SYNC_TOKEN_PREFIX = "s1-"
+
+# Entries older than this may be pruned; tokens that old need a full sync
+CHANGE_LOG_RETENTION = timedelta(days=90)
+
+# Entities in the change log
+EVENT = "event"
+CHANGE_REQUEST = "change_request"
+# Any change to rules or exceptions: clients re-expand the custody days they show
+SCHEDULE = "schedule"
+
+ICS_DAYS_BEFORE = 90
+ICS_DAYS_AFTER = 365
+ICS_PRODUCT_ID = "-//Bridge//Family Calendar//EN"
+
+
+class SyncTokenExpired(Exception):
+    """The token is unknown or older than the change log retains"""
+
+
+def ensure_sync_indexes():
+    try:
+        db.calendar_changes.create_index([("family_id", 1), ("seq", 1)])
+        db.calendar_changes.create_index([("created_at", 1)], expireAfterSeconds=int(CHANGE_LOG_RETENTION.total_seconds()))
+        db.users.create_index([("ics_token", 1)], sparse=True)
+    except Exception as e:
+        print(f"⚠️  Could not create calendar sync indexes: {e}")
+
+
+def current_sequence(family_id: str) -> int:
+    counter = db.counters.find_one({"_id": f"calendar:{family_id}"})
+    return counter["seq"] if counter else 0
+
+
+def record_calendar_change(family_id: str, entity: str, entity_id: str, op: str = "upsert") -> int:
+    """Append a change to the family's log and return its sequence number"""
+    counter = db.counters.find_one_and_update(
+        {"_id": f"calendar:{family_id}"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    db.calendar_changes.insert_one({
+        "family_id": family_id,
+        "seq": counter["seq"],
+        "entity": entity,
+        "entity_id": entity_id,
+        "op": op,
+        "created_at": datetime.utcnow()
+    })
+    # Every calendar write goes through here, which makes it the place to invalidate cached reads
+    bump_family_version(family_id)
+    return counter["seq"]
+
+
+def record_calendar_changes(family_id: str, changes: List[Tuple[str, str, str]]) -> int:
+    """Append many (entity, entity_id, op) changes with one counter update and one insert"""
+    if not changes:
+        return current_sequence(family_id)
+    counter = db.counters.find_one_and_update(
+        {"_id": f"calendar:{family_id}"},
+        {"$inc": {"seq": len(changes)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    first_seq = counter["seq"] - len(changes) + 1
+    now = datetime.utcnow()
+    db.calendar_changes.insert_many([
+        {"family_id": family_id, "seq": first_seq + index, "entity": entity, "entity_id": entity_id, "op": op, "created_at": now}
+        for index, (entity, entity_id, op) in enumerate(changes)
+    ])
+    bump_family_version(family_id)
+    return counter["seq"]
+
+
+def encode_sync_token(seq: int) -> str:
+    return f"{SYNC_TOKEN_PREFIX}{seq}"
+
+
+def decode_sync_token(token: str) -> int:
+    if not token.startswith(SYNC_TOKEN_PREFIX) or not token[len(SYNC_TOKEN_PREFIX):].isdigit():
+        raise SyncTokenExpired("Malformed sync token")
+    return int(token[len(SYNC_TOKEN_PREFIX):])
+
+
+def changes_since(family_id: str, token: str) -> Tuple[int, Dict[Tuple[str, str], str]]:
+    """
+    Return (sequence read up to, {(entity, id): last op}) for the entries after
+    the token. Raises SyncTokenExpired when the log can no longer answer it.
+
+    Writers bump the counter before inserting their entry, so a missing
+    sequence number is usually a write still in flight: reading stops at the
+    first gap and the returned sequence is the last entry actually read, which
+    the next sync picks up from. Only a gap before the oldest entry the log
+    still holds was pruned by the retention TTL and expires the token.
+    """
+    since = decode_sync_token(token)
+    latest = current_sequence(family_id)
+    if since > latest:
+        raise SyncTokenExpired("Sync token is from the future")
+
+    changes = db.calendar_changes.find({"family_id": family_id, "seq": {"$gt": since}}).sort("seq", 1)
+    read_to = since
+    # Only the last operation on each entity matters
+    collapsed: Dict[Tuple[str, str], str] = {}
+    for change in changes:
+        if change["seq"] != read_to + 1:
+            break
+        read_to = change["seq"]
+        collapsed[(change["entity"], change["entity_id"])] = change["op"]
+
+    if read_to == since < latest:
+        # Nothing after the token could be read; the TTL prunes oldest first, so
+        # a missing entry older than everything retained was pruned
+        oldest = list(db.calendar_changes.find({"family_id": family_id}).sort("seq", 1).limit(1))
+        if not oldest or oldest[0]["seq"] > since:
+            raise SyncTokenExpired("Sync token has expired")
+    return read_to, collapsed
+
+
+# iCalendar rendering
+
+def _escape(text: str) -> str:
+    return (text or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _fold(line: str) -> str:
+    """Fold lines longer than 75 octets as RFC 5545 requires"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Don't split a multi-byte character
+        while cut > 0 and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _format_vevent(event: Dict[str, Any], stamp: str) -> str:
+    start: datetime = event["date"]
+    lines = [
+        "BEGIN:VEVENT",
+        # Custody day ids are only unique within a family
+        f"UID:{event['family_id']}-{event['id']}@bridge",
+        f"DTSTAMP:{stamp}",
+    ]
+    if start.time() == datetime.min.time():
+        lines.append(f"DTSTART;VALUE=DATE:{start.strftime('%Y%m%d')}")
+        lines.append(f"DTEND;VALUE=DATE:{(start + timedelta(days=1)).strftime('%Y%m%d')}")
+    else:
+        lines.append(f"DTSTART:{start.strftime('%Y%m%dT%H%M%SZ')}")
+        lines.append(f"DTEND:{(start + timedelta(hours=1)).strftime('%Y%m%dT%H%M%SZ')}")
+
+    summary = event.get("title") or "Event"
+    if event.get("parent") and event["parent"] != "both":
+        summary = f"{summary} ({event['parent']})"
+    lines.append(f"SUMMARY:{_escape(summary)}")
+    lines.append(f"CATEGORIES:{_escape(event.get('type') or 'event').upper()}")
+    if event.get("updated_at"):
+        lines.append(f"LAST-MODIFIED:{event['updated_at'].strftime('%Y%m%dT%H%M%SZ')}")
+    lines.append("END:VEVENT")
+    return "".join(_fold(line) for line in lines)
+
+
+def ics_window(today: Optional[date] = None) -> Tuple[datetime, datetime]:
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=ICS_DAYS_BEFORE)
+    end = today + timedelta(days=ICS_DAYS_AFTER)
+    return datetime(start.year, start.month, start.day), datetime(end.year, end.month, end.day)
+
+
+def ics_etag(family_id: str, user_email: str, today: Optional[date] = None) -> str:
+    """Changes only when the calendar changes or the window rolls over to a new day"""
+    today = today or datetime.utcnow().date()
+    version = f"{family_id}:{user_email}:{current_sequence(family_id)}:{today.isoformat()}"
+    return '"' + hashlib.sha1(version.encode("utf-8")).hexdigest() + '"'
+
+
+def render_ics(family_id: str, calendar_name: str) -> Iterator[str]:
+    """Yield the feed a few events at a time rather than building it in memory"""
+    start, end = ics_window()
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+
+    yield "".join(_fold(line) for line in [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{ICS_PRODUCT_ID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(calendar_name)}",
+        "X-PUBLISHED-TTL:PT1H",
+    ])
+
+    batch: List[str] = []
+    stored = db.events.find({"family_id": family_id, "date": {"$gte": start, "$lt": end}}).sort("date", 1)
+    for event in stored:
+        batch.append(_format_vevent(dict(event, id=event.get("id") or str(event.get("_id", ""))), stamp))
+        if len(batch) >= 100:
+            yield "".join(batch)
+            batch = []
+    for event in custody_events(family_id, start, end):
+        batch.append(_format_vevent(event, stamp))
+        if len(batch) >= 100:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+    yield _fold("END:VCALENDAR")
+
+
+ensure_sync_indexes()
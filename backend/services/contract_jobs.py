@@ -0,0 +1,302 @@
+"""
+Asynchronous contract-parsing jobs.
+
+upload_contract records a job and returns straight away. A small thread pool
+runs each job: it hands the CPU-heavy extraction and parsing to a process
+pool, retries failures and timeouts with backoff, and writes the result back
+onto the family's custody agreement. Results are cached by the SHA-256 of the
+file and the parser version and rule set that produced them, so re-uploading an
+identical contract completes instantly until parsing changes.
+
+Jobs survive a restart: the upload is kept in storage until its job finishes,
+and every process heartbeats while it runs. A recovery loop in each process
+claims unfinished jobs whose process has stopped heartbeating and queues them
+again, or fails them if their upload is gone.
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+
+from database import db
+from models import CustodyAgreement
+from services.contract_parser import parse_contract_file, parser_key
+from services.response_cache import bump_family_version
+from services.storage import storage
+
+CONTRACT_PARSE_WORKERS = int(os.getenv("CONTRACT_PARSE_WORKERS", "2"))
+CONTRACT_PARSE_TIMEOUT = float(os.getenv("CONTRACT_PARSE_TIMEOUT", "60"))
+CONTRACT_PARSE_MAX_ATTEMPTS = int(os.getenv("CONTRACT_PARSE_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_SECONDS = 2
+# How long a replaced pool's workers get to finish before they are killed
+POOL_SHUTDOWN_GRACE = 5
+# Processes heartbeat this often; one silent for three beats has stopped and its jobs are taken over
+RUNNER_HEARTBEAT_SECONDS = 10
+RUNNER_STALE_AFTER = timedelta(seconds=RUNNER_HEARTBEAT_SECONDS * 3)
+
+CONTRACTS_PREFIX = "contracts"
+UNFINISHED_STATUSES = ["pending", "running", "retrying"]
+
+# Identifies this process as the runner of the jobs it queues
+_runner_id = str(uuid.uuid4())
+_recovery_started = False
+
+_job_runner = ThreadPoolExecutor(max_workers=max(CONTRACT_PARSE_WORKERS, 1), thread_name_prefix="contract-jobs")
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def ensure_contract_job_indexes():
+    try:
+        db.contract_jobs.create_index([("id", 1)])
+        db.contract_jobs.create_index([("status", 1)])
+        db.contract_parse_cache.create_index([("content_hash", 1), ("parser_key", 1)])
+    except Exception as e:
+        print(f"⚠️  Could not create contract job indexes: {e}")
+
+
+def _get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Lazily start the process pool. CONTRACT_PARSE_WORKERS=0 parses in the job thread instead"""
+    global _process_pool
+    if CONTRACT_PARSE_WORKERS <= 0:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn avoids forking a process that already runs threads
+            _process_pool = ProcessPoolExecutor(
+                max_workers=CONTRACT_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+def _terminate_workers(processes):
+    deadline = time.monotonic() + POOL_SHUTDOWN_GRACE
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+            process.join(1)
+        if process.is_alive():
+            process.kill()
+
+
+def _reset_process_pool(pool: ProcessPoolExecutor):
+    """Replace a pool with a hung or dead worker and kill whatever of it doesn't exit in time"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not pool:
+            # Another job already replaced it
+            return
+        _process_pool = None
+    # shutdown(wait=False) leaves a hung worker running forever, so keep hold of the processes
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    threading.Thread(target=_terminate_workers, args=(processes,), name="contract-pool-reaper", daemon=True).start()
+
+
+def content_key(job_id: str) -> str:
+    return f"{CONTRACTS_PREFIX}/{job_id}"
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _update_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.utcnow()
+    db.contract_jobs.update_one({"id": job_id}, {"$set": fields})
+
+
+def _apply_result(family_id: Any, job_id: str, file_name: str, parsed_info: Dict[str, Any]) -> CustodyAgreement:
+    """Write a parse result onto the family, unless a newer upload has replaced this job"""
+    parsed_data = dict(parsed_info["parsedData"], status="completed", jobId=job_id)
+    custody_agreement = CustodyAgreement(
+        uploadDate=datetime.utcnow(),
+        fileName=file_name,
+        custodySchedule=parsed_info["custodySchedule"],
+        holidaySchedule=parsed_info["holidaySchedule"],
+        decisionMaking=parsed_info["decisionMaking"],
+        expenseSplit=parsed_info["expenseSplit"],
+        parsedData=parsed_data
+    )
+    db.families.update_one(
+        {"_id": family_id, "custodyAgreement.parsedData.jobId": job_id},
+        {"$set": {"custodyAgreement": custody_agreement.model_dump()}}
+    )
+    bump_family_version(str(family_id))
+    return custody_agreement
+
+
+def create_contract_job(family_id: Any, file_name: str, file_type: str, content: bytes) -> Dict[str, Any]:
+    """Record a parse job for an uploaded contract and queue it. Cached results complete immediately"""
+    job_id = str(uuid.uuid4())
+    digest = content_hash(content)
+    now = datetime.utcnow()
+
+    job = {
+        "id": job_id,
+        "family_id": str(family_id),
+        "file_name": file_name,
+        "file_type": file_type,
+        "content_hash": digest,
+        "status": "pending",
+        "progress": 0,
+        "attempts": 0,
+        "error": None,
+        "runner": _runner_id,
+        "created_at": now,
+        "updated_at": now
+    }
+
+    # Mark the agreement as pending before any worker can finish
+    db.families.update_one(
+        {"_id": family_id},
+        {"$set": {"custodyAgreement": CustodyAgreement(
+            uploadDate=now,
+            fileName=file_name,
+            parsedData={"status": "pending", "jobId": job_id}
+        ).model_dump()}}
+    )
+
+    cached = db.contract_parse_cache.find_one({"content_hash": digest, "parser_key": parser_key()})
+    if cached:
+        _apply_result(family_id, job_id, file_name, cached["result"])
+        job.update({"status": "completed", "progress": 100, "cached": True, "completed_at": now})
+        db.contract_jobs.insert_one(job)
+        return job
+
+    # Kept until the job finishes, so another process can run it after a restart
+    storage.save(content_key(job_id), content)
+    db.contract_jobs.insert_one(job)
+    _job_runner.submit(_run_job, family_id, job_id, file_name, file_type, content)
+    return job
+
+
+def _parse(content: bytes, file_name: str, file_type: str) -> Dict[str, Any]:
+    pool = _get_process_pool()
+    if pool is None:
+        return parse_contract_file(content, file_name, file_type)
+    try:
+        future = pool.submit(parse_contract_file, content, file_name, file_type)
+        return future.result(timeout=CONTRACT_PARSE_TIMEOUT)
+    except (FutureTimeoutError, BrokenProcessPool):
+        # Don't queue the retry behind a stuck or dead worker
+        _reset_process_pool(pool)
+        raise
+
+
+def _run_job(family_id: Any, job_id: str, file_name: str, file_type: str, content: bytes):
+    last_error = None
+    for attempt in range(1, CONTRACT_PARSE_MAX_ATTEMPTS + 1):
+        _update_job(job_id, status="running", progress=10, attempts=attempt)
+        try:
+            parsed_info = _parse(content, file_name, file_type)
+            _update_job(job_id, progress=90)
+
+            db.contract_parse_cache.update_one(
+                {"content_hash": content_hash(content), "parser_key": parser_key()},
+                {"$set": {"result": parsed_info, "created_at": datetime.utcnow()}},
+                upsert=True
+            )
+            _apply_result(family_id, job_id, file_name, parsed_info)
+            _update_job(job_id, status="completed", progress=100, error=None, completed_at=datetime.utcnow())
+            storage.delete(content_key(job_id))
+            return
+        except FutureTimeoutError:
+            last_error = f"Parsing timed out after {CONTRACT_PARSE_TIMEOUT:g}s"
+        except BrokenProcessPool as e:
+            last_error = f"Parser process crashed: {e}"
+        except Exception as e:
+            last_error = str(e)
+            traceback.print_exc()
+
+        print(f"[ERROR] Contract job {job_id} attempt {attempt}: {last_error}")
+        if attempt < CONTRACT_PARSE_MAX_ATTEMPTS:
+            _update_job(job_id, status="retrying", error=last_error)
+            time.sleep(RETRY_BACKOFF_SECONDS * attempt)
+
+    _fail_job(family_id, job_id, last_error)
+
+
+def _fail_job(family_id: Any, job_id: str, error: str):
+    _update_job(job_id, status="failed", error=error)
+    db.families.update_one(
+        {"_id": family_id, "custodyAgreement.parsedData.jobId": job_id},
+        {"$set": {"custodyAgreement.parsedData.status": "failed", "custodyAgreement.parsedData.error": error}}
+    )
+    bump_family_version(str(family_id))
+    storage.delete(content_key(job_id))
+
+
+# Recovery after a restart
+
+def recover_contract_jobs() -> int:
+    """Queue the unfinished jobs of processes that stopped heartbeating. Returns how many were claimed"""
+    now = datetime.utcnow()
+    live = {runner["_id"] for runner in db.contract_runners.find({"seen_at": {"$gte": now - RUNNER_STALE_AFTER}})}
+    live.add(_runner_id)
+    claimed = 0
+    for job in list(db.contract_jobs.find({"status": {"$in": UNFINISHED_STATUSES}})):
+        if job.get("runner") in live:
+            continue
+        # Only one process wins the claim
+        won = db.contract_jobs.update_one(
+            {"id": job["id"], "status": {"$in": UNFINISHED_STATUSES}, "runner": job.get("runner")},
+            {"$set": {"runner": _runner_id, "status": "pending", "updated_at": now}}
+        )
+        if won.modified_count == 0:
+            continue
+        claimed += 1
+
+        family_id = ObjectId(job["family_id"]) if ObjectId.is_valid(job["family_id"]) else job["family_id"]
+        try:
+            with storage.open(content_key(job["id"])) as stored:
+                content = stored.read()
+        except FileNotFoundError:
+            _fail_job(family_id, job["id"], "The upload was lost in a restart. Upload the contract again")
+            continue
+        print(f"🔄 Resuming contract job {job['id']} left by a stopped process")
+        _job_runner.submit(_run_job, family_id, job["id"], job["file_name"], job["file_type"], content)
+    return claimed
+
+
+def _run_recovery():
+    while True:
+        try:
+            now = datetime.utcnow()
+            db.contract_runners.update_one({"_id": _runner_id}, {"$set": {"seen_at": now}}, upsert=True)
+            db.contract_runners.delete_many({"seen_at": {"$lt": now - timedelta(days=1)}})
+            recover_contract_jobs()
+        except Exception as e:
+            print(f"[ERROR] Contract job recovery: {e}")
+            traceback.print_exc()
+        time.sleep(RUNNER_HEARTBEAT_SECONDS)
+
+
+def start_contract_recovery() -> bool:
+    """Heartbeat and take over orphaned jobs in a background thread. Returns False if already running"""
+    global _recovery_started
+    if _recovery_started:
+        return False
+    _recovery_started = True
+    threading.Thread(target=_run_recovery, name="contract-recovery", daemon=True).start()
+    return True
+
+
+def get_contract_job(job_id: str, family_id: str) -> Optional[Dict[str, Any]]:
+    return db.contract_jobs.find_one({"id": job_id, "family_id": family_id})
+
+
+ensure_contract_job_indexes()
@@ -0,0 +1,195 @@
+"""
+Custody agreement parsing.
+
+This module deliberately has no database or web imports: parse_contract_file
+runs inside the contract-parsing process pool, and child processes only need
+to import this file.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.term_extraction import TermExtractor, find_term
+from services.text_extraction import extract_pages, is_extractable
+
+# Simulated latency of the model call, for exercising the job pipeline locally
+CONTRACT_MODEL_LATENCY = float(os.getenv("CONTRACT_MODEL_LATENCY", "0"))
+
+
+# Terms recognised in custody agreements. Rules sharing a term are in priority order
+CONTRACT_TERM_RULES: List[Dict[str, Any]] = [
+    {
+        "term": "Custody Split",
+        "value": "50/50 Equal Time",
+        "phrases": ["50/50", "50-50", "equal time", "equal parenting time", "equally shared"],
+        "confidence": 0.9,
+        "data": {"expenseSplit": {"ratio": "50-50", "parent1": 50, "parent2": 50}}
+    },
+    {
+        "term": "Custody Split",
+        "value": "Primary/Secondary",
+        "phrases": ["primary"],
+        "requires": [["secondary", "non-custodial", "noncustodial"]],
+        "confidence": 0.8,
+        "data": {"expenseSplit": {"ratio": "60-40", "parent1": 60, "parent2": 40}}
+    },
+    {
+        "term": "Custody Schedule",
+        "value": "2-2-3 Rotation",
+        "phrases": ["2-2-3", "2/2/3"],
+        "confidence": 0.9
+    },
+    {
+        "term": "Custody Schedule",
+        "value": "Week On/Week Off",
+        "phrases": ["week on/week off", "week on, week off", "week-on/week-off", "alternating weeks", "alternate weeks"],
+        "confidence": 0.9
+    },
+    {
+        "term": "Custody Schedule",
+        "value": "Alternating Weekends",
+        "phrases": ["every other weekend", "alternating weekends", "alternate weekends"],
+        "confidence": 0.85
+    },
+    {
+        "term": "Legal Custody",
+        "value": "Joint Legal Custody",
+        "phrases": ["joint legal custody"],
+        "confidence": 0.95
+    },
+    {
+        "term": "Legal Custody",
+        "value": "Sole Legal Custody",
+        "phrases": ["sole legal custody"],
+        "confidence": 0.95
+    },
+    {
+        "term": "Holiday Schedule",
+        "value": "Alternating Holidays",
+        "phrases": ["alternate", "alternating"],
+        "requires": [["holiday", "holidays"]],
+        "confidence": 0.85
+    },
+    {
+        "term": "Right of First Refusal",
+        "value": "Right of First Refusal",
+        "phrases": ["right of first refusal"],
+        "confidence": 0.9
+    },
+    {
+        "term": "Exchange Notice",
+        "value": "Advance notice required",
+        "regex": [r"\b\d{1,3}\s*(?:hours?|days?)(?:'|\u2019)?\s*(?:advance\s+|prior\s+|written\s+)*notice\b"],
+        "confidence": 0.8
+    },
+]
+
+# Optional JSON file of extra rules, appended after the built-in ones
+CONTRACT_RULES_FILE = os.getenv("CONTRACT_RULES_FILE")
+
+# Bump whenever parsing changes what it extracts, so cached results are redone.
+# 2: single-pass rule engine
+CONTRACT_PARSER_VERSION = 2
+
+_term_extractor: Optional[TermExtractor] = None
+_parser_key: Optional[str] = None
+
+
+def load_contract_rules() -> List[Dict[str, Any]]:
+    rules = list(CONTRACT_TERM_RULES)
+    if CONTRACT_RULES_FILE:
+        try:
+            with open(CONTRACT_RULES_FILE) as f:
+                rules.extend(json.load(f))
+        except Exception as e:
+            print(f"Warning: Could not load contract rules from {CONTRACT_RULES_FILE}: {e}")
+    return rules
+
+
+def get_term_extractor() -> TermExtractor:
+    """Compile the rule set once per process"""
+    global _term_extractor
+    if _term_extractor is None:
+        _term_extractor = TermExtractor(load_contract_rules())
+    return _term_extractor
+
+
+def parser_key() -> str:
+    """Identifies the parser version and rule set a result came from"""
+    global _parser_key
+    if _parser_key is None:
+        rules = json.dumps(load_contract_rules(), sort_keys=True, separators=(",", ":"))
+        _parser_key = f"{CONTRACT_PARSER_VERSION}:{hashlib.sha256(rules.encode('utf-8')).hexdigest()[:16]}"
+    return _parser_key
+
+
+def iter_contract_pages(content: bytes, file_name: str) -> Iterator[Tuple[int, str]]:
+    """Yield the pages of an uploaded contract, falling back to a plain decode"""
+    if is_extractable(file_name):
+        yielded = False
+        try:
+            for page in extract_pages(content, file_name):
+                yielded = True
+                yield page
+            return
+        except Exception as e:
+            print(f"Warning: Could not extract text from {file_name}: {e}")
+            if yielded:
+                return
+    yield 1, content.decode('utf-8', errors='ignore')
+
+
+def extract_contract_text(content: bytes, file_name: str) -> str:
+    """Extract the text of an uploaded contract, falling back to a plain decode"""
+    return "\n".join(text for _, text in iter_contract_pages(content, file_name))
+
+
+def parse_contract_pages(pages: Iterable[Tuple[int, str]], file_type: str):
+    """
+    Simulate AI parsing of custody agreement.
+    In production, this would use GPT-4, Claude, or a specialized legal AI.
+    Known terms are picked out in a single pass by the rule engine.
+    """
+    terms = get_term_extractor().extract(pages)
+
+    parsed_data = {
+        "parsed": True,
+        "confidence": 0.85,
+        "extractedTerms": [
+            {
+                "term": t["term"],
+                "value": t["value"],
+                "confidence": t["confidence"],
+                "occurrences": t["occurrences"],
+                "matches": t["matches"]
+            }
+            for t in terms
+        ]
+    }
+
+    split = find_term(terms, "Custody Split")
+    expense_split = (split.get("data") or {}).get("expenseSplit") if split else None
+    schedule = find_term(terms, "Custody Schedule")
+    holidays = find_term(terms, "Holiday Schedule")
+    legal = find_term(terms, "Legal Custody")
+
+    return {
+        "custodySchedule": schedule["value"] if schedule else "Extracted from agreement",
+        "holidaySchedule": holidays["value"] if holidays else "Alternating holidays as specified",
+        "decisionMaking": legal["value"] if legal else "Joint legal custody",
+        "expenseSplit": expense_split or {"ratio": "custom", "parent1": 50, "parent2": 50},
+        "parsedData": parsed_data
+    }
+
+
+def parse_contract_with_ai(file_content: str, file_type: str):
+    return parse_contract_pages([(1, file_content)], file_type)
+
+
+def parse_contract_file(content: bytes, file_name: str, file_type: str):
+    """Extract and parse a contract page by page. This is the unit of work run in the process pool"""
+    if CONTRACT_MODEL_LATENCY:
+        time.sleep(CONTRACT_MODEL_LATENCY)
+    return parse_contract_pages(iter_contract_pages(content, file_name), file_type)
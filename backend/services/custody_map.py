@@ -0,0 +1,207 @@
+"""
+Who-has-custody lookups.
+
+For each family a compact day -> parent map is precomputed over a rolling
+window (one year back, two years ahead) from the recurring schedule, its
+exceptions and stored custody events. The map is a bytearray with one byte
+per day holding a parent code, so a point lookup is an index and range
+statistics are bytes.count() over a slice.
+
+Maps are cached per process and stamped with the family's calendar sequence
+number (the counter every calendar write bumps through record_calendar_change).
+A lookup that finds the counter has moved, whichever worker moved it, rebuilds
+the map; the writing worker also patches its own copy in place, so callers can
+ask "who has the children on this date" at the cost of one counter read.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from database import db
+from services.calendar_sync import current_sequence
+from services.custody_schedule import load_family_schedule, to_datetime
+
+WINDOW_DAYS_BEFORE = 366
+WINDOW_DAYS_AFTER = 366 * 2
+
+MAX_CACHED_FAMILIES = 1024
+
+UNKNOWN = 0
+BOTH = "both"
+
+
+class CustodyMap:
+    """Day -> parent codes for one family over [start, start + len(days))"""
+
+    def __init__(self, family_id: str, start: date, days: bytearray, parents: List[Optional[str]], seq: int = 0):
+        self.family_id = family_id
+        self.start = start
+        self.days = days
+        # Code 0 is unknown; codes 1.. index into this list
+        self.parents = parents
+        # The calendar sequence number read before the map was built
+        self.seq = seq
+        self.built_on = datetime.utcnow().date()
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=len(self.days))
+
+    def covers(self, day: date) -> bool:
+        return self.start <= day < self.end
+
+    def code_for(self, parent: Optional[str]) -> int:
+        if parent is None:
+            return UNKNOWN
+        if parent not in self.parents:
+            self.parents.append(parent)
+        return self.parents.index(parent)
+
+    def parent_on(self, day: date) -> Optional[str]:
+        return self.parents[self.days[(day - self.start).days]]
+
+    def set_day(self, day: date, parent: Optional[str]):
+        if self.covers(day):
+            self.days[(day - self.start).days] = self.code_for(parent)
+
+    def counts(self, start: date, end: date) -> Dict[str, int]:
+        """Days assigned to each parent in [start, end), clipped to the window"""
+        low = max((start - self.start).days, 0)
+        high = min((end - self.start).days, len(self.days))
+        segment = bytes(self.days[low:high]) if high > low else b""
+        return {
+            parent: segment.count(bytes([code]))
+            for code, parent in enumerate(self.parents)
+            if parent is not None
+        }
+
+
+_maps: "OrderedDict[str, CustodyMap]" = OrderedDict()
+_maps_lock = threading.Lock()
+
+
+def _resolve_days(family_id: str, start: date, end: date) -> Dict[date, Optional[str]]:
+    """Who has custody on each day of [start, end), from rules, custody events and exceptions"""
+    schedule = load_family_schedule(family_id, start, end)
+    days = {day: entry["parent"] for day, entry in schedule.items()}
+
+    # Explicit custody events fill in or override rule days, but not exceptions
+    custody_events = db.events.find({
+        "family_id": family_id,
+        "date": {"$gte": to_datetime(start), "$lt": to_datetime(end)},
+        "type": "custody"
+    })
+    for event in custody_events:
+        if not event.get("parent"):
+            continue
+        day = event["date"].date()
+        if schedule.get(day, {}).get("source") != "exception":
+            days[day] = event["parent"]
+    return days
+
+
+def build_custody_map(family_id: str, today: Optional[date] = None, seq: int = 0) -> CustodyMap:
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=WINDOW_DAYS_BEFORE)
+    end = today + timedelta(days=WINDOW_DAYS_AFTER)
+
+    custody_map = CustodyMap(family_id, start, bytearray((end - start).days), [None], seq)
+    for day, parent in _resolve_days(family_id, start, end).items():
+        custody_map.set_day(day, parent)
+    return custody_map
+
+
+def _is_current(custody_map: Optional[CustodyMap], seq: int) -> bool:
+    # The window rolls forward once a day
+    return custody_map is not None and custody_map.seq == seq and custody_map.built_on == datetime.utcnow().date()
+
+
+def get_custody_map(family_id: str) -> CustodyMap:
+    # Read before building: a write that lands during the build moves the counter past the stamp
+    seq = current_sequence(family_id)
+    with _maps_lock:
+        custody_map = _maps.get(family_id)
+        if _is_current(custody_map, seq):
+            _maps.move_to_end(family_id)
+            return custody_map
+
+    custody_map = build_custody_map(family_id, seq=seq)
+    with _maps_lock:
+        installed = _maps.get(family_id)
+        if installed is not None and installed.seq > seq and installed.built_on == custody_map.built_on:
+            # A build that started after ours got there first and has seen more writes
+            return installed
+        _maps[family_id] = custody_map
+        _maps.move_to_end(family_id)
+        while len(_maps) > MAX_CACHED_FAMILIES:
+            _maps.popitem(last=False)
+    return custody_map
+
+
+def parent_on(family_id: str, day: date) -> Optional[str]:
+    """The parent with custody on a day, or None if the schedule doesn't say"""
+    custody_map = get_custody_map(family_id)
+    if custody_map.covers(day):
+        return custody_map.parent_on(day)
+    # Outside the window, resolve the single day directly
+    return _resolve_days(family_id, day, day + timedelta(days=1)).get(day)
+
+
+def custody_stats(family_id: str, start: date, end: date) -> Dict[str, Any]:
+    """Nights and percentage time-share per parent over [start, end)"""
+    custody_map = get_custody_map(family_id)
+    counts = custody_map.counts(start, end)
+
+    # Days outside the window are resolved directly; stats rarely reach that far
+    outside = []
+    if start < custody_map.start:
+        outside.append((start, min(end, custody_map.start)))
+    if end > custody_map.end:
+        outside.append((max(start, custody_map.end), end))
+    for outside_start, outside_end in outside:
+        for parent in _resolve_days(family_id, outside_start, outside_end).values():
+            if parent is not None:
+                counts[parent] = counts.get(parent, 0) + 1
+
+    assigned = sum(count for parent, count in counts.items() if parent != BOTH)
+    total_days = (end - start).days
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "totalDays": total_days,
+        "unassignedDays": total_days - sum(counts.values()),
+        "nights": {parent: count for parent, count in counts.items() if count},
+        "percentages": {
+            parent: round(count * 100 / assigned, 1)
+            for parent, count in counts.items()
+            if count and parent != BOTH and assigned
+        }
+    }
+
+
+def refresh_custody_days(family_id: str, start: date, end: date):
+    """Recompute [start, end) in this process's cached map after events or exceptions change"""
+    with _maps_lock:
+        custody_map = _maps.get(family_id)
+    if custody_map is None:
+        return
+
+    start, end = max(start, custody_map.start), min(end, custody_map.end)
+    if start >= end:
+        return
+    days = _resolve_days(family_id, start, end)
+    with _maps_lock:
+        if _maps.get(family_id) is not custody_map:
+            # Replaced by a rebuild meanwhile, which read the change itself
+            return
+        day = start
+        while day < end:
+            custody_map.set_day(day, days.get(day))
+            day += timedelta(days=1)
+
+
+def invalidate_custody_map(family_id: str):
+    """Drop a cached map after rules change, so the next lookup rebuilds it"""
+    with _maps_lock:
+        _maps.pop(family_id, None)
@@ -0,0 +1,314 @@
+"""
+Recurring custody schedules.
+
+A family's custody calendar is described by a handful of rule records rather
+than one event per day:
+
+- base rules repeat a fixed cycle ("AABBAAA BBAABBB" for 2-2-3) from a start
+  date, like an RRULE with FREQ=DAILY over a cycle of parents;
+- holiday rules override the base pattern every year on a fixed date or the
+  nth weekday of a month, optionally alternating between parents;
+- exceptions override single days, e.g. an approved swap.
+
+Days are only expanded for the range being asked for, so a year of custody
+costs a few records, and precedence is exception > holiday > base.
+"""
+import calendar as calendar_module
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from database import db
+
+# Cycles are written with A = parents[0] and B = parents[1], one letter per day
+PATTERN_CYCLES = {
+    "week-on-week-off": "AAAAAAA" "BBBBBBB",
+    "2-2-3": "AABBAAA" "BBAABBB",
+    "2-2-5-5": "AABBAAA" "AABBBBB",
+    # Starts on a Monday: B has every other Friday-Sunday
+    "alternating-weekends": "AAAABBB" "AAAAAAA",
+}
+
+# Phrases in a custody agreement or arrangement that name a pattern
+PATTERN_KEYWORDS = [
+    ("2-2-5-5", ["2-2-5-5", "5-2-2-5"]),
+    ("2-2-3", ["2-2-3", "2/2/3"]),
+    ("week-on-week-off", ["week on", "week-on", "alternating weeks", "alternate weeks"]),
+    ("alternating-weekends", ["every other weekend", "alternating weekends", "alternate weekends"]),
+]
+
+CUSTODY_EVENT_PREFIX = "custody:"
+
+# Who A and B are when a rule doesn't say, matching CustodyRuleCreate
+DEFAULT_PARENTS = ("mom", "dad")
+
+
+def ensure_schedule_indexes():
+    try:
+        db.custody_rules.create_index([("family_id", 1), ("kind", 1)])
+        db.custody_exceptions.create_index([("family_id", 1), ("date", 1)])
+    except Exception as e:
+        print(f"⚠️  Could not create custody schedule indexes: {e}")
+
+
+def to_datetime(day: date) -> datetime:
+    """Rule dates are stored as midnight datetimes, which Mongo can store"""
+    return datetime(day.year, day.month, day.day)
+
+
+def to_date(value: Any) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+
+def pattern_from_text(text: Optional[str]) -> Optional[str]:
+    """Recognise a named pattern in free text such as Family.custodyArrangement"""
+    if not text:
+        return None
+    text = text.lower()
+    for pattern, keywords in PATTERN_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return pattern
+    return None
+
+
+def cycle_for(rule: Dict[str, Any]) -> str:
+    cycle = rule.get("cycle") if rule.get("pattern") == "custom" else PATTERN_CYCLES.get(rule.get("pattern"))
+    if not cycle:
+        raise ValueError(f"Unknown custody pattern: {rule.get('pattern')}")
+    cycle = "".join(cycle.split()).upper()
+    if set(cycle) - {"A", "B"}:
+        raise ValueError("Custom cycles may only contain A and B")
+    return cycle
+
+
+def rule_anchor(rule: Dict[str, Any]) -> date:
+    anchor = to_date(rule["startDate"])
+    if rule.get("pattern") == "alternating-weekends":
+        # The cycle is written from a Monday
+        anchor -= timedelta(days=anchor.weekday())
+    return anchor
+
+
+def validate_rule(rule: Dict[str, Any]):
+    """Raise ValueError if a rule can't be expanded"""
+    if len(rule.get("parents") or []) != 2:
+        raise ValueError("A rule needs exactly two parents")
+    if rule.get("kind") == "base":
+        cycle_for(rule)
+        if rule.get("untilDate") and to_date(rule["untilDate"]) <= to_date(rule["startDate"]):
+            raise ValueError("untilDate must be after startDate")
+    elif rule.get("kind") == "holiday":
+        if not rule.get("month") or not 1 <= rule["month"] <= 12:
+            raise ValueError("Holiday rules need a month between 1 and 12")
+        if rule.get("weekday") is not None:
+            if not 0 <= rule["weekday"] <= 6 or rule.get("nth") not in (1, 2, 3, 4, 5, -1):
+                raise ValueError("Weekday holidays need weekday 0-6 and nth 1-5 or -1")
+        elif not rule.get("day"):
+            raise ValueError("Holiday rules need a day, or a weekday and nth")
+        if rule.get("durationDays", 1) < 1:
+            raise ValueError("durationDays must be at least 1")
+    else:
+        raise ValueError("kind must be 'base' or 'holiday'")
+
+
+def holiday_start(rule: Dict[str, Any], year: int) -> Optional[date]:
+    """The first day of a holiday rule in a given year"""
+    month = rule["month"]
+    if rule.get("weekday") is None:
+        try:
+            return date(year, month, rule["day"])
+        except ValueError:
+            # e.g. February 29th in a non-leap year
+            return None
+
+    weeks = [week[rule["weekday"]] for week in calendar_module.monthcalendar(year, month) if week[rule["weekday"]]]
+    nth = rule["nth"]
+    if nth == -1:
+        return date(year, month, weeks[-1])
+    if nth > len(weeks):
+        return None
+    return date(year, month, weeks[nth - 1])
+
+
+def expand_base_rules(rules: List[Dict[str, Any]], start: date, end: date) -> Iterator[Tuple[date, str, Dict[str, Any]]]:
+    """Yield (day, parent, rule) for [start, end). A later rule takes over from the day it starts"""
+    rules = sorted(rules, key=lambda rule: to_date(rule["startDate"]))
+    for index, rule in enumerate(rules):
+        rule_start = to_date(rule["startDate"])
+        rule_end = to_date(rule.get("untilDate")) or date.max
+        if index + 1 < len(rules):
+            rule_end = min(rule_end, to_date(rules[index + 1]["startDate"]))
+
+        cycle = cycle_for(rule)
+        anchor = rule_anchor(rule)
+        day = max(start, rule_start)
+        while day < min(end, rule_end):
+            token = cycle[(day - anchor).days % len(cycle)]
+            yield day, rule["parents"][0 if token == "A" else 1], rule
+            day += timedelta(days=1)
+
+
+def expand_holiday_rules(rules: List[Dict[str, Any]], start: date, end: date) -> Iterator[Tuple[date, str, Dict[str, Any]]]:
+    for rule in rules:
+        first_year = to_date(rule["startDate"]).year
+        # A holiday that starts late in December can run into the next year
+        for year in range(max(start.year - 1, first_year), end.year + 1):
+            first_day = holiday_start(rule, year)
+            if first_day is None or first_day < to_date(rule["startDate"]):
+                continue
+            if rule.get("untilDate") and first_day >= to_date(rule["untilDate"]):
+                continue
+            if rule.get("alternate", True):
+                parent = rule["parents"][(year - first_year) % 2]
+            else:
+                parent = rule["parents"][0]
+            for offset in range(rule.get("durationDays", 1)):
+                day = first_day + timedelta(days=offset)
+                if start <= day < end:
+                    yield day, parent, rule
+
+
+def expand_schedule(
+    rules: List[Dict[str, Any]],
+    exceptions: List[Dict[str, Any]],
+    start: date,
+    end: date
+) -> Dict[date, Dict[str, Any]]:
+    """Resolve who has custody on each day of [start, end)"""
+    days: Dict[date, Dict[str, Any]] = {}
+    base_rules = [rule for rule in rules if rule.get("kind", "base") == "base"]
+    holiday_rules = [rule for rule in rules if rule.get("kind") == "holiday"]
+
+    for day, parent, rule in expand_base_rules(base_rules, start, end):
+        days[day] = {"parent": parent, "source": "base", "rule": rule}
+    for day, parent, rule in expand_holiday_rules(holiday_rules, start, end):
+        days[day] = {"parent": parent, "source": "holiday", "rule": rule}
+    for exception in exceptions:
+        day = to_date(exception["date"])
+        if start <= day < end:
+            days[day] = {"parent": exception["parent"], "source": "exception", "exception": exception}
+
+    return days
+
+
+def load_family_schedule(family_id: str, start: date, end: date) -> Dict[date, Dict[str, Any]]:
+    """Expand a family's rules and exceptions for [start, end)"""
+    rules = list(db.custody_rules.find({"family_id": family_id}))
+    # Exceptions apply even before the family has set up any rules
+    exceptions = list(db.custody_exceptions.find({
+        "family_id": family_id,
+        "date": {"$gte": to_datetime(start), "$lt": to_datetime(end)}
+    }))
+    return expand_schedule(rules, exceptions, start, end)
+
+
+def custody_event_id(day: date) -> str:
+    return f"{CUSTODY_EVENT_PREFIX}{day.isoformat()}"
+
+
+def parse_custody_event_id(event_id: str) -> Optional[date]:
+    """The day a virtual custody event stands for, or None for a stored event id"""
+    if not event_id.startswith(CUSTODY_EVENT_PREFIX):
+        return None
+    try:
+        return date.fromisoformat(event_id[len(CUSTODY_EVENT_PREFIX):])
+    except ValueError:
+        return None
+
+
+def custody_events(family_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Virtual per-day custody events for a datetime range, shaped like stored events"""
+    first_day = start.date() if start.time() == datetime.min.time() else start.date() + timedelta(days=1)
+    last_day = end.date() if end.time() == datetime.min.time() else end.date() + timedelta(days=1)
+    schedule = load_family_schedule(family_id, first_day, last_day)
+
+    events = []
+    for day in sorted(schedule):
+        entry = schedule[day]
+        if entry["source"] == "exception":
+            title = entry["exception"].get("reason") or "Schedule change"
+            event_type = "custody"
+        elif entry["source"] == "holiday":
+            title = entry["rule"].get("title") or "Holiday"
+            event_type = "holiday"
+        else:
+            title = entry["rule"].get("title") or "Custody"
+            event_type = "custody"
+
+        events.append({
+            "id": custody_event_id(day),
+            "family_id": family_id,
+            "date": to_datetime(day),
+            "type": event_type,
+            "title": title,
+            "parent": entry["parent"],
+            "isSwappable": True,
+            "recurring": True
+        })
+    return events
+
+
+def schedule_parents(family_id: str) -> List[str]:
+    """The parents a family's schedule can assign days to: those named by its rules, or the default pair"""
+    parents: List[str] = []
+    for rule in db.custody_rules.find({"family_id": family_id}):
+        parents += [parent for parent in rule.get("parents", []) if parent not in parents]
+    return parents or list(DEFAULT_PARENTS)
+
+
+def other_parent(family_id: str, parent: str) -> Optional[str]:
+    """The parent a custody day would be swapped to, taken from the family's rules"""
+    for rule in db.custody_rules.find({"family_id": family_id}):
+        if parent in rule.get("parents", []):
+            return next((p for p in rule["parents"] if p != parent), None)
+    return None
+
+
+def add_exception(family_id: str, day: date, parent: str, reason: Optional[str] = None,
+                  change_request_id: Optional[str] = None, created_by: Optional[str] = None) -> Dict[str, Any]:
+    """Override one day, replacing any earlier exception for that day"""
+    db.custody_exceptions.delete_many({"family_id": family_id, "date": to_datetime(day)})
+    exception = {
+        "id": f"{family_id}:{day.isoformat()}",
+        "family_id": family_id,
+        "date": to_datetime(day),
+        "parent": parent,
+        "reason": reason,
+        "change_request_id": change_request_id,
+        "created_by_email": created_by,
+        "createdAt": datetime.utcnow()
+    }
+    db.custody_exceptions.insert_one(exception)
+    return exception
+
+
+def apply_custody_swap(family_id: str, change_request: Dict[str, Any], approved_by: str) -> List[Dict[str, Any]]:
+    """
+    Record an approved change to a custody day as exceptions. The original day
+    goes to the other parent and, if a new date was requested, that day goes to
+    the parent who had the original one.
+    """
+    day = parse_custody_event_id(change_request["event_id"])
+    schedule = load_family_schedule(family_id, day, day + timedelta(days=1))
+    if day not in schedule:
+        return []
+
+    parent = schedule[day]["parent"]
+    swapped_to = other_parent(family_id, parent)
+    if not swapped_to:
+        return []
+
+    reason = change_request.get("reason") or "Approved change request"
+    exceptions = [add_exception(family_id, day, swapped_to, reason, change_request["id"], approved_by)]
+    if change_request.get("requestedDate"):
+        requested_day = to_date(change_request["requestedDate"])
+        exceptions.append(add_exception(family_id, requested_day, parent, reason, change_request["id"], approved_by))
+    return exceptions
+
+
+ensure_schedule_indexes()
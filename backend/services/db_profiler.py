@@ -0,0 +1,176 @@
+"""
+Database operation profiler and slow-query log.
+
+Every operation database.py reports is grouped by its query shape: the
+collection, the operation and the filter with its values replaced by "?", so
+{"family_id": "abc", "date": {"$gte": ...}} and the same query for another
+family share one entry. Each shape keeps its count, time, documents scanned and
+returned (scanned is only known for the in-memory store) and the routes that
+issue it; the admin profile endpoint ranks them.
+
+Operations slower than SLOW_QUERY_MS go to the slow-query log, one JSON object
+per line, in SLOW_QUERY_LOG or on stdout. A filter on no field that leads an
+index declared through create_index (or _id) is an unindexed scan and is warned
+about once per shape. Indexes that exist in Mongo but are not declared by the
+app are not known to the check.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, Set
+
+from database import add_operation_observer, declared_indexes
+from services.metrics import current_route
+
+PROFILER_ENABLED = os.getenv("DB_PROFILER", "1") != "0"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG")
+# Least recently seen shapes are dropped beyond this
+MAX_SHAPES = 500
+RECENT_SLOW_QUERIES = 100
+MAX_ROUTES_PER_SHAPE = 10
+
+BACKGROUND_ROUTE = "<background>"
+LOGICAL_OPERATORS = ("$or", "$and", "$nor")
+# Conditions an index cannot narrow a scan with
+NON_SELECTIVE_OPERATORS = {"$ne", "$nin", "$not", "$exists"}
+
+SORTS = {"time": "totalMs", "count": "count", "max": "maxMs", "scanned": "scanned"}
+
+_lock = threading.Lock()
+_shapes: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_slow_queries: deque = deque(maxlen=RECENT_SLOW_QUERIES)
+_warned: Set[tuple] = set()
+_since = datetime.utcnow()
+
+
+def _shape_value(key: str, value: Any) -> Any:
+    if key in LOGICAL_OPERATORS:
+        return [filter_shape(condition) for condition in value]
+    if isinstance(value, dict) and any(operator.startswith("$") for operator in value):
+        return {
+            operator: filter_shape(operand) if operator in ("$elemMatch", "$not") and isinstance(operand, dict) else "?"
+            for operator, operand in sorted(value.items())
+        }
+    return "?"
+
+
+def filter_shape(query: Dict[str, Any]) -> Dict[str, Any]:
+    """The filter with every value replaced by "?", keeping field names and operators"""
+    return {key: _shape_value(key, value) for key, value in sorted(query.items())}
+
+
+def _constrained_fields(query: Dict[str, Any]) -> Set[str]:
+    fields = set()
+    for key, value in query.items():
+        if key == "$and":
+            for condition in value:
+                fields |= _constrained_fields(condition)
+        elif key.startswith("$"):
+            continue
+        elif isinstance(value, dict) and value and set(value) <= NON_SELECTIVE_OPERATORS:
+            continue
+        else:
+            fields.add(key)
+    return fields
+
+
+def uses_index(collection: str, query: Dict[str, Any]) -> bool:
+    """Whether some declared index (or _id) can narrow the scan for this filter"""
+    if "$or" in query and all(uses_index(collection, condition) for condition in query["$or"]):
+        return True
+    leading = {"_id"} | {keys[0] for keys in declared_indexes.get(collection, ()) if keys}
+    return bool(_constrained_fields(query) & leading)
+
+
+def _write_slow_query(entry: Dict[str, Any]):
+    line = json.dumps(entry, separators=(",", ":"))
+    if not SLOW_QUERY_LOG:
+        print(f"SLOW_QUERY {line}")
+        return
+    try:
+        with open(SLOW_QUERY_LOG, "a", encoding="utf-8") as log:
+            log.write(line + "\n")
+    except OSError as e:
+        print(f"⚠️  Could not write slow-query log: {e}")
+
+
+def _record_operation(event):
+    route = current_route() or BACKGROUND_ROUTE
+    shape = json.dumps(filter_shape(event.filter), separators=(",", ":")) if event.filter is not None else "-"
+    # An empty filter is a deliberate full read (listings, exports), not a missing index
+    indexed = uses_index(event.collection, event.filter) if event.filter else None
+    key = (event.collection, event.operation, shape)
+    ms = event.seconds * 1000
+
+    with _lock:
+        stats = _shapes.get(key)
+        if stats is None:
+            stats = _shapes[key] = {
+                "collection": event.collection, "operation": event.operation, "shape": shape, "indexed": indexed,
+                "count": 0, "errors": 0, "totalMs": 0.0, "maxMs": 0.0, "scanned": 0, "returned": 0, "routes": {},
+            }
+            if len(_shapes) > MAX_SHAPES:
+                _shapes.popitem(last=False)
+        else:
+            _shapes.move_to_end(key)
+        stats["count"] += 1
+        stats["errors"] += int(event.failed)
+        stats["totalMs"] += ms
+        stats["maxMs"] = max(stats["maxMs"], ms)
+        stats["scanned"] += event.scanned or 0
+        stats["returned"] += event.returned or 0
+        stats["lastSeen"] = datetime.utcnow().isoformat()
+        if route in stats["routes"] or len(stats["routes"]) < MAX_ROUTES_PER_SHAPE:
+            stats["routes"][route] = stats["routes"].get(route, 0) + 1
+        warn = indexed is False and key not in _warned
+        if warn:
+            _warned.add(key)
+
+    if warn:
+        print(f"⚠️  Unindexed {event.operation} on {event.collection} {shape} from {route}")
+    if ms >= SLOW_QUERY_MS:
+        entry = {
+            "at": datetime.utcnow().isoformat(), "collection": event.collection, "operation": event.operation,
+            "shape": shape, "ms": round(ms, 3), "scanned": event.scanned, "returned": event.returned,
+            "indexed": indexed, "failed": event.failed, "route": route,
+        }
+        _slow_queries.append(entry)
+        _write_slow_query(entry)
+
+
+def get_profile(sort: str = "time", limit: int = 20) -> Dict[str, Any]:
+    """The top shapes by the given measure, unindexed shapes and the most recent slow queries"""
+    field = SORTS[sort]
+    with _lock:
+        shapes = [dict(stats, routes=dict(stats["routes"])) for stats in _shapes.values()]
+        slow = list(_slow_queries)
+    for stats in shapes:
+        stats["avgMs"] = round(stats["totalMs"] / stats["count"], 3)
+        stats["totalMs"] = round(stats["totalMs"], 3)
+        stats["maxMs"] = round(stats["maxMs"], 3)
+    shapes.sort(key=lambda stats: stats[field], reverse=True)
+    return {
+        "since": _since.isoformat(),
+        "enabled": PROFILER_ENABLED,
+        "slowQueryMs": SLOW_QUERY_MS,
+        "shapeCount": len(shapes),
+        "top": shapes[:limit],
+        "unindexed": [stats for stats in shapes if stats["indexed"] is False][:limit],
+        "slowQueries": slow[::-1][:limit],
+    }
+
+
+def reset_profile():
+    global _since
+    with _lock:
+        _shapes.clear()
+        _slow_queries.clear()
+        _warned.clear()
+        _since = datetime.utcnow()
+
+
+if PROFILER_ENABLED:
+    add_operation_observer(_record_operation)
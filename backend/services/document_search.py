@@ -0,0 +1,373 @@
+"""
+Background text extraction and full-text search for family documents.
+
+Extracted pages live in `document_pages` and the inverted index lives in
+`document_terms` as one posting per (family, term, document, page). Postings
+are written page by page as extraction progresses and removed when the
+document is deleted, so a search only reads the postings for its own terms
+through the (family_id, term) index no matter how large the archive grows.
+
+Parsing a PDF or DOCX is CPU-bound and would hold the GIL against the API, so
+a small thread pool drives each extraction and hands the parsing itself to a
+process pool, as contract parsing does; the threads only write the index.
+
+A document stays `processing` until it is indexed. Each queued extraction
+stamps the document with an extraction id and only runs if the stamp is still
+its own, so when a process stops with documents in flight, a recovery loop in
+any process can claim ones left untouched too long, read the file back from
+storage and queue them again, or mark them needs-review if the file is gone.
+"""
+import math
+import multiprocessing
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database import db
+from services.storage import storage
+from services.text_extraction import extract_all_pages, extract_pages, is_extractable
+
+EXTRACTION_WORKERS = int(os.getenv("DOCUMENT_EXTRACTION_WORKERS", "2"))
+EXTRACTION_TIMEOUT = float(os.getenv("DOCUMENT_EXTRACTION_TIMEOUT", "120"))
+# How long a replaced pool's workers get to finish before they are killed
+POOL_SHUTDOWN_GRACE = 5
+# A document processing for longer than this has lost its process and is queued again
+EXTRACTION_STALE_AFTER = timedelta(seconds=max(EXTRACTION_TIMEOUT * 5, 600))
+RECOVERY_INTERVAL_SECONDS = 60
+SNIPPET_RADIUS = 80
+MAX_SNIPPETS_PER_DOCUMENT = 3
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with",
+}
+
+_executor = ThreadPoolExecutor(max_workers=max(EXTRACTION_WORKERS, 1), thread_name_prefix="document-extraction")
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+_recovery_started = False
+
+
+def ensure_search_indexes():
+    """Create the indexes the search path relies on"""
+    try:
+        db.document_terms.create_index([("family_id", 1), ("term", 1)])
+        db.document_terms.create_index([("document_id", 1)])
+        db.document_pages.create_index([("document_id", 1), ("page", 1)])
+        db.documents.create_index([("status", 1)])
+    except Exception as e:
+        print(f"⚠️  Could not create document search indexes: {e}")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase search terms, dropping stop words"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def _get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Lazily start the process pool. DOCUMENT_EXTRACTION_WORKERS=0 extracts in the thread instead"""
+    global _process_pool
+    if EXTRACTION_WORKERS <= 0:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn avoids forking a process that already runs threads
+            _process_pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+def _terminate_workers(processes):
+    deadline = time.monotonic() + POOL_SHUTDOWN_GRACE
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+            process.join(1)
+        if process.is_alive():
+            process.kill()
+
+
+def _reset_process_pool(pool: ProcessPoolExecutor):
+    """Replace a pool with a hung or dead worker and kill whatever of it doesn't exit in time"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not pool:
+            # Another extraction already replaced it
+            return
+        _process_pool = None
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    threading.Thread(target=_terminate_workers, args=(processes,), name="extraction-pool-reaper", daemon=True).start()
+
+
+def _extract(content: bytes, file_name: str) -> Iterable[Tuple[int, str]]:
+    pool = _get_process_pool()
+    if pool is None:
+        return extract_pages(content, file_name)
+    try:
+        # The worker returns every page at once; only the index writes stay page by page
+        return pool.submit(extract_all_pages, content, file_name).result(timeout=EXTRACTION_TIMEOUT)
+    except (FutureTimeoutError, BrokenProcessPool):
+        _reset_process_pool(pool)
+        raise
+
+
+def document_storage_key(file_url: str) -> str:
+    """Resolve a document's API file URL to its storage key"""
+    return "documents/" + file_url.replace("/api/v1/documents/files/", "")
+
+
+def schedule_extraction(family_id: str, document_id: str, file_name: str, content: bytes) -> bool:
+    """Queue a document for background extraction. Returns False if the file type is not searchable"""
+    if not is_extractable(file_name):
+        return False
+    extraction_id = str(uuid.uuid4())
+    db.documents.update_one(
+        {"id": document_id},
+        {"$set": {"extraction_id": extraction_id, "updated_at": datetime.utcnow()}}
+    )
+    _executor.submit(_run_extraction, family_id, document_id, file_name, content, extraction_id)
+    return True
+
+
+def _run_extraction(family_id: str, document_id: str, file_name: str, content: bytes, extraction_id: str):
+    # Skip it if recovery handed the document to another process while it sat in the queue
+    started = db.documents.update_one(
+        {"id": document_id, "status": "processing", "extraction_id": extraction_id},
+        {"$set": {"updated_at": datetime.utcnow()}}
+    )
+    if started.matched_count == 0:
+        return
+
+    try:
+        page_count = index_document(family_id, document_id, file_name, content)
+
+        # The document may have been deleted while we were extracting it
+        if not db.documents.find_one({"id": document_id}):
+            remove_document(document_id)
+            return
+
+        db.documents.update_one(
+            {"id": document_id},
+            {"$set": {
+                "status": "processed",
+                "page_count": page_count,
+                "indexed_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            }}
+        )
+    except Exception as e:
+        print(f"[ERROR] Extract document {document_id}: {e}")
+        traceback.print_exc()
+        remove_document(document_id)
+        db.documents.update_one(
+            {"id": document_id},
+            {"$set": {"status": "needs-review", "updated_at": datetime.utcnow()}}
+        )
+
+
+def index_document(family_id: str, document_id: str, file_name: str, content: bytes) -> int:
+    """Extract a document page by page and add each page to the index. Returns the page count"""
+    # Drop anything a run that died part-way through left behind
+    remove_document(document_id)
+    page_count = 0
+    for page_number, text in _extract(content, file_name):
+        page_count = page_number
+        if not text.strip():
+            continue
+
+        db.document_pages.insert_one({
+            "family_id": family_id,
+            "document_id": document_id,
+            "page": page_number,
+            "text": text
+        })
+
+        term_counts = Counter(tokenize(text))
+        if term_counts:
+            db.document_terms.insert_many([
+                {
+                    "family_id": family_id,
+                    "term": term,
+                    "document_id": document_id,
+                    "page": page_number,
+                    "count": count
+                }
+                for term, count in term_counts.items()
+            ])
+    return page_count
+
+
+def remove_document(document_id: str):
+    """Drop a document's pages and postings from the index"""
+    db.document_terms.delete_many({"document_id": document_id})
+    db.document_pages.delete_many({"document_id": document_id})
+
+
+def build_snippet(text: str, terms: List[str]) -> str:
+    """Return a short window of text around the first matching term"""
+    pattern = re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")", re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(0, match.start() - SNIPPET_RADIUS) if match else 0
+    end = min(len(text), (match.end() if match else 0) + SNIPPET_RADIUS)
+
+    snippet = " ".join(text[start:end].split())
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(text):
+        snippet = snippet + "..."
+    return snippet
+
+
+def search_documents(
+    family_id: str,
+    query: str,
+    document_query: Dict[str, Any],
+    skip: int = 0,
+    limit: int = 20
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Search a family's documents for all terms in `query`.
+
+    `document_query` carries the folder/type filters applied to `db.documents`.
+    Returns the total number of matches and one page of results, each holding
+    the document, its score and page snippets.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return 0, []
+
+    # term -> document -> page -> count, read only from this family's postings
+    hits: Dict[str, Dict[str, Dict[int, int]]] = defaultdict(lambda: defaultdict(dict))
+    for posting in db.document_terms.find({"family_id": family_id, "term": {"$in": terms}}):
+        hits[posting["term"]][posting["document_id"]][posting["page"]] = posting["count"]
+
+    if len(hits) < len(terms):
+        return 0, []
+
+    # Every term must appear somewhere in the document
+    candidate_ids = set.intersection(*(set(documents) for documents in hits.values()))
+    if not candidate_ids:
+        return 0, []
+
+    total_documents = max(db.documents.count_documents({"family_id": family_id}), 1)
+    scores: Dict[str, float] = {}
+    page_hits: Dict[str, Counter] = {}
+    for document_id in candidate_ids:
+        score = 0.0
+        pages: Counter = Counter()
+        for term, documents in hits.items():
+            idf = math.log(1 + total_documents / len(documents))
+            term_frequency = sum(documents[document_id].values())
+            score += (1 + math.log(term_frequency)) * idf
+            pages.update(documents[document_id])
+        scores[document_id] = score
+        page_hits[document_id] = pages
+
+    documents = {
+        doc["id"]: doc
+        for doc in db.documents.find({**document_query, "id": {"$in": list(candidate_ids)}})
+    }
+    ranked = sorted(documents, key=lambda document_id: scores[document_id], reverse=True)
+    page_ids = ranked[skip:skip + limit]
+
+    # Only load page text for the results being returned
+    best_pages = {
+        document_id: [page for page, _ in page_hits[document_id].most_common(MAX_SNIPPETS_PER_DOCUMENT)]
+        for document_id in page_ids
+    }
+    wanted_pages = {page for pages in best_pages.values() for page in pages}
+    page_text: Dict[Tuple[str, int], str] = {}
+    if page_ids:
+        for page in db.document_pages.find({
+            "document_id": {"$in": page_ids},
+            "page": {"$in": list(wanted_pages)}
+        }):
+            page_text[(page["document_id"], page["page"])] = page.get("text", "")
+
+    results = []
+    for document_id in page_ids:
+        matches = [
+            {"page": page, "snippet": build_snippet(page_text[(document_id, page)], terms)}
+            for page in best_pages[document_id]
+            if (document_id, page) in page_text
+        ]
+        results.append({
+            "document": documents[document_id],
+            "score": round(scores[document_id], 4),
+            "matches": matches
+        })
+
+    return len(ranked), results
+
+
+# Recovery after a restart
+
+def recover_documents() -> int:
+    """Queue documents left processing by a stopped process again. Returns how many were claimed"""
+    now = datetime.utcnow()
+    claimed = 0
+    stale = db.documents.find({"status": "processing", "updated_at": {"$lt": now - EXTRACTION_STALE_AFTER}})
+    for document in list(stale):
+        # Claiming moves updated_at on, so only one process wins
+        won = db.documents.update_one(
+            {"id": document["id"], "status": "processing", "updated_at": document["updated_at"]},
+            {"$set": {"updated_at": now}}
+        )
+        if won.modified_count == 0:
+            continue
+        claimed += 1
+
+        try:
+            with storage.open(document_storage_key(document.get("file_url", ""))) as stored:
+                content = stored.read()
+        except (FileNotFoundError, ValueError):
+            print(f"⚠️  Document {document['id']} lost its file before it was indexed")
+            db.documents.update_one(
+                {"id": document["id"]},
+                {"$set": {"status": "needs-review", "updated_at": now}}
+            )
+            continue
+        print(f"🔄 Re-queueing extraction of document {document['id']}")
+        schedule_extraction(document["family_id"], document["id"], document["file_name"], content)
+    return claimed
+
+
+def _run_recovery():
+    while True:
+        try:
+            recover_documents()
+        except Exception as e:
+            print(f"[ERROR] Document extraction recovery: {e}")
+            traceback.print_exc()
+        time.sleep(RECOVERY_INTERVAL_SECONDS)
+
+
+def start_extraction_recovery() -> bool:
+    """Check for stranded documents in a background thread. Returns False if already running"""
+    global _recovery_started
+    if _recovery_started:
+        return False
+    _recovery_started = True
+    threading.Thread(target=_run_recovery, name="extraction-recovery", daemon=True).start()
+    return True
+
+
+ensure_search_indexes()
@@ -0,0 +1,66 @@
+"""
+Static interval tree.
+
+Intervals are sorted by start and laid out as an implicit balanced binary
+tree over that array (the middle element of each range is the subtree
+root), with the maximum end of every subtree precomputed. An overlap query
+prunes subtrees that end before the query starts and subtrees that start
+after it ends, so it costs O(log n + k) for k results.
+
+The tree is immutable: rebuild it when the underlying data changes.
+"""
+from typing import Any, Generic, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+Value = TypeVar("Value")
+
+
+class IntervalTree(Generic[T, Value]):
+    def __init__(self, intervals: List[Tuple[T, T, Value]]):
+        """intervals are half-open (start, end, value) triples"""
+        self._intervals = sorted(intervals, key=lambda interval: interval[0])
+        self._starts = [interval[0] for interval in self._intervals]
+        self._max_end: List[Any] = [None] * len(self._intervals)
+        if self._intervals:
+            self._build(0, len(self._intervals))
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def _build(self, low: int, high: int) -> Any:
+        """Fill _max_end for the subtree rooted at the middle of [low, high) and return it"""
+        mid = (low + high) // 2
+        max_end = self._intervals[mid][1]
+        if low < mid:
+            max_end = max(max_end, self._build(low, mid))
+        if mid + 1 < high:
+            max_end = max(max_end, self._build(mid + 1, high))
+        self._max_end[mid] = max_end
+        return max_end
+
+    def overlapping(self, start: T, end: T) -> Iterator[Tuple[T, T, Value]]:
+        """Yield every interval that overlaps [start, end), in start order"""
+        if not self._intervals:
+            return
+        stack = [(0, len(self._intervals), False)]
+        while stack:
+            low, high, visited_left = stack.pop()
+            if low >= high:
+                continue
+            mid = (low + high) // 2
+            # Nothing in this subtree ends after the query starts
+            if self._max_end[mid] <= start:
+                continue
+            if not visited_left:
+                # Come back for the root and right side after the left subtree
+                stack.append((low, high, True))
+                stack.append((low, mid, False))
+                continue
+
+            interval = self._intervals[mid]
+            if interval[0] >= end:
+                # The root and everything to its right start too late
+                continue
+            if interval[1] > start:
+                yield interval
+            stack.append((mid + 1, high, False))
@@ -0,0 +1,155 @@
+"""
+Event-loop lag monitor.
+
+A task on the loop sleeps for LOOP_LAG_INTERVAL_MS at a time and records how
+late it wakes up: that lag is how long some other code held the loop, e.g.
+synchronous pymongo calls, bcrypt or large base64 decodes inside `async def`
+handlers. Lag feeds a histogram and rolling p50/p90/p99 gauges on /metrics, and
+lag over LOOP_BLOCK_THRESHOLD_MS counts as a blocked loop.
+
+In debug mode (LOOP_MONITOR_DEBUG=1, or asyncio debug mode via
+PYTHONASYNCIODEBUG=1 / python -X dev) a watchdog thread also notices a loop
+that has stopped waking up and reports the running task and the loop thread's
+stack while the blocking call is still on it.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from services.metrics import Counter, Gauge, Histogram, register
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+LOOP_MONITOR_DEBUG = os.getenv("LOOP_MONITOR_DEBUG") == "1"
+# Percentiles cover roughly the last minute at the default interval
+LAG_WINDOW = 600
+QUANTILES = (0.5, 0.9, 0.99)
+RECENT_BLOCKS = 20
+STACK_DEPTH = 30
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+event_loop_lag = register(Histogram(
+    "event_loop_lag_seconds", "How late the event loop monitor woke up", buckets=LAG_BUCKETS
+))
+event_loop_lag_quantiles = register(Gauge(
+    "event_loop_lag_quantile_seconds", "Event loop lag percentiles over the recent window", ("quantile",)
+))
+event_loop_blocked = register(Counter(
+    "event_loop_blocked_total", "Times the event loop was held longer than the block threshold"
+))
+
+_lags: deque = deque(maxlen=LAG_WINDOW)
+_blocks: deque = deque(maxlen=RECENT_BLOCKS)
+_lock = threading.Lock()
+_task: Optional[asyncio.Task] = None
+_debug = False
+# time.monotonic() of the monitor's last wake-up, read by the watchdog
+_heartbeat = 0.0
+
+
+def _percentile(ordered: List[float], quantile: float) -> float:
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))] if ordered else 0.0
+
+
+def _record_lag(lag: float):
+    event_loop_lag.observe(value=lag)
+    with _lock:
+        _lags.append(lag)
+        refresh = len(_lags) % 10 == 0
+        if lag >= LOOP_BLOCK_THRESHOLD and _blocks and _blocks[-1]["lagMs"] is None:
+            # The watchdog's report for this stall, now that it is over
+            _blocks[-1]["lagMs"] = round(lag * 1000, 1)
+    if lag >= LOOP_BLOCK_THRESHOLD:
+        event_loop_blocked.inc()
+    if refresh:
+        with _lock:
+            ordered = sorted(_lags)
+        for quantile in QUANTILES:
+            event_loop_lag_quantiles.set(str(quantile), value=_percentile(ordered, quantile))
+
+
+async def _measure_lag():
+    global _heartbeat
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        _heartbeat = time.monotonic()
+        _record_lag(max(0.0, loop.time() - expected))
+
+
+def _describe_task(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "<no task: a loop callback>"
+    coro = task.get_coro()
+    return f"{task.get_name()} {getattr(coro, '__qualname__', repr(coro))}"
+
+
+def _watch(loop: asyncio.AbstractEventLoop, loop_thread_id: int):
+    """Debug mode: report what holds the loop while it is still holding it"""
+    reported = 0.0
+    while _task is not None and not _task.done():
+        time.sleep(LOOP_BLOCK_THRESHOLD / 2)
+        heartbeat = _heartbeat
+        stalled = time.monotonic() - heartbeat - LOOP_LAG_INTERVAL
+        if stalled < LOOP_BLOCK_THRESHOLD or heartbeat == reported:
+            continue
+        reported = heartbeat
+        frame = sys._current_frames().get(loop_thread_id)
+        stack = traceback.format_stack(frame, limit=STACK_DEPTH) if frame else []
+        block = {
+            "at": datetime.utcnow().isoformat(),
+            "blockedMs": round(stalled * 1000, 1),
+            "lagMs": None,
+            "task": _describe_task(asyncio.current_task(loop)),
+            "stack": [line.rstrip() for line in stack],
+        }
+        with _lock:
+            _blocks.append(block)
+        print(f"⚠️  Event loop blocked for over {block['blockedMs']}ms by {block['task']}\n" + "".join(stack))
+
+
+def start_loop_monitor() -> bool:
+    """Start measuring the running loop's lag. Returns False if already running"""
+    global _task, _debug, _heartbeat
+    if _task is not None and not _task.done():
+        return False
+    loop = asyncio.get_running_loop()
+    _debug = LOOP_MONITOR_DEBUG or loop.get_debug()
+    _heartbeat = time.monotonic()
+    _task = loop.create_task(_measure_lag(), name="loop-lag-monitor")
+    if _debug:
+        threading.Thread(target=_watch, args=(loop, threading.get_ident()), name="loop-watchdog", daemon=True).start()
+    return True
+
+
+def stop_loop_monitor():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+
+def get_loop_status() -> Dict[str, Any]:
+    with _lock:
+        ordered = sorted(_lags)
+        blocks = list(_blocks)
+    return {
+        "running": _task is not None and not _task.done(),
+        "debug": _debug,
+        "intervalMs": LOOP_LAG_INTERVAL * 1000,
+        "blockThresholdMs": LOOP_BLOCK_THRESHOLD * 1000,
+        "samples": len(ordered),
+        "lagMs": {
+            **{f"p{int(quantile * 100)}": round(_percentile(ordered, quantile) * 1000, 3) for quantile in QUANTILES},
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        },
+        "recentBlocks": blocks[::-1],
+    }
@@ -0,0 +1,91 @@
+"""
+Keyset (cursor) pagination.
+
+A page is ordered by one field plus _id as a tie-breaker, and the cursor is
+the (value, _id) of the last document on the previous page. The next page is
+"everything after that pair", which an index on (field, _id) answers without
+skipping over earlier pages, so page 500 costs the same as page 1.
+
+Sort fields should be ones every document has: Mongo's range operators
+never match missing values, so documents without one would be skipped.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """The cursor is malformed or was made for a different sort"""
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def _decode_id(value: str) -> Any:
+    if ObjectId is not None and ObjectId.is_valid(value) and len(value) == 24:
+        return ObjectId(value)
+    return value
+
+
+def encode_cursor(doc: Dict[str, Any], sort_field: str, direction: int) -> str:
+    payload = {"f": sort_field, "d": direction, "v": _encode_value(doc.get(sort_field)), "id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_field: str, direction: int) -> Tuple[Any, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if payload["f"] != sort_field or payload["d"] != direction:
+            raise InvalidCursor("Cursor was created with a different sort")
+        return _decode_value(payload["v"]), _decode_id(payload["id"])
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor("Malformed cursor")
+
+
+def keyset_filter(sort_field: str, direction: int, cursor: Optional[str]) -> Dict[str, Any]:
+    """The query clause selecting documents after the cursor"""
+    if not cursor:
+        return {}
+    value, last_id = decode_cursor(cursor, sort_field, direction)
+    after = "$gt" if direction == 1 else "$lt"
+    return {"$or": [
+        {sort_field: {after: value}},
+        {sort_field: value, "_id": {after: last_id}},
+    ]}
+
+
+def sort_spec(sort_field: str, direction: int) -> List[Tuple[str, int]]:
+    return [(sort_field, direction), ("_id", direction)]
+
+
+def fetch_page(collection, query: Dict[str, Any], sort_field: str, direction: int,
+               cursor: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One query for the page; the extra document fetched tells whether there is a next one"""
+    page_query = dict(query)
+    after = keyset_filter(sort_field, direction, cursor)
+    if after:
+        page_query = {"$and": [query, after]} if query else after
+    docs = list(collection.find(page_query).sort(sort_spec(sort_field, direction)).limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1], sort_field, direction) if len(docs) > limit else None
+    return docs[:limit], next_cursor
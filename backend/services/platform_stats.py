@@ -0,0 +1,194 @@
+"""
+Platform statistics for the admin dashboard.
+
+The numbers live precomputed in the `stats` collection, so reading them is
+one document plus one short indexed range for the trend lines:
+
+- "totals": the current value of every metric
+- "day:YYYY-MM-DD": per-day counters (messages, expenses, new families and
+  users) plus a snapshot of the totals taken by the last refresh that day
+
+Writes keep the numbers current with $inc (record_stats). A scheduled refresh
+recomputes everything from the source collections with aggregation pipelines,
+which corrects any drift from writes that raced a refresh or happened where
+no hook exists (e.g. children added by a parsed contract). Active families
+only come from the refresh.
+"""
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from database import db
+
+STATS_REFRESH_SECONDS = int(os.getenv("STATS_REFRESH_SECONDS", "900"))
+DEFAULT_HISTORY_DAYS = 30
+MAX_HISTORY_DAYS = 365
+# A family counts as active if anything showed up in its activity feed this recently
+ACTIVE_WINDOW_DAYS = 7
+
+TOTALS_ID = "totals"
+# Totals also copied into each day's snapshot for the trend lines
+SNAPSHOT_FIELDS = ["families", "linkedFamilies", "users", "children", "storageBytes", "activeFamilies"]
+
+_refresh_lock = threading.Lock()
+_scheduler_started = False
+
+
+def ensure_stats_indexes():
+    try:
+        db.stats.create_index([("kind", 1), ("date", 1)])
+    except Exception as e:
+        print(f"⚠️  Could not create stats indexes: {e}")
+
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def day_id(day: datetime) -> str:
+    return f"day:{day.strftime('%Y-%m-%d')}"
+
+
+def record_stats(totals: Dict[str, float], daily: Optional[Dict[str, float]] = None, day: Optional[datetime] = None):
+    """
+    Apply deltas from a write, e.g. record_stats({"families": 1}, {"newFamilies": 1}).
+    `daily` counters go to `day` (default today). Like the activity feed this is
+    secondary to the write, so failures are logged rather than raised.
+    """
+    try:
+        if totals:
+            db.stats.update_one({"_id": TOTALS_ID}, {"$inc": totals}, upsert=True)
+        if daily:
+            day = day_start(day or datetime.utcnow())
+            db.stats.update_one(
+                {"_id": day_id(day)},
+                {"$inc": daily, "$setOnInsert": {"kind": "daily", "date": day}},
+                upsert=True
+            )
+    except Exception as e:
+        print(f"⚠️  Could not record stats {totals} {daily}: {e}")
+
+
+# Full recomputation
+
+def _sum(collection, match: Dict[str, Any], **fields) -> Dict[str, float]:
+    """One $group over the matched documents; fields are name -> $sum expression"""
+    pipeline = [{"$match": match}] if match else []
+    pipeline.append({"$group": {"_id": None, **{name: {"$sum": expression} for name, expression in fields.items()}}})
+    result = next(iter(collection.aggregate(pipeline)), None)
+    return {name: (result or {}).get(name, 0) for name in fields}
+
+
+def _day_counters(start: datetime) -> Dict[str, float]:
+    end = start + timedelta(days=1)
+    expenses = _sum(db.expenses, {"created_at": {"$gte": start, "$lt": end}}, expenseCount=1, expenseAmount="$amount")
+    return {
+        "messages": db.messages.count_documents({"timestamp": {"$gte": start, "$lt": end}}),
+        "expenseCount": expenses["expenseCount"],
+        "expenseAmount": round(expenses["expenseAmount"], 2),
+        "newFamilies": db.families.count_documents({"createdAt": {"$gte": start, "$lt": end}}),
+    }
+
+
+def compute_totals(now: Optional[datetime] = None) -> Dict[str, Any]:
+    now = now or datetime.utcnow()
+    active = next(iter(db.activity.aggregate([
+        {"$match": {"created_at": {"$gte": now - timedelta(days=ACTIVE_WINDOW_DAYS)}}},
+        {"$group": {"_id": "$family_id"}},
+        {"$count": "families"}
+    ])), None)
+    expenses = _sum(db.expenses, {}, expenseCount=1, expenseAmount="$amount")
+    return {
+        "families": db.families.count_documents({}),
+        "linkedFamilies": db.families.count_documents({"parent2_email": {"$ne": None}}),
+        "users": db.users.count_documents({}),
+        "children": _sum(db.families, {}, children={"$size": {"$ifNull": ["$children", []]}})["children"],
+        "messages": db.messages.count_documents({}),
+        "expenseCount": expenses["expenseCount"],
+        "expenseAmount": round(expenses["expenseAmount"], 2),
+        # Documents and receipts both go through storage
+        "storageBytes": (
+            _sum(db.documents, {}, storageBytes={"$ifNull": ["$file_size", 0]})["storageBytes"]
+            + _sum(db.expenses, {}, storageBytes={"$ifNull": ["$receipt_size", 0]})["storageBytes"]
+        ),
+        "activeFamilies": active["families"] if active else 0,
+    }
+
+
+def refresh_stats(backfill_days: int = DEFAULT_HISTORY_DAYS) -> Dict[str, Any]:
+    """
+    Recompute the totals and the last two days' counters (yesterday's may have
+    changed after its last refresh). The first run also fills in counters for
+    the previous `backfill_days` so trend lines start out populated.
+    """
+    with _refresh_lock:
+        now = datetime.utcnow()
+        today = day_start(now)
+        totals = compute_totals(now)
+        totals["refreshedAt"] = now
+        db.stats.update_one({"_id": TOTALS_ID}, {"$set": totals}, upsert=True)
+
+        days = [today - timedelta(days=1), today]
+        if not db.stats.find_one({"kind": "daily", "date": {"$lt": today - timedelta(days=1)}}):
+            days = [today - timedelta(days=offset) for offset in range(backfill_days, -1, -1)]
+        for day in days:
+            update = _day_counters(day)
+            if day == today:
+                update.update({field: totals[field] for field in SNAPSHOT_FIELDS})
+            # newUsers only comes from signups: users have no creation date to count by
+            db.stats.update_one(
+                {"_id": day_id(day)},
+                {"$set": {"kind": "daily", "date": day, **update}},
+                upsert=True
+            )
+        return totals
+
+
+def _run_scheduler():
+    while True:
+        try:
+            refresh_stats()
+        except Exception as e:
+            print(f"[ERROR] Stats refresh: {e}")
+            traceback.print_exc()
+        time.sleep(STATS_REFRESH_SECONDS)
+
+
+def start_stats_scheduler() -> bool:
+    """Refresh every STATS_REFRESH_SECONDS in a background thread. Returns False if already running"""
+    global _scheduler_started
+    if _scheduler_started or STATS_REFRESH_SECONDS <= 0:
+        return False
+    _scheduler_started = True
+    threading.Thread(target=_run_scheduler, name="stats-refresh", daemon=True).start()
+    return True
+
+
+# Reading
+
+def get_stats(days: int = DEFAULT_HISTORY_DAYS) -> Dict[str, Any]:
+    """The totals and `days` of daily history, oldest first"""
+    totals = db.stats.find_one({"_id": TOTALS_ID})
+    if not totals or "refreshedAt" not in totals:
+        # Nothing computed yet, e.g. the scheduler hasn't had its first run
+        refresh_stats()
+        totals = db.stats.find_one({"_id": TOTALS_ID})
+
+    today = day_start(datetime.utcnow())
+    start = today - timedelta(days=min(days, MAX_HISTORY_DAYS) - 1)
+    history: List[Dict[str, Any]] = []
+    for entry in db.stats.find({"kind": "daily", "date": {"$gte": start}}).sort("date", 1):
+        point = {key: value for key, value in entry.items() if key not in ("_id", "kind")}
+        point["date"] = entry["date"].strftime("%Y-%m-%d")
+        if entry["date"] == today:
+            # Today's snapshot is as of the last refresh; the totals are live
+            point.update({field: totals.get(field, 0) for field in SNAPSHOT_FIELDS})
+        history.append(point)
+
+    return {"totals": {key: value for key, value in totals.items() if key != "_id"}, "history": history}
+
+
+ensure_stats_indexes()
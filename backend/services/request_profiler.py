@@ -0,0 +1,243 @@
+"""
+On-demand request profiling.
+
+A request is profiled when an admin sends "X-Profile: 1" or "?profile=1", or
+when it is every PROFILE_SAMPLE_RATE-th request (0, the default, turns sampling
+off). While it runs, a sampler thread reads stacks every PROFILE_INTERVAL_MS but
+only ones that belong to that request: the loop thread's while the request's
+own task is the one running on it, and the threadpool thread running its sync
+handler, recognised by the copy of the request's context the pool runs it in.
+Ticks where neither is running (the request is awaiting) are counted as
+"<waiting>", which makes the result a wall-clock profile.
+
+Profiles are stored in db.request_profiles as collapsed stacks ("a;b;c 12" per
+line), the input format of flamegraph.pl and speedscope, and the response
+carries the profile id in X-Profile-Id. Only the route template is stored, not
+the path, which can carry secrets such as ICS feed tokens. Work the handler
+hands to other threads itself (asyncio.to_thread, executors) is not attributed
+to it.
+"""
+import asyncio
+import itertools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import Context, ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+import jwt
+
+from database import db
+from routers.auth import ALGORITHM, SECRET_KEY
+
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_FLAG = "profile"
+# Oldest profiles are deleted beyond this
+MAX_PROFILES = 200
+HOT_FUNCTIONS = 15
+
+WAITING = "<waiting>"
+
+_request_counter = itertools.count(1)
+# The sampler of the request being profiled, copied into the threadpool with the rest of its context
+_profiled_request: ContextVar[Optional["_Sampler"]] = ContextVar("profiled_request", default=None)
+
+
+def ensure_profile_indexes():
+    try:
+        db.request_profiles.create_index([("id", 1)])
+        db.request_profiles.create_index([("created_at", -1)])
+    except Exception as e:
+        print(f"⚠️  Could not create profile indexes: {e}")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _stack_to(frame, is_root) -> Optional[str]:
+    """The stack from the first frame is_root accepts down to the running frame, or None if there is none"""
+    names: List[str] = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        if is_root(frame):
+            return ";".join(reversed(names))
+        frame = frame.f_back
+    return None
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, scope, task: Optional[asyncio.Task]):
+        super().__init__(name="request-profiler", daemon=True)
+        self.scope = scope
+        self.task = task
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        # (thread id, endpoint frame) of the threadpool call running a sync handler for this request
+        self._worker = None
+        self._stopped = threading.Event()
+
+    def _runs_for_us(self, endpoint_frame) -> bool:
+        """Whether a threadpool call was started by this request: the pool runs it in a copy of its context"""
+        frame = endpoint_frame.f_back
+        while frame is not None:
+            for value in list(frame.f_locals.values()):
+                if isinstance(value, Context) and value.get(_profiled_request) is self:
+                    return True
+            frame = frame.f_back
+        return False
+
+    def _worker_stack(self, frames) -> Optional[str]:
+        if self._worker is not None:
+            thread_id, endpoint_frame = self._worker
+            stack = _stack_to(frames.get(thread_id), lambda frame: frame is endpoint_frame)
+            if stack:
+                return stack
+            self._worker = None
+
+        endpoint_code = getattr(getattr(self.scope.get("route"), "endpoint", None), "__code__", None)
+        if endpoint_code is None:
+            return None
+        for thread_id, frame in frames.items():
+            if thread_id in (self.loop_thread_id, self.ident):
+                continue
+            endpoint_frame = frame
+            while endpoint_frame is not None and endpoint_frame.f_code is not endpoint_code:
+                endpoint_frame = endpoint_frame.f_back
+            if endpoint_frame is not None and self._runs_for_us(endpoint_frame):
+                self._worker = (thread_id, endpoint_frame)
+                return _stack_to(frame, lambda frame: frame is endpoint_frame)
+        return None
+
+    def run(self):
+        while not self._stopped.wait(PROFILE_INTERVAL):
+            self.samples += 1
+            if self.task is not None and asyncio.current_task(self.loop) is self.task:
+                # Rooted at the middleware, so routing, dependencies and serialization show up too
+                frame = sys._current_frames().get(self.loop_thread_id)
+                stack = _stack_to(frame, lambda frame: frame.f_code is _MIDDLEWARE_CODE)
+            else:
+                stack = self._worker_stack(sys._current_frames())
+            self.stacks[stack or WAITING] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _admin_email(scope) -> Optional[str]:
+    """The email of the admin the request is authenticated as, if any"""
+    authorization = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        email = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except jwt.PyJWTError:
+        return None
+    user = db.users.find_one({"email": email}) if email else None
+    return email if user and user.get("role") == "admin" else None
+
+
+def _trigger(scope) -> Optional[Dict[str, Any]]:
+    headers = dict(scope["headers"])
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if headers.get(PROFILE_HEADER) in (b"1", b"true") or query.get(PROFILE_QUERY_FLAG, [""])[0] in ("1", "true"):
+        email = _admin_email(scope)
+        if email:
+            return {"trigger": "requested", "requested_by": email}
+    if PROFILE_SAMPLE_RATE > 0 and next(_request_counter) % PROFILE_SAMPLE_RATE == 0:
+        return {"trigger": "sampled", "requested_by": None}
+    return None
+
+
+def _hot_functions(stacks: Counter) -> List[Dict[str, Any]]:
+    """Functions by samples spent in their own code (the leaf of each stack)"""
+    self_samples: Counter = Counter()
+    for stack, count in stacks.items():
+        self_samples[stack.rsplit(";", 1)[-1]] += count
+    return [{"function": name, "samples": count} for name, count in self_samples.most_common(HOT_FUNCTIONS)]
+
+
+def save_profile(profile: Dict[str, Any], stacks: Counter):
+    profile["collapsed"] = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+    profile["hotFunctions"] = _hot_functions(stacks)
+    db.request_profiles.insert_one(profile)
+    oldest_kept = list(db.request_profiles.find({}, {"created_at": 1}).sort("created_at", -1).skip(MAX_PROFILES - 1).limit(1))
+    if oldest_kept:
+        db.request_profiles.delete_many({"created_at": {"$lt": oldest_kept[0]["created_at"]}})
+
+
+def list_profiles(limit: int) -> List[Dict[str, Any]]:
+    profiles = db.request_profiles.find({}).sort("created_at", -1).limit(limit)
+    return [
+        {key: value for key, value in profile.items() if key not in ("_id", "collapsed", "hotFunctions")}
+        for profile in profiles
+    ]
+
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    profile = db.request_profiles.find_one({"id": profile_id})
+    return {key: value for key, value in profile.items() if key != "_id"} if profile else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles the requests _trigger selects"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        trigger = _trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = str(uuid.uuid4())
+        status = {"code": 500}
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode("ascii"))]
+            await send(message)
+
+        sampler = _Sampler(scope, asyncio.current_task())
+        token = _profiled_request.set(sampler)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.stop()
+            _profiled_request.reset(token)
+            route = scope.get("route")
+            profile = {
+                "id": profile_id,
+                "method": scope["method"],
+                "route": getattr(route, "path", None),
+                "status": status["code"],
+                "durationMs": round((time.perf_counter() - start) * 1000, 3),
+                "intervalMs": PROFILE_INTERVAL * 1000,
+                "samples": sampler.samples,
+                "created_at": datetime.utcnow(),
+                **trigger,
+            }
+            try:
+                await asyncio.to_thread(save_profile, profile, sampler.stacks)
+            except Exception as e:
+                print(f"⚠️  Could not save request profile: {e}")
+
+
+_MIDDLEWARE_CODE = ProfilingMiddleware.__call__.__code__
+
+ensure_profile_indexes()
@@ -0,0 +1,103 @@
+"""
+Per-family response cache for the dashboard's read endpoints.
+
+Every family has a data version that mutating endpoints bump. A cached
+response is keyed by (endpoint, family, user) and remembers the version it
+was computed at, so it is served from memory until the family's data changes.
+The ETag is derived from the same key and version, which lets clients
+revalidate with If-None-Match and get a 304 without the response being
+rebuilt or even being in this process's cache.
+
+Cached bodies are stored as encoded JSON and the cache is bounded by total
+size, evicting least recently used entries first.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pymongo import ReturnDocument
+
+from database import db
+
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+# Clients revalidate on every load; the ETag makes that cheap
+CACHE_CONTROL = "private, no-cache"
+
+# (endpoint, family_id, user_email) -> (version, etag, body)
+_entries: "OrderedDict[Tuple[str, str, str], Tuple[str, str, bytes]]" = OrderedDict()
+_entries_bytes = 0
+_entries_lock = threading.Lock()
+
+
+def family_version(family_id: str) -> int:
+    counter = db.counters.find_one({"_id": f"family:{family_id}"})
+    return counter["seq"] if counter else 0
+
+
+def bump_family_version(family_id: str) -> int:
+    """Call after any write that changes what a family's read endpoints return"""
+    counter = db.counters.find_one_and_update(
+        {"_id": f"family:{family_id}"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+
+class CachedEndpoint:
+    """
+    Resolve the cache state of one request. Read the version before computing,
+    so a write that races with the computation can only make the entry stale
+    under an old version, never fresh under a new one.
+    """
+
+    def __init__(self, request: Request, family_id: str, user_email: str, vary: str = ""):
+        self.request = request
+        query = request.url.query
+        self.key = (f"{request.url.path}?{query}" if query else request.url.path, family_id, user_email)
+        # vary: anything else the response depends on, e.g. the current time for relative dates
+        self.version = f"{family_version(family_id)}:{vary}"
+        digest = hashlib.sha1(repr((self.key, self.version)).encode("utf-8")).hexdigest()
+        self.etag = f'"{digest}"'
+
+    def _headers(self) -> dict:
+        return {"ETag": self.etag, "Cache-Control": CACHE_CONTROL}
+
+    def cached(self) -> Optional[Response]:
+        """A 304 or the stored body if still current, otherwise None"""
+        if_none_match = self.request.headers.get("if-none-match", "")
+        if self.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=self._headers())
+
+        with _entries_lock:
+            entry = _entries.get(self.key)
+            if entry is None or entry[0] != self.version:
+                return None
+            _entries.move_to_end(self.key)
+            body = entry[2]
+        return Response(content=body, media_type="application/json", headers=self._headers())
+
+    def store(self, payload: Any) -> Response:
+        global _entries_bytes
+        body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode("utf-8")
+        with _entries_lock:
+            previous = _entries.pop(self.key, None)
+            if previous is not None:
+                _entries_bytes -= len(previous[2])
+            if len(body) <= MAX_CACHE_BYTES // 16:
+                _entries[self.key] = (self.version, self.etag, body)
+                _entries_bytes += len(body)
+            while _entries_bytes > MAX_CACHE_BYTES and _entries:
+                _, evicted = _entries.popitem(last=False)
+                _entries_bytes -= len(evicted[2])
+        return Response(content=body, media_type="application/json", headers=self._headers())
+
+
+def cache_stats() -> dict:
+    with _entries_lock:
+        return {"entries": len(_entries), "bytes": _entries_bytes, "maxBytes": MAX_CACHE_BYTES}
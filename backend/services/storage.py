@@ -0,0 +1,363 @@
+"""
+Pluggable object storage for documents and receipts.
+
+Files are addressed by keys such as `documents/<id>.pdf` or `receipts/<id>.jpg`.
+`LocalStorage` keeps them under the backend directory in hash-sharded
+subdirectories (compressed at rest via storage_codec) and `S3Storage` keeps them in any S3-compatible bucket, such as
+AWS S3 or a local MinIO. With S3, downloads are redirected to presigned URLs so
+file bytes never pass through the API process.
+
+Select the backend with STORAGE_BACKEND=local|s3. The S3 driver reads
+S3_BUCKET, S3_ENDPOINT_URL, S3_REGION, S3_ACCESS_KEY_ID and S3_SECRET_ACCESS_KEY.
+"""
+import hashlib
+import io
+import os
+import shutil
+import threading
+import time
+import traceback
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+
+from services import storage_codec
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    # boto3 is only needed for the S3 backend
+    boto3 = None
+
+CHUNK_SIZE = 64 * 1024
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+PRESIGNED_URL_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "300"))
+
+SHARD_LEVELS = 2
+LAYOUT_MARKER = ".sharded"
+LAYOUT_MARKER_RECHECK_SECONDS = 60
+
+FileSource = Union[bytes, BinaryIO]
+
+
+class StorageBackend(ABC):
+    """Interface shared by all storage drivers"""
+
+    @abstractmethod
+    def save(self, key: str, source: FileSource, content_type: Optional[str] = None) -> int:
+        """Store bytes or a readable stream under `key`. Returns the bytes written"""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Open a stored object as a readable stream"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether an object is stored under `key`"""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Remove the object under `key`. Returns False if there was none"""
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[Tuple[str, int, datetime]]:
+        """Yield (key, stored size, last modified in UTC) for every object under `prefix`"""
+
+    def presigned_url(self, key: str, filename: str, media_type: str) -> Optional[str]:
+        """Return a temporary direct download URL, or None if the backend cannot provide one"""
+        return None
+
+    def iter_chunks(self, key: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with self.open(key) as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    break
+                yield block
+
+
+class LocalStorage(StorageBackend):
+    """
+    Files on the local filesystem, compressed at rest where the policy allows.
+
+    Objects are sharded into two levels of hash-prefix directories
+    (`documents/3f/a2/<id>.pdf`) so no directory grows unbounded. Files still
+    in the old flat layout are found until migrate_to_shards has moved them,
+    after which a marker file lets reads skip the legacy lookup.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._sharded_prefixes = set()
+        self._marker_checked_at: Dict[str, float] = {}
+
+    def path_for(self, key: str) -> str:
+        """Flat (legacy) path for a key, or the directory for a prefix"""
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    @staticmethod
+    def shard_dirs(name: str) -> List[str]:
+        digest = hashlib.md5(name.encode("utf-8")).hexdigest()
+        return [digest[i * 2:i * 2 + 2] for i in range(SHARD_LEVELS)]
+
+    def sharded_path_for(self, key: str) -> str:
+        prefix, _, name = key.rpartition("/")
+        return self.path_for(os.path.join(prefix, *self.shard_dirs(name), name))
+
+    def _is_fully_sharded(self, prefix: str) -> bool:
+        if prefix in self._sharded_prefixes:
+            return True
+        # Another worker may finish the migration, so look for the marker now and then
+        now = time.monotonic()
+        if now - self._marker_checked_at.get(prefix, 0) < LAYOUT_MARKER_RECHECK_SECONDS:
+            return False
+        self._marker_checked_at[prefix] = now
+        if os.path.exists(os.path.join(self.path_for(prefix), LAYOUT_MARKER)):
+            self._sharded_prefixes.add(prefix)
+            return True
+        return False
+
+    def resolve_path(self, key: str) -> str:
+        """Uncompressed path the object lives at - sharded, or flat if not yet migrated"""
+        sharded_path = self.sharded_path_for(key)
+        if storage_codec.stored_file_exists(sharded_path):
+            return sharded_path
+        prefix = key.rpartition("/")[0]
+        if not self._is_fully_sharded(prefix):
+            legacy_path = self.path_for(key)
+            if storage_codec.stored_file_exists(legacy_path):
+                return legacy_path
+        return sharded_path
+
+    def save(self, key: str, source: FileSource, content_type: Optional[str] = None) -> int:
+        path = self.sharded_path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if isinstance(source, (bytes, bytearray)):
+            return storage_codec.write_stored_file(path, bytes(source))
+
+        # Stream to disk first, then compress in place if it pays off
+        temp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(temp_path, 'wb') as f:
+            shutil.copyfileobj(source, f, CHUNK_SIZE)
+        os.replace(temp_path, path)
+        _, size_after = storage_codec.compress_existing_file(path)
+        return size_after
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return storage_codec.open_stored_file(self.resolve_path(key))
+        except FileNotFoundError:
+            # The shard migration may have just moved the file - resolve once more
+            return storage_codec.open_stored_file(self.resolve_path(key))
+
+    def exists(self, key: str) -> bool:
+        return storage_codec.stored_file_exists(self.resolve_path(key))
+
+    def delete(self, key: str) -> bool:
+        deleted = storage_codec.delete_stored_file(self.sharded_path_for(key))
+        return storage_codec.delete_stored_file(self.path_for(key)) or deleted
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, int, datetime]]:
+        directory = self.path_for(prefix)
+        for current_dir, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                if ".tmp-" in file_name or file_name == LAYOUT_MARKER:
+                    continue
+                stat = os.stat(os.path.join(current_dir, file_name))
+                yield f"{prefix}/{_logical_name(file_name)}", stat.st_size, datetime.utcfromtimestamp(stat.st_mtime)
+
+    def migrate_to_shards(self, prefix: str) -> Dict[str, int]:
+        """Move files from the flat layout into shard directories, online"""
+        directory = self.path_for(prefix)
+        moved = 0
+        remaining = 0
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if not entry.is_file() or entry.name == LAYOUT_MARKER:
+                    continue
+                if ".tmp-" in entry.name:
+                    remaining += 1
+                    continue
+                name = _logical_name(entry.name)
+                target_dir = os.path.join(directory, *self.shard_dirs(name))
+                try:
+                    os.makedirs(target_dir, exist_ok=True)
+                    # Rename is atomic, and readers check the sharded path first
+                    os.replace(entry.path, os.path.join(target_dir, entry.name))
+                    moved += 1
+                except Exception as e:
+                    print(f"Warning: Could not move {entry.path} into its shard: {e}")
+                    remaining += 1
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+        if remaining == 0:
+            with open(os.path.join(directory, LAYOUT_MARKER), 'w') as f:
+                f.write(datetime.utcnow().isoformat())
+            self._sharded_prefixes.add(prefix)
+
+        return {"moved": moved, "remaining": remaining}
+
+
+def _logical_name(file_name: str) -> str:
+    """Strip the compression suffix from a stored file name"""
+    for suffix in storage_codec.CODEC_SUFFIXES.values():
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return file_name
+
+
+class S3Storage(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS S3, MinIO, ...)"""
+
+    def __init__(self, bucket: str, client=None):
+        if boto3 is None:
+            raise RuntimeError("boto3 is required for the S3 storage backend")
+        self.bucket = bucket
+        self.client = client or boto3.client(
+            "s3",
+            endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+            region_name=os.getenv("S3_REGION") or None,
+            aws_access_key_id=os.getenv("S3_ACCESS_KEY_ID") or None,
+            aws_secret_access_key=os.getenv("S3_SECRET_ACCESS_KEY") or None,
+        )
+        # Objects above the threshold are uploaded in parallel multipart chunks
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_THRESHOLD,
+        )
+
+    def save(self, key: str, source: FileSource, content_type: Optional[str] = None) -> int:
+        stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+        extra_args = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(stream, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+        if isinstance(source, (bytes, bytearray)):
+            return len(source)
+        return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise FileNotFoundError(key)
+            raise
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str) -> bool:
+        existed = self.exists(key)
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        return existed
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, int, datetime]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{prefix}/"):
+            for item in page.get("Contents", []):
+                yield item["Key"], item["Size"], item["LastModified"].replace(tzinfo=None)
+
+    def presigned_url(self, key: str, filename: str, media_type: str) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": key,
+                "ResponseContentType": media_type,
+                "ResponseContentDisposition": f'attachment; filename="{filename}"',
+            },
+            ExpiresIn=PRESIGNED_URL_EXPIRES,
+        )
+
+
+def get_storage() -> StorageBackend:
+    backend = os.getenv("STORAGE_BACKEND", "local").lower()
+    if backend == "s3":
+        return S3Storage(os.getenv("S3_BUCKET", "bridge"))
+    return LocalStorage(os.getenv("STORAGE_LOCAL_ROOT") or os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+shard_migration_status: Dict[str, object] = {
+    "running": False,
+    "startedAt": None,
+    "finishedAt": None,
+    "moved": 0,
+    "remaining": 0,
+}
+_shard_lock = threading.Lock()
+
+
+def migrate_to_shards(*prefixes: str) -> Dict[str, object]:
+    """Move every prefix of the local store into the sharded layout"""
+    if not isinstance(storage, LocalStorage) or not _shard_lock.acquire(blocking=False):
+        return shard_migration_status
+
+    shard_migration_status.update({
+        "running": True,
+        "startedAt": datetime.utcnow().isoformat(),
+        "finishedAt": None,
+        "moved": 0,
+        "remaining": 0,
+    })
+    try:
+        for prefix in prefixes:
+            result = storage.migrate_to_shards(prefix)
+            shard_migration_status["moved"] += result["moved"]
+            shard_migration_status["remaining"] += result["remaining"]
+    except Exception as e:
+        print(f"[ERROR] Storage shard migration: {e}")
+        traceback.print_exc()
+    finally:
+        shard_migration_status["running"] = False
+        shard_migration_status["finishedAt"] = datetime.utcnow().isoformat()
+        _shard_lock.release()
+    return shard_migration_status
+
+
+def start_shard_migration(*prefixes: str) -> bool:
+    """Run migrate_to_shards in a background thread. Returns False if one is already running"""
+    if shard_migration_status["running"]:
+        return False
+    threading.Thread(target=migrate_to_shards, args=prefixes, name="storage-sharding", daemon=True).start()
+    return True
+
+
+def storage_file_response(key: str, media_type: str, filename: str):
+    """Redirect to a presigned URL when possible, otherwise serve the file through the API"""
+    url = storage.presigned_url(key, filename, media_type)
+    if url:
+        return RedirectResponse(url, status_code=307)
+
+    if isinstance(storage, LocalStorage):
+        stored_path, codec = storage_codec.resolve_stored_path(storage.resolve_path(key))
+        if stored_path and codec is None:
+            return FileResponse(stored_path, media_type=media_type, filename=filename)
+
+    return StreamingResponse(
+        storage.iter_chunks(key),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+try:
+    storage = get_storage()
+    print(f"Using {type(storage).__name__} for file storage")
+except Exception as e:
+    print(f"⚠️  Storage backend setup failed: {e}")
+    print("🔄 Falling back to local file storage")
+    storage = LocalStorage(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
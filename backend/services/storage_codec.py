@@ -0,0 +1,235 @@
+"""
+Transparent compression at rest for stored documents and receipts.
+
+A file saved at `<dir>/<id>.<ext>` may live on disk as `<id>.<ext>.zst` or
+`<id>.<ext>.gz`. Callers keep using the uncompressed path; this module picks
+the codec on write, probes for it on read and decompresses as a stream, so
+API URLs and database records never change. This is used by the local
+storage driver in services/storage.py.
+"""
+import gzip
+import os
+import shutil
+import threading
+import traceback
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    # zstd is optional - fall back to gzip from the standard library
+    zstandard = None
+
+CHUNK_SIZE = 64 * 1024
+
+# Formats that are already compressed gain nothing from another codec
+ALREADY_COMPRESSED_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic',
+    'mp4', 'mov', 'avi', 'mkv', 'mp3', 'm4a',
+    'zip', 'gz', 'zst', 'docx', 'xlsx', 'pptx',
+}
+
+# Only keep the compressed copy if it saves at least this fraction
+MIN_SAVINGS = 0.05
+
+CODEC_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
+STORAGE_COMPRESSION = os.getenv("STORAGE_COMPRESSION", "zstd").lower()
+STORAGE_COMPRESSION_LEVEL = int(os.getenv("STORAGE_COMPRESSION_LEVEL", "3"))
+
+if STORAGE_COMPRESSION == "zstd" and zstandard is None:
+    print("zstandard not installed - compressing stored files with gzip")
+    STORAGE_COMPRESSION = "gzip"
+
+
+def get_extension(path: str) -> str:
+    base_name = os.path.basename(path)
+    return base_name.rsplit('.', 1)[-1].lower() if '.' in base_name else ''
+
+
+def codec_for(path: str) -> Optional[str]:
+    """Pick the codec used to store a file, or None to store it raw"""
+    if STORAGE_COMPRESSION not in CODEC_SUFFIXES:
+        return None
+    if get_extension(path) in ALREADY_COMPRESSED_EXTENSIONS:
+        return None
+    return STORAGE_COMPRESSION
+
+
+def compress_bytes(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=STORAGE_COMPRESSION_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=min(max(STORAGE_COMPRESSION_LEVEL, 1), 9))
+
+
+def resolve_stored_path(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """Return (path on disk, codec) for a logical file path, or (None, None) if it is missing"""
+    for codec, suffix in CODEC_SUFFIXES.items():
+        if os.path.exists(path + suffix):
+            return path + suffix, codec
+    if os.path.exists(path):
+        return path, None
+    return None, None
+
+
+def stored_file_exists(path: str) -> bool:
+    return resolve_stored_path(path)[0] is not None
+
+
+def _atomic_write(target_path: str, data: bytes):
+    temp_path = f"{target_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, target_path)
+
+
+def write_stored_file(path: str, data: bytes) -> int:
+    """Write a file, compressing it when the policy allows. Returns the bytes written to disk"""
+    codec = codec_for(path)
+    if codec:
+        compressed = compress_bytes(data, codec)
+        if len(compressed) <= len(data) * (1 - MIN_SAVINGS):
+            _atomic_write(path + CODEC_SUFFIXES[codec], compressed)
+            return len(compressed)
+
+    _atomic_write(path, data)
+    return len(data)
+
+
+def open_stored_file(path: str) -> BinaryIO:
+    """Open a stored file for reading, decompressing it as a stream"""
+    stored_path, codec = resolve_stored_path(path)
+    if stored_path is None:
+        raise FileNotFoundError(path)
+    if codec == "gzip":
+        return gzip.open(stored_path, 'rb')
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {stored_path}")
+        return zstandard.ZstdDecompressor().stream_reader(open(stored_path, 'rb'), closefd=True)
+    return open(stored_path, 'rb')
+
+
+def iter_stored_file(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    with open_stored_file(path) as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            yield block
+
+
+def delete_stored_file(path: str) -> bool:
+    """Remove a file and any compressed variant. Returns True if anything was deleted"""
+    deleted = False
+    for candidate in [path] + [path + suffix for suffix in CODEC_SUFFIXES.values()]:
+        if os.path.exists(candidate):
+            os.remove(candidate)
+            deleted = True
+    return deleted
+
+
+# Background recompression of files written before compression was enabled
+migration_status: Dict[str, object] = {
+    "running": False,
+    "startedAt": None,
+    "finishedAt": None,
+    "filesScanned": 0,
+    "filesCompressed": 0,
+    "bytesBefore": 0,
+    "bytesAfter": 0,
+    "errors": 0,
+}
+_migration_lock = threading.Lock()
+
+
+def compress_existing_file(path: str) -> Tuple[int, int]:
+    """Recompress one raw file in place. Returns (bytes before, bytes after)"""
+    codec = codec_for(path)
+    size_before = os.path.getsize(path)
+    if not codec:
+        return size_before, size_before
+
+    target_path = path + CODEC_SUFFIXES[codec]
+    temp_path = f"{target_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(path, 'rb') as source, open(temp_path, 'wb') as target:
+        if codec == "zstd":
+            zstandard.ZstdCompressor(level=STORAGE_COMPRESSION_LEVEL).copy_stream(source, target)
+        else:
+            with gzip.GzipFile(fileobj=target, mode='wb', compresslevel=min(max(STORAGE_COMPRESSION_LEVEL, 1), 9)) as gz:
+                shutil.copyfileobj(source, gz, CHUNK_SIZE)
+
+    size_after = os.path.getsize(temp_path)
+    if size_after > size_before * (1 - MIN_SAVINGS):
+        os.remove(temp_path)
+        return size_before, size_before
+
+    # Readers prefer the compressed copy, so the original can go once it is in place
+    os.replace(temp_path, target_path)
+    os.remove(path)
+    return size_before, size_after
+
+
+def compress_existing_files(*directories: str) -> Dict[str, object]:
+    """Walk storage directories and compress every raw file the policy allows"""
+    if not _migration_lock.acquire(blocking=False):
+        return migration_status
+
+    try:
+        migration_status.update({
+            "running": True,
+            "startedAt": datetime.utcnow().isoformat(),
+            "finishedAt": None,
+            "filesScanned": 0,
+            "filesCompressed": 0,
+            "bytesBefore": 0,
+            "bytesAfter": 0,
+            "errors": 0,
+        })
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            # Walk shard subdirectories as well as any files left in the flat layout
+            for current_dir, _, file_names in os.walk(directory):
+                for file_name in file_names:
+                    if ".tmp-" in file_name or file_name.startswith("."):
+                        continue
+                    if any(file_name.endswith(suffix) for suffix in CODEC_SUFFIXES.values()):
+                        continue
+
+                    file_path = os.path.join(current_dir, file_name)
+                    migration_status["filesScanned"] += 1
+                    try:
+                        size_before, size_after = compress_existing_file(file_path)
+                    except Exception as e:
+                        print(f"Warning: Could not compress {file_path}: {e}")
+                        migration_status["errors"] += 1
+                        continue
+
+                    migration_status["bytesBefore"] += size_before
+                    migration_status["bytesAfter"] += size_after
+                    if size_after < size_before:
+                        migration_status["filesCompressed"] += 1
+    except Exception as e:
+        print(f"[ERROR] Storage compression migration: {e}")
+        traceback.print_exc()
+    finally:
+        migration_status["running"] = False
+        migration_status["finishedAt"] = datetime.utcnow().isoformat()
+        _migration_lock.release()
+
+    return migration_status
+
+
+def start_compression_migration(*directories: str) -> bool:
+    """Run compress_existing_files in a background thread. Returns False if one is already running"""
+    if migration_status["running"]:
+        return False
+    threading.Thread(
+        target=compress_existing_files,
+        args=directories,
+        name="storage-compression",
+        daemon=True
+    ).start()
+    return True
@@ -0,0 +1,175 @@
+"""
+Reconcile the file store against the database.
+
+Two streaming passes, each in bounded batches:
+
+1. Walk every stored object and look up, one `$in` query per batch, which
+   records still point at it. Files nothing references (left behind by failed
+   uploads or removed records) are deleted once they are older than a grace
+   period, and the bytes reclaimed are reported.
+2. Walk every record that references a file and flag the ones whose file is
+   missing from storage as dangling.
+"""
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from database import db
+from services.storage import storage
+
+RECONCILE_BATCH_SIZE = 500
+MAX_SAMPLES = 20
+
+# Uploads write the file before the record, so young files are never orphans
+ORPHAN_GRACE_PERIOD = timedelta(hours=1)
+
+# storage prefix, collection, URL field, flag for a missing file, URL prefixes (current first)
+FILE_SOURCES = [
+    ("documents", "documents", "file_url", "file_missing", ["/api/v1/documents/files/"]),
+    ("receipts", "expenses", "receipt_url", "receipt_missing", ["/api/v1/expenses/receipts/", "/receipts/"]),
+]
+
+reconcile_status: Dict[str, object] = {
+    "running": False,
+    "dryRun": False,
+    "startedAt": None,
+    "finishedAt": None,
+    "filesScanned": 0,
+    "bytesScanned": 0,
+    "orphanedFiles": 0,
+    "bytesReclaimed": 0,
+    "recordsScanned": 0,
+    "danglingRecords": 0,
+    "orphanSamples": [],
+    "danglingSamples": [],
+    "errors": 0,
+}
+_reconcile_lock = threading.Lock()
+
+
+def url_to_key(url: str, prefix: str, url_prefixes: List[str]) -> Optional[str]:
+    for url_prefix in url_prefixes:
+        if url.startswith(url_prefix):
+            return f"{prefix}/{url[len(url_prefix):]}"
+    return None
+
+
+def _reclaim_batch(batch: List[Tuple[str, int, datetime]], source: tuple, dry_run: bool):
+    prefix, collection_name, url_field, _, url_prefixes = source
+    collection = getattr(db, collection_name)
+
+    urls_by_key = {
+        key: [url_prefix + key[len(prefix) + 1:] for url_prefix in url_prefixes]
+        for key, _, _ in batch
+    }
+    all_urls = [url for urls in urls_by_key.values() for url in urls]
+    referenced = {
+        record.get(url_field)
+        for record in collection.find({url_field: {"$in": all_urls}}, {url_field: 1})
+    }
+
+    cutoff = datetime.utcnow() - ORPHAN_GRACE_PERIOD
+    for key, size, modified_at in batch:
+        if modified_at > cutoff or any(url in referenced for url in urls_by_key[key]):
+            continue
+
+        try:
+            if not dry_run:
+                storage.delete(key)
+        except Exception as e:
+            print(f"Warning: Could not reclaim {key}: {e}")
+            reconcile_status["errors"] += 1
+            continue
+
+        reconcile_status["orphanedFiles"] += 1
+        reconcile_status["bytesReclaimed"] += size
+        if len(reconcile_status["orphanSamples"]) < MAX_SAMPLES:
+            reconcile_status["orphanSamples"].append(key)
+
+
+def _reclaim_orphans(source: tuple, dry_run: bool):
+    batch = []
+    for key, size, modified_at in storage.list(source[0]):
+        reconcile_status["filesScanned"] += 1
+        reconcile_status["bytesScanned"] += size
+        batch.append((key, size, modified_at))
+        if len(batch) >= RECONCILE_BATCH_SIZE:
+            _reclaim_batch(batch, source, dry_run)
+            batch = []
+    if batch:
+        _reclaim_batch(batch, source, dry_run)
+
+
+def _flag_dangling(source: tuple, dry_run: bool):
+    prefix, collection_name, url_field, missing_flag, url_prefixes = source
+    collection = getattr(db, collection_name)
+
+    for record in collection.find({url_field: {"$nin": [None, ""]}}, {url_field: 1, missing_flag: 1}):
+        reconcile_status["recordsScanned"] += 1
+        key = url_to_key(record.get(url_field) or "", prefix, url_prefixes)
+        if key is None:
+            continue
+
+        is_missing = not storage.exists(key)
+        if is_missing:
+            reconcile_status["danglingRecords"] += 1
+            if len(reconcile_status["danglingSamples"]) < MAX_SAMPLES:
+                reconcile_status["danglingSamples"].append({
+                    "collection": collection_name,
+                    "id": record.get("id") or str(record.get("_id", "")),
+                    "url": record.get(url_field)
+                })
+
+        # Only write when the flag actually changes
+        if not dry_run and bool(record.get(missing_flag)) != is_missing:
+            collection.update_one({"_id": record["_id"]}, {"$set": {missing_flag: is_missing}})
+
+
+def reconcile_storage(dry_run: bool = False) -> Dict[str, object]:
+    """Reclaim orphaned files and flag dangling records. Returns the report"""
+    if not _reconcile_lock.acquire(blocking=False):
+        return reconcile_status
+
+    try:
+        reconcile_status.update({
+            "running": True,
+            "dryRun": dry_run,
+            "startedAt": datetime.utcnow().isoformat(),
+            "finishedAt": None,
+            "filesScanned": 0,
+            "bytesScanned": 0,
+            "orphanedFiles": 0,
+            "bytesReclaimed": 0,
+            "recordsScanned": 0,
+            "danglingRecords": 0,
+            "orphanSamples": [],
+            "danglingSamples": [],
+            "errors": 0,
+        })
+        for source in FILE_SOURCES:
+            _reclaim_orphans(source, dry_run)
+            _flag_dangling(source, dry_run)
+    except Exception as e:
+        print(f"[ERROR] Storage reconciliation: {e}")
+        traceback.print_exc()
+        reconcile_status["errors"] += 1
+    finally:
+        reconcile_status["running"] = False
+        reconcile_status["finishedAt"] = datetime.utcnow().isoformat()
+        _reconcile_lock.release()
+
+    return reconcile_status
+
+
+def start_reconciliation(dry_run: bool = False) -> bool:
+    """Run reconcile_storage in a background thread. Returns False if one is already running"""
+    if reconcile_status["running"]:
+        return False
+    threading.Thread(
+        target=reconcile_storage,
+        args=(dry_run,),
+        name="storage-reconciler",
+        daemon=True
+    ).start()
+    return True
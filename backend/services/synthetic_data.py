@@ -0,0 +1,376 @@
+"""
+Synthetic population for benchmarks and load tests.
+
+generate_population(N) creates N families shaped like the ones the routers
+write: two parents (PARENT2_SHARE of families linked), 1-4 children, and
+heavy-tailed conversations, messages, expenses (some with receipts), documents
+in default and custom folders, calendar events and the matching activity feed.
+Counts per family follow Pareto distributions, so most families are small and
+a few are very large, which is where the slow endpoints show up.
+
+Counts, names, amounts and dates are deterministic for a given seed (ids are
+not). Documents are inserted in
+batches with insert_many, and the receipt and document files are written
+through the configured storage backend by a small thread pool.
+
+Documents are either text files or images, as uploads are. Text files hold
+generated paragraphs and the file pool runs them through
+document_search.index_document, so they are searchable exactly like an
+uploaded file; images are random bytes and, as for real uploads, not indexed.
+
+Accounts are named from `prefix` ("family0.a@loadtest.example" is the first
+family's first parent) and all share LOADTEST_PASSWORD, hashed once, so the
+load test can log in as any of them without knowing anything else.
+"""
+import random
+import string
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from passlib.context import CryptContext
+
+from database import db
+from routers.documents import DEFAULT_FOLDERS, DOCUMENTS_PREFIX
+from routers.expenses import RECEIPTS_PREFIX
+from services import activity_log, document_search
+from services.admin_search import search_fields
+from services.calendar_import import natural_key
+from services.platform_stats import refresh_stats
+from services.storage import storage
+from services.text_extraction import TEXT_LINES_PER_PAGE
+
+LOADTEST_PASSWORD = "loadtest-password"
+LOADTEST_DOMAIN = "loadtest.example"
+ADMIN_EMAIL = f"admin@{LOADTEST_DOMAIN}"
+
+BATCH_SIZE = 1000
+FILE_WORKERS = 8
+
+PARENT2_SHARE = 0.85
+RECEIPT_SHARE = 0.4
+# Caps on the heavy tails
+MAX_MESSAGES_PER_CONVERSATION = 2000
+MAX_EXPENSES = 500
+MAX_DOCUMENTS = 200
+MAX_FILE_BYTES = 2 * 1024 * 1024
+# Text documents are indexed while loading, so they stay smaller
+MAX_TEXT_BYTES = 256 * 1024
+TEXT_DOCUMENT_SHARE = 0.5
+
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn",
+               "Maria", "David", "Sarah", "James", "Laura", "Daniel", "Emma", "Michael", "Olivia", "Chris"]
+LAST_NAMES = ["Smith", "Johnson", "Garcia", "Brown", "Miller", "Davis", "Martinez", "Wilson", "Anderson", "Lee",
+              "Clark", "Lewis", "Walker", "Young", "King", "Wright", "Lopez", "Hill", "Green", "Baker"]
+CHILD_NAMES = ["Mia", "Noah", "Lily", "Leo", "Ava", "Ethan", "Zoe", "Lucas", "Ella", "Max", "Nora", "Finn"]
+CONVERSATION_CATEGORIES = ["custody", "medical", "school", "activities", "financial", "general", "urgent"]
+CONVERSATION_SUBJECTS = ["Weekend pickup", "Doctor appointment", "Parent-teacher meeting", "Soccer practice",
+                         "Summer camp costs", "Holiday plans", "Homework routine", "Birthday party"]
+MESSAGE_LINES = ["Can we switch pickup to 5pm?", "Sounds good, thanks.", "I'll bring the forms.",
+                 "The appointment moved to Tuesday.", "Can you send the receipt?", "They did great today!",
+                 "Let's talk about this on the phone.", "I paid the registration fee.", "Running 10 minutes late."]
+EXPENSE_CATEGORIES = ["medical", "education", "activities", "clothing", "other"]
+EXPENSE_DESCRIPTIONS = {
+    "medical": ["Dentist visit", "Prescription", "Pediatrician copay"],
+    "education": ["School supplies", "Tutoring", "Field trip"],
+    "activities": ["Soccer registration", "Swim lessons", "Piano lessons"],
+    "clothing": ["Winter coat", "School shoes", "Uniform"],
+    "other": ["Birthday gift", "Haircut", "Phone bill"],
+}
+EVENT_TYPES = ["custody", "activity", "medical", "school", "holiday"]
+DOCUMENT_LINES = ["Both parents share joint legal custody of the children.",
+                  "The holiday schedule alternates between parents each year.",
+                  "Pickup and drop-off take place at the school on Fridays.",
+                  "Medical expenses not covered by insurance are split equally.",
+                  "The children attend summer camp for two weeks in July.",
+                  "Report card: reading and math are above grade level.",
+                  "Vaccination records are up to date as of this visit.",
+                  "Either parent may travel abroad with written consent."]
+TONES = ["friendly", "neutral", "formal"]
+FAMILY_CODE_CHARS = "".join(c for c in string.ascii_uppercase + string.digits if c not in "0OIL1")
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def parent_email(prefix: str, index: int, parent: str) -> str:
+    """Email of parent "a" or "b" of the index-th generated family"""
+    return f"{prefix}{index}.{parent}@{LOADTEST_DOMAIN}"
+
+
+def _heavy_tail(rng: random.Random, scale: float, alpha: float, cap: int) -> int:
+    return min(cap, int((rng.paretovariate(alpha) - 1) * scale))
+
+
+class _Loader:
+    """Buffers documents per collection and writes them in batches"""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.buffers: Dict[str, List[Dict[str, Any]]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, collection: str, doc: Dict[str, Any]):
+        buffer = self.buffers.setdefault(collection, [])
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            self.flush(collection)
+
+    def flush(self, collection: Optional[str] = None):
+        for name in [collection] if collection else list(self.buffers):
+            buffer = self.buffers.get(name)
+            if buffer:
+                getattr(db, name).insert_many(buffer)
+                self.counts[name] = self.counts.get(name, 0) + len(buffer)
+                self.buffers[name] = []
+
+
+class _Generator:
+    def __init__(self, rng: random.Random, loader: _Loader, files: ThreadPoolExecutor, password_hash: str, now: datetime):
+        self.rng = rng
+        self.loader = loader
+        self.files = files
+        self.password_hash = password_hash
+        self.now = now
+        self.file_futures = []
+        self.file_bytes = 0
+        self.codes = set()
+
+    def _family_code(self) -> str:
+        # Same alphabet as generate_family_code; unique within the run, and a clash
+        # with an existing family is about one in 10^9 per code
+        while True:
+            code = "".join(self.rng.choice(FAMILY_CODE_CHARS) for _ in range(6))
+            if code not in self.codes:
+                self.codes.add(code)
+                return code
+
+    def _past(self, days: int) -> datetime:
+        return self.now - timedelta(seconds=self.rng.randint(0, days * 86400))
+
+    def _save_file(self, key: str, size: int, content_type: str):
+        content = self.rng.randbytes(size)
+        self.file_bytes += size
+        self.file_futures.append(self.files.submit(storage.save, key, content, content_type))
+
+    def _text(self, size: int) -> bytes:
+        lines, length = [], 0
+        while length < size:
+            line = self.rng.choice(DOCUMENT_LINES)
+            lines.append(line)
+            length += len(line) + 1
+        return "\n".join(lines).encode()
+
+    def _save_text_document(self, family_id: str, document_id: str, key: str, content: bytes):
+        storage.save(key, content, "text/plain")
+        document_search.index_document(family_id, document_id, key.rsplit("/", 1)[-1], content)
+
+    def _activity(self, family_id: str, kind: str, entity: str, actor: str, created_at: datetime, **data):
+        self.loader.add("activity", {
+            "id": str(uuid.uuid4()), "family_id": family_id, "kind": kind, "entity": entity,
+            "actor_email": actor, "data": data, "current": True, "created_at": created_at,
+        })
+
+    def _user(self, email: str, first_name: str, last_name: str):
+        user = {"firstName": first_name, "lastName": last_name, "email": email,
+                "password": self.password_hash, "role": "user"}
+        self.loader.add("users", {**user, **search_fields("user", user)})
+
+    def family(self, prefix: str, index: int):
+        rng = self.rng
+        last_name = rng.choice(LAST_NAMES)
+        parents = [(parent_email(prefix, index, "a"), rng.choice(FIRST_NAMES))]
+        if rng.random() < PARENT2_SHARE:
+            parents.append((parent_email(prefix, index, "b"), rng.choice(FIRST_NAMES)))
+        for email, first_name in parents:
+            self._user(email, first_name, last_name)
+
+        family_id = ObjectId()
+        created_at = self._past(730)
+        children = [{
+            "id": str(uuid.uuid4()),
+            "name": rng.choice(CHILD_NAMES),
+            "dateOfBirth": (self.now - timedelta(days=rng.randint(365, 17 * 365))).date().isoformat(),
+            "grade": "", "school": "", "allergies": "", "medications": "", "notes": "",
+        } for _ in range(rng.choices([1, 2, 3, 4], weights=[35, 40, 18, 7])[0])]
+        family = {
+            "_id": family_id,
+            "id": str(uuid.uuid4()),
+            "familyName": f"{last_name} Family",
+            "familyCode": self._family_code(),
+            "parent1_email": parents[0][0],
+            "parent1_name": parents[0][1],
+            "parent2_email": parents[1][0] if len(parents) > 1 else None,
+            "parent2_name": parents[1][1] if len(parents) > 1 else None,
+            "children": children,
+            "custodyArrangement": rng.choice(["50-50", "60-40", "weekdays/weekends"]),
+            "custodyAgreement": None,
+            "createdAt": created_at,
+            "linkedAt": created_at + timedelta(days=rng.randint(0, 30)) if len(parents) > 1 else None,
+        }
+        self.loader.add("families", {**family, **search_fields("family", family)})
+
+        fid = str(family_id)
+        emails = [email for email, _ in parents]
+        if len(parents) > 1:
+            self._conversations(fid, emails)
+        self._expenses(fid, emails, [child["id"] for child in children])
+        self._documents(fid, emails)
+        self._events(fid, emails[0], [name for _, name in parents])
+
+    def _conversations(self, family_id: str, emails: List[str]):
+        rng = self.rng
+        for _ in range(rng.choices(range(9), weights=[5, 15, 20, 18, 14, 10, 8, 6, 4])[0]):
+            conversation_id = ObjectId()
+            created_at = self._past(365)
+            messages = _heavy_tail(rng, 4, 1.2, MAX_MESSAGES_PER_CONVERSATION) + 1
+            timestamp = created_at
+            for _ in range(messages):
+                timestamp += timedelta(minutes=rng.randint(1, 600))
+                sender = rng.choice(emails)
+                content = rng.choice(MESSAGE_LINES)
+                self.loader.add("messages", {
+                    "conversation_id": str(conversation_id), "sender_email": sender, "content": content,
+                    "tone": rng.choice(TONES), "timestamp": timestamp, "status": "sent",
+                })
+            subject = rng.choice(CONVERSATION_SUBJECTS)
+            self.loader.add("conversations", {
+                "_id": conversation_id, "family_id": family_id, "subject": subject,
+                "category": rng.choice(CONVERSATION_CATEGORIES), "participants": list(emails),
+                "created_at": created_at, "last_message_at": timestamp,
+                "is_archived": rng.random() < 0.1, "is_starred": rng.random() < 0.15,
+            })
+            self._activity(family_id, activity_log.MESSAGE, f"conversation:{conversation_id}", sender, timestamp,
+                           subject=subject, content=activity_log.preview(content), conversationId=str(conversation_id))
+
+    def _expenses(self, family_id: str, emails: List[str], children_ids: List[str]):
+        rng = self.rng
+        for _ in range(_heavy_tail(rng, 6, 1.5, MAX_EXPENSES)):
+            expense_id = str(uuid.uuid4())
+            category = rng.choice(EXPENSE_CATEGORIES)
+            description = rng.choice(EXPENSE_DESCRIPTIONS[category])
+            amount = round(rng.lognormvariate(3.5, 0.9), 2)
+            created_at = self._past(365)
+            paid_by = rng.choice(emails)
+            status = rng.choices(["pending", "approved", "paid", "disputed"], weights=[30, 40, 25, 5])[0]
+            receipt_url = receipt_name = None
+            receipt_size = 0
+            if rng.random() < RECEIPT_SHARE:
+                receipt_name = f"receipt-{expense_id[:8]}.jpg"
+                receipt_size = rng.randint(2_000, 40_000)
+                self._save_file(f"{RECEIPTS_PREFIX}/{expense_id}.jpg", receipt_size, "image/jpeg")
+                receipt_url = f"/api/v1/expenses/receipts/{expense_id}.jpg"
+            self.loader.add("expenses", {
+                "id": expense_id, "family_id": family_id, "description": description, "amount": amount,
+                "category": category, "date": created_at.date().isoformat(), "paid_by_email": paid_by,
+                "status": status, "split_ratio": {"parent1": 50, "parent2": 50},
+                "receipt_url": receipt_url, "receipt_file_name": receipt_name, "receipt_size": receipt_size,
+                "children_ids": rng.sample(children_ids, rng.randint(0, len(children_ids))),
+                "custody_parent": None, "created_at": created_at, "updated_at": created_at,
+            })
+            self._activity(family_id, activity_log.EXPENSE, f"expense:{expense_id}", paid_by, created_at,
+                           expenseId=expense_id, description=description, amount=amount, status=status, paidBy=paid_by)
+
+    def _documents(self, family_id: str, emails: List[str]):
+        rng = self.rng
+        folders = [(folder["id"], folder["document_types"][0], None) for folder in DEFAULT_FOLDERS]
+        for number in range(rng.choices([0, 1, 2, 3], weights=[50, 30, 15, 5])[0]):
+            folder_id = str(uuid.uuid4())
+            category = f"custom-{number}"
+            self.loader.add("document_folders", {
+                "id": folder_id, "family_id": family_id, "name": f"Folder {number + 1}", "description": None,
+                "icon": "Folder", "color": "text-gray-600", "bg_color": "bg-gray-50 border-gray-200",
+                "document_types": ["custom"], "is_custom": True, "custom_category": category,
+                "created_at": self._past(365), "created_by": emails[0],
+            })
+            folders.append((folder_id, "custom", category))
+
+        for _ in range(_heavy_tail(rng, 3, 1.8, MAX_DOCUMENTS)):
+            document_id = str(uuid.uuid4())
+            folder_id, document_type, custom_category = rng.choice(folders)
+            created_at = self._past(365)
+            extracted = {}
+            if rng.random() < TEXT_DOCUMENT_SHARE:
+                extension = "txt"
+                content = self._text(min(MAX_TEXT_BYTES, int(rng.lognormvariate(8, 1))))
+                size = len(content)
+                self.file_bytes += size
+                self.file_futures.append(self.files.submit(
+                    self._save_text_document, family_id, document_id, f"{DOCUMENTS_PREFIX}/{document_id}.txt", content
+                ))
+                lines = content.count(b"\n") + 1
+                extracted = {"page_count": -(-lines // TEXT_LINES_PER_PAGE), "indexed_at": created_at}
+            else:
+                extension = rng.choice(["jpg", "png"])
+                size = min(MAX_FILE_BYTES, int(rng.lognormvariate(9, 1)))
+                self._save_file(f"{DOCUMENTS_PREFIX}/{document_id}.{extension}", size, f"image/{extension}")
+            self.loader.add("documents", {
+                "id": document_id, "family_id": family_id, "folder_id": folder_id,
+                "name": f"{document_type.title()} document", "type": document_type, "custom_category": custom_category,
+                "file_url": f"/api/v1/documents/files/{document_id}.{extension}",
+                "file_name": f"{document_id[:8]}.{extension}", "file_type": extension, "file_size": size,
+                "description": None, "tags": [], "status": "processed", **extracted,
+                "is_protected": False, "protection_reason": None, "uploaded_by": rng.choice(emails),
+                "children_ids": [], "created_at": created_at, "updated_at": created_at,
+            })
+
+    def _events(self, family_id: str, creator: str, parent_names: List[str]):
+        rng = self.rng
+        for _ in range(rng.randint(20, 120)):
+            event_date = (self.now + timedelta(days=rng.randint(-120, 180))).replace(hour=rng.randint(7, 19), minute=0, second=0, microsecond=0)
+            event_type = rng.choice(EVENT_TYPES)
+            title = f"{event_type.title()} - {rng.choice(CHILD_NAMES)}"
+            event_id = str(uuid.uuid4())
+            created_at = min(self.now, event_date - timedelta(days=rng.randint(1, 60)))
+            parent = rng.choice(parent_names)
+            self.loader.add("events", {
+                "id": event_id, "family_id": family_id, "date": event_date, "type": event_type, "title": title,
+                "parent": parent, "isSwappable": rng.random() < 0.3,
+                "natural_key": natural_key(event_date, event_type, title),
+                "created_by_email": creator, "created_at": created_at, "updated_at": created_at,
+            })
+            self._activity(family_id, activity_log.CALENDAR_UPDATE, f"event:{event_id}", creator, created_at,
+                           title=title, eventType=event_type, parent=parent)
+
+
+def ensure_admin() -> str:
+    """Create the load-test admin if missing. Returns its email"""
+    if not db.users.find_one({"email": ADMIN_EMAIL}):
+        admin = {"firstName": "Load", "lastName": "Test", "email": ADMIN_EMAIL,
+                 "password": pwd_context.hash(LOADTEST_PASSWORD), "role": "admin"}
+        db.users.insert_one({**admin, **search_fields("user", admin)})
+    return ADMIN_EMAIL
+
+
+def generate_population(families: int, seed: int = 1, prefix: str = "family", batch_size: int = BATCH_SIZE,
+                        on_progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """
+    Bulk-load `families` families and everything that hangs off them, then
+    refresh the admin statistics. Returns the number of documents per
+    collection, the bytes of files written and the time taken.
+    """
+    if db.users.find_one({"email": parent_email(prefix, 0, "a")}):
+        raise ValueError(f"A population with prefix '{prefix}' already exists; choose another prefix")
+
+    start = time.perf_counter()
+    ensure_admin()
+    loader = _Loader(batch_size)
+    with ThreadPoolExecutor(max_workers=FILE_WORKERS) as files:
+        generator = _Generator(random.Random(seed), loader, files, pwd_context.hash(LOADTEST_PASSWORD), datetime.utcnow())
+        for index in range(families):
+            generator.family(prefix, index)
+            if on_progress and (index + 1) % 100 == 0:
+                on_progress(index + 1)
+        loader.flush()
+        for future in generator.file_futures:
+            future.result()
+
+    refresh_stats()
+    return {
+        "families": families,
+        "collections": loader.counts,
+        "fileBytes": generator.file_bytes,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
@@ -0,0 +1,366 @@
+"""
+Export one family, or the whole platform, as a portable archive.
+
+An export is a job recorded in `export_jobs` and written to a working
+directory under EXPORT_DIR:
+
+- one <collection>.ndjson per collection, a JSON document per line
+  (ObjectIds as {"$oid": ...}, datetimes as {"$date": ...})
+- files/<storage key> for every document and receipt the records point to
+- manifest.json describing the scope and counts
+
+Each collection is read in _id order in batches of EXPORT_BATCH_SIZE, so
+memory stays bounded whatever the tenant's size. After every batch the job
+records the last _id written and the file offset it reached. A job that was
+interrupted resumes from that checkpoint, dropping anything written after it.
+When everything is written the directory is packed into <job id>.zip with the
+streaming ZIP writer and removed.
+"""
+import base64
+import json
+import os
+import shutil
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Optional
+
+from database import db
+from services.storage import storage
+from services.storage_reconciler import FILE_SOURCES, url_to_key
+from services.zip_stream import stream_zip
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "exports"))
+EXPORT_BATCH_SIZE = 500
+FORMAT_VERSION = 1
+
+# Exported in this order; derived data (search index, caches, counters) is rebuilt, not exported
+EXPORT_COLLECTIONS = [
+    "families", "users", "events", "change_requests", "custody_rules", "custody_exceptions",
+    "calendar_changes", "conversations", "messages", "expenses", "activity",
+    "documents", "document_folders", "contract_jobs",
+]
+# Secrets and index fields never leave the database
+REDACTED_FIELDS = {
+    "users": ("password", "ics_token", "search_terms", "search_grams"),
+    "families": ("search_terms", "search_grams"),
+}
+
+# One export at a time, off the request threads
+_export_runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tenant-export")
+_running_jobs = set()
+_running_lock = threading.Lock()
+
+
+def ensure_export_indexes():
+    try:
+        db.export_jobs.create_index([("id", 1)])
+        db.export_jobs.create_index([("created_at", -1)])
+    except Exception as e:
+        print(f"⚠️  Could not create export indexes: {e}")
+
+
+# Serialisation
+
+def _encode(value: Any) -> Any:
+    if ObjectId is not None and isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return {"$binary": base64.b64encode(value).decode("ascii")}
+    return str(value)
+
+
+def encode_line(collection_name: str, doc: Dict[str, Any]) -> bytes:
+    redacted = REDACTED_FIELDS.get(collection_name, ())
+    if redacted:
+        doc = {key: value for key, value in doc.items() if key not in redacted}
+    return (json.dumps(doc, default=_encode, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _checkpoint_id(value: Any) -> Dict[str, Any]:
+    is_oid = ObjectId is not None and isinstance(value, ObjectId)
+    return {"value": str(value), "oid": is_oid}
+
+
+def _resume_id(checkpoint: Dict[str, Any]) -> Any:
+    return ObjectId(checkpoint["value"]) if checkpoint.get("oid") and ObjectId is not None else checkpoint["value"]
+
+
+# Scope
+
+def find_family(identifier: str) -> Optional[Dict[str, Any]]:
+    """A family by _id or family code"""
+    family = db.families.find_one({"familyCode": identifier.upper()})
+    if family:
+        return family
+    if ObjectId is not None and ObjectId.is_valid(identifier):
+        family = db.families.find_one({"_id": ObjectId(identifier)})
+    return family or db.families.find_one({"_id": identifier})
+
+
+def collection_queries(job: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """The filter selecting each collection's part of the export"""
+    if job["scope"] == "platform":
+        return {name: {} for name in EXPORT_COLLECTIONS}
+
+    family = db.families.find_one({"_id": _resume_id(job["family"])})
+    if not family:
+        raise ValueError("The family being exported no longer exists")
+    family_id = str(family["_id"])
+    emails = [email for email in (family.get("parent1_email"), family.get("parent2_email")) if email]
+    conversation_ids = [str(conversation["_id"]) for conversation in db.conversations.find({"family_id": family_id}, {"_id": 1})]
+
+    queries = {name: {"family_id": family_id} for name in EXPORT_COLLECTIONS}
+    queries["families"] = {"_id": family["_id"]}
+    queries["users"] = {"email": {"$in": emails}}
+    queries["messages"] = {"conversation_id": {"$in": conversation_ids}}
+    return queries
+
+
+# Jobs
+
+def create_export_job(scope: str, family: Optional[Dict[str, Any]] = None, created_by: Optional[str] = None) -> Dict[str, Any]:
+    job_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    job = {
+        "id": job_id,
+        "scope": scope,
+        "family": _checkpoint_id(family["_id"]) if family else None,
+        "familyName": family.get("familyName") if family else None,
+        "status": "queued",
+        "created_by": created_by,
+        "created_at": now,
+        "updated_at": now,
+        # collection (or "files:<collection>") -> {"count", "offset", "lastId", "done"}
+        "progress": {},
+        "files": {"count": 0, "bytes": 0, "missing": 0},
+        "archive": None,
+        "error": None,
+    }
+    db.export_jobs.insert_one(job)
+    return job
+
+
+def get_export_job(job_id: str) -> Optional[Dict[str, Any]]:
+    return db.export_jobs.find_one({"id": job_id})
+
+
+def job_directory(job_id: str) -> str:
+    return os.path.join(EXPORT_DIR, job_id)
+
+
+def archive_path(job_id: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{job_id}.zip")
+
+
+def _save_progress(job: Dict[str, Any], **fields):
+    job.update(fields)
+    job["updated_at"] = datetime.utcnow()
+    db.export_jobs.update_one(
+        {"id": job["id"]},
+        {"$set": {key: job[key] for key in ("status", "progress", "files", "archive", "error", "updated_at")}}
+    )
+
+
+def _batches(collection, query: Dict[str, Any], last_id: Any) -> Any:
+    """Yield the matching documents in _id order, one bounded batch at a time"""
+    while True:
+        page_query = query
+        if last_id is not None:
+            after = {"_id": {"$gt": last_id}}
+            page_query = {"$and": [query, after]} if query else after
+        batch = list(collection.find(page_query).sort("_id", 1).limit(EXPORT_BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]["_id"]
+
+
+def _export_collection(job: Dict[str, Any], name: str, query: Dict[str, Any], directory: str):
+    state = job["progress"].setdefault(name, {"count": 0, "offset": 0, "lastId": None, "done": False})
+    if state["done"]:
+        return
+    path = os.path.join(directory, f"{name}.ndjson")
+    last_id = _resume_id(state["lastId"]) if state["lastId"] else None
+
+    with open(path, "r+b" if os.path.exists(path) else "wb") as output:
+        # Anything after the checkpoint came from a batch that wasn't recorded
+        output.truncate(state["offset"])
+        output.seek(state["offset"])
+        for batch in _batches(getattr(db, name), query, last_id):
+            output.write(b"".join(encode_line(name, doc) for doc in batch))
+            output.flush()
+            os.fsync(output.fileno())
+            state.update({"count": state["count"] + len(batch), "offset": output.tell(), "lastId": _checkpoint_id(batch[-1]["_id"])})
+            _save_progress(job)
+
+    state["done"] = True
+    _save_progress(job)
+
+
+def _copy_file(key: str, directory: str) -> Optional[int]:
+    """Copy one stored object into the export. Returns its size, or None if it is missing"""
+    target = os.path.join(directory, "files", *key.split("/"))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp_path = f"{target}.part"
+    try:
+        with storage.open(key) as source, open(temp_path, "wb") as output:
+            shutil.copyfileobj(source, output, 1024 * 1024)
+    except FileNotFoundError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+    os.replace(temp_path, target)
+    return os.path.getsize(target)
+
+
+def _export_files(job: Dict[str, Any], queries: Dict[str, Dict[str, Any]], directory: str):
+    for prefix, collection_name, url_field, _, url_prefixes in FILE_SOURCES:
+        name = f"files:{collection_name}"
+        state = job["progress"].setdefault(name, {"count": 0, "lastId": None, "done": False})
+        if state["done"]:
+            continue
+        query = {"$and": [queries[collection_name], {url_field: {"$ne": None}}]} if queries[collection_name] else {url_field: {"$ne": None}}
+        last_id = _resume_id(state["lastId"]) if state["lastId"] else None
+        for batch in _batches(getattr(db, collection_name), query, last_id):
+            totals = {"count": 0, "bytes": 0, "missing": 0}
+            for record in batch:
+                key = url_to_key(record.get(url_field) or "", prefix, url_prefixes)
+                if not key:
+                    continue
+                size = _copy_file(key, directory)
+                if size is None:
+                    totals["missing"] += 1
+                else:
+                    totals["count"] += 1
+                    totals["bytes"] += size
+            # Totals only move with the checkpoint, so a batch redone on resume isn't counted twice
+            for field, value in totals.items():
+                job["files"][field] += value
+            state.update({"count": state["count"] + len(batch), "lastId": _checkpoint_id(batch[-1]["_id"])})
+            _save_progress(job)
+        state["done"] = True
+        _save_progress(job)
+
+
+def _write_manifest(job: Dict[str, Any], directory: str):
+    manifest = {
+        "formatVersion": FORMAT_VERSION,
+        "exportId": job["id"],
+        "scope": job["scope"],
+        "family": job["family"]["value"] if job.get("family") else None,
+        "familyName": job.get("familyName"),
+        "createdAt": job["created_at"].isoformat(),
+        "completedAt": datetime.utcnow().isoformat(),
+        "collections": {name: state["count"] for name, state in job["progress"].items() if not name.startswith("files:")},
+        "files": job["files"],
+        "redactedFields": {name: list(fields) for name, fields in REDACTED_FIELDS.items()},
+    }
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as output:
+        json.dump(manifest, output, indent=2)
+
+
+def _pack(job_id: str, directory: str) -> int:
+    """Stream the working directory into <job id>.zip and remove it"""
+    entries = []
+    for root, _, names in os.walk(directory):
+        for file_name in sorted(names):
+            path = os.path.join(root, file_name)
+            stat = os.stat(path)
+            entries.append((
+                os.path.relpath(path, directory).replace(os.sep, "/"),
+                stat.st_size,
+                datetime.fromtimestamp(stat.st_mtime),
+                (lambda path=path: open(path, "rb"))
+            ))
+    entries.sort(key=lambda entry: (entry[0] != "manifest.json", entry[0]))
+
+    target = archive_path(job_id)
+    with open(f"{target}.part", "wb") as output:
+        for chunk in stream_zip(entries):
+            output.write(chunk)
+    os.replace(f"{target}.part", target)
+    shutil.rmtree(directory)
+    return os.path.getsize(target)
+
+
+def _claim(job_id: str) -> bool:
+    with _running_lock:
+        if job_id in _running_jobs:
+            return False
+        _running_jobs.add(job_id)
+        return True
+
+
+def run_export(job_id: str, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+               claimed: bool = False) -> Dict[str, Any]:
+    """Run or resume an export to completion in the calling thread"""
+    if not claimed and not _claim(job_id):
+        raise RuntimeError("This export is already running")
+    try:
+        job = get_export_job(job_id)
+        if not job:
+            raise ValueError("Export not found")
+        if job["status"] == "completed":
+            return job
+        directory = job_directory(job_id)
+        os.makedirs(directory, exist_ok=True)
+        _save_progress(job, status="running", error=None)
+
+        try:
+            queries = collection_queries(job)
+            for name in EXPORT_COLLECTIONS:
+                _export_collection(job, name, queries[name], directory)
+                if on_progress:
+                    on_progress(job)
+            _export_files(job, queries, directory)
+            _write_manifest(job, directory)
+            size = _pack(job_id, directory)
+            _save_progress(job, status="completed", archive={"path": archive_path(job_id), "bytes": size})
+        except Exception as e:
+            print(f"[ERROR] Export {job_id}: {e}")
+            traceback.print_exc()
+            # The checkpoint stays, so the job can be resumed
+            _save_progress(job, status="failed", error=str(e))
+        return job
+    finally:
+        with _running_lock:
+            _running_jobs.discard(job_id)
+
+
+def start_export(job_id: str) -> bool:
+    """Queue an export (or resume a failed one) in the background. Returns False if it is already running"""
+    if not _claim(job_id):
+        return False
+    _export_runner.submit(run_export, job_id, claimed=True)
+    return True
+
+
+def export_summary(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": job["id"],
+        "scope": job["scope"],
+        "familyId": job["family"]["value"] if job.get("family") else None,
+        "familyName": job.get("familyName"),
+        "status": job["status"],
+        "collections": {name: state["count"] for name, state in job.get("progress", {}).items() if not name.startswith("files:")},
+        "files": job.get("files"),
+        "archiveBytes": (job.get("archive") or {}).get("bytes"),
+        "error": job.get("error"),
+        "createdAt": job["created_at"].isoformat() if job.get("created_at") else None,
+        "updatedAt": job["updated_at"].isoformat() if job.get("updated_at") else None,
+    }
+
+
+ensure_export_indexes()
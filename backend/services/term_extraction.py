@@ -0,0 +1,202 @@
+"""
+Rule-driven term extraction.
+
+Every phrase in a rule set is compiled into one Aho-Corasick automaton and
+every regex into one alternation, so a page is scanned once no matter how many
+rules there are. Pages are consumed one at a time, which keeps memory bounded
+for long agreements.
+
+A rule is a dict:
+
+    {
+        "term": "Custody Split",           # what the rule recognises
+        "value": "50/50 Equal Time",       # the value reported when it fires
+        "phrases": ["50/50", "equal time"],
+        "regex": [r"\\bone[- ]half\\b"],     # optional
+        "requires": [["holiday"]],         # optional: other phrase groups that must also appear
+        "confidence": 0.9,
+        "data": {...}                      # optional payload returned with the term
+    }
+
+The rule fires when any of its phrases or regexes match and every `requires`
+group has matched somewhere in the document. When several rules share a term,
+the first one in the rule set that fires wins.
+"""
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Characters of context kept on each side when a clause has no sentence boundary
+MAX_CLAUSE_CONTEXT = 200
+MAX_MATCHES_PER_TERM = 5
+
+CLAUSE_BOUNDARY = re.compile(r"[.;!?]\s|\n\s*\n")
+
+
+class AhoCorasick:
+    """Case-insensitive multi-phrase automaton that treats any run of whitespace as one space"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[Any, int]]] = [[]]
+        self.max_length = 0
+
+    def add(self, phrase: str, payload: Any):
+        phrase = " ".join(phrase.lower().split())
+        if not phrase:
+            return
+        state = 0
+        for ch in phrase:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][ch] = next_state
+            state = next_state
+        self._output[state].append((payload, len(phrase)))
+        self.max_length = max(self.max_length, len(phrase))
+
+    def build(self):
+        """Compute failure links breadth-first and merge outputs along them. Depth-1 states fail to the root"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str) -> Iterable[Tuple[Any, int, int]]:
+        """Yield (payload, start, end) with offsets into the original text"""
+        goto, fail, output = self._goto, self._fail, self._output
+        # Original offset of each normalised character still inside the longest phrase
+        offsets = deque(maxlen=max(self.max_length, 1))
+        state = 0
+        previous_space = True
+
+        for index, ch in enumerate(text):
+            if ch.isspace():
+                if previous_space:
+                    continue
+                ch = " "
+                previous_space = True
+            else:
+                ch = ch.lower()
+                previous_space = False
+
+            offsets.append(index)
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+
+            for payload, length in output[state]:
+                yield payload, offsets[-length], index + 1
+
+
+def _is_word_boundary(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not (before.isalnum() and text[start].isalnum()) and not (after.isalnum() and text[end - 1].isalnum())
+
+
+def clause_around(text: str, start: int, end: int) -> str:
+    """Return the sentence or clause that contains text[start:end]"""
+    window_start = max(0, start - MAX_CLAUSE_CONTEXT)
+    clause_start = window_start
+    for boundary in CLAUSE_BOUNDARY.finditer(text, window_start, start):
+        clause_start = boundary.end()
+
+    window_end = min(len(text), end + MAX_CLAUSE_CONTEXT)
+    boundary = CLAUSE_BOUNDARY.search(text, end, window_end)
+    clause_end = boundary.start() + 1 if boundary else window_end
+
+    return " ".join(text[clause_start:clause_end].split())
+
+
+class TermExtractor:
+    """A compiled rule set. Build once and reuse it for every document"""
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = rules
+        self._automaton = AhoCorasick()
+        regex_parts = []
+
+        # Each pattern is tagged with (rule index, group index); group 0 is the rule's own phrases
+        for rule_index, rule in enumerate(rules):
+            for phrase in rule.get("phrases", []):
+                self._automaton.add(phrase, (rule_index, 0))
+            for group_index, group in enumerate(rule.get("requires", []), start=1):
+                for phrase in group:
+                    self._automaton.add(phrase, (rule_index, group_index))
+            for pattern_index, pattern in enumerate(rule.get("regex", [])):
+                re.compile(pattern)
+                regex_parts.append((f"r{rule_index}_{pattern_index}", rule_index, pattern))
+
+        self._automaton.build()
+        self._regex_rules = {name: rule_index for name, rule_index, _ in regex_parts}
+        self._regex = re.compile(
+            "|".join(f"(?P<{name}>{pattern})" for name, _, pattern in regex_parts),
+            re.IGNORECASE
+        ) if regex_parts else None
+
+    def _scan_page(self, page: int, text: str) -> Iterable[Tuple[int, int, Dict[str, Any]]]:
+        for (rule_index, group_index), start, end in self._automaton.iter_matches(text):
+            if _is_word_boundary(text, start, end):
+                yield rule_index, group_index, {"page": page, "start": start, "end": end, "text": text[start:end]}
+
+        if self._regex is not None:
+            for match in self._regex.finditer(text):
+                rule_index = self._regex_rules[match.lastgroup]
+                yield rule_index, 0, {"page": page, "start": match.start(), "end": match.end(), "text": match.group()}
+
+    def extract(self, pages: Iterable[Tuple[int, str]]) -> List[Dict[str, Any]]:
+        """Scan (page_number, text) pairs and return one entry per recognised term"""
+        primary_matches: Dict[int, List[Dict[str, Any]]] = {}
+        match_counts: Dict[int, int] = {}
+        groups_seen: Dict[int, set] = {}
+
+        for page, text in pages:
+            for rule_index, group_index, match in self._scan_page(page, text):
+                groups_seen.setdefault(rule_index, set()).add(group_index)
+                if group_index:
+                    continue
+                match_counts[rule_index] = match_counts.get(rule_index, 0) + 1
+                matches = primary_matches.setdefault(rule_index, [])
+                if len(matches) < MAX_MATCHES_PER_TERM:
+                    # Only the first few clauses are kept, so the page text can be dropped
+                    match["clause"] = clause_around(text, match["start"], match["end"])
+                    matches.append(match)
+
+        terms = []
+        seen_terms = set()
+        for rule_index, rule in enumerate(self.rules):
+            if rule_index not in primary_matches or rule["term"] in seen_terms:
+                continue
+            required_groups = set(range(1, len(rule.get("requires", [])) + 1))
+            if not required_groups <= groups_seen[rule_index]:
+                continue
+
+            seen_terms.add(rule["term"])
+            matches = sorted(primary_matches[rule_index], key=lambda m: (m["page"], m["start"]))
+            # Repeated mentions make a term slightly more certain
+            confidence = min(0.99, rule.get("confidence", 0.8) + 0.02 * (match_counts[rule_index] - 1))
+            terms.append({
+                "term": rule["term"],
+                "value": rule["value"],
+                "confidence": round(confidence, 2),
+                "occurrences": match_counts[rule_index],
+                "matches": matches,
+                "data": rule.get("data")
+            })
+
+        return terms
+
+
+def find_term(terms: List[Dict[str, Any]], term: str) -> Optional[Dict[str, Any]]:
+    return next((t for t in terms if t["term"] == term), None)
@@ -0,0 +1,112 @@
+"""
+Page-by-page text extraction for uploaded documents.
+
+Every extractor is a generator of (page_number, text) pairs so callers can
+index a large file one page at a time instead of holding all of its text.
+
+This module has no database imports so worker processes can import it cheaply.
+"""
+import io
+import zipfile
+from typing import Iterator, List, Tuple
+from xml.etree import ElementTree
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    # PDF extraction is optional - PDFs are stored but not indexed without pypdf
+    PdfReader = None
+
+# Plain text has no pages, so split it into fixed-size chunks of lines
+TEXT_LINES_PER_PAGE = 60
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def get_extension(file_name: str) -> str:
+    """Return the lowercase extension of a file name"""
+    return file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+
+
+def is_extractable(file_name: str) -> bool:
+    """Check whether text can be extracted from this kind of file"""
+    ext = get_extension(file_name)
+    if ext == 'pdf':
+        return PdfReader is not None
+    return ext in ('docx', 'txt')
+
+
+def extract_pages(content: bytes, file_name: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) for each page of a PDF, DOCX or TXT file"""
+    ext = get_extension(file_name)
+    if ext == 'pdf':
+        yield from _extract_pdf_pages(content)
+    elif ext == 'docx':
+        yield from _extract_docx_pages(content)
+    elif ext == 'txt':
+        yield from _extract_txt_pages(content)
+    else:
+        raise ValueError(f"Text extraction is not supported for .{ext} files")
+
+
+def extract_all_pages(content: bytes, file_name: str) -> List[Tuple[int, str]]:
+    """extract_pages as a list, for running in a worker process whose result must be pickled"""
+    return list(extract_pages(content, file_name))
+
+
+def _extract_pdf_pages(content: bytes) -> Iterator[Tuple[int, str]]:
+    if PdfReader is None:
+        raise RuntimeError("pypdf is not installed")
+    reader = PdfReader(io.BytesIO(content))
+    for index, page in enumerate(reader.pages, start=1):
+        yield index, page.extract_text() or ""
+
+
+def _extract_docx_pages(content: bytes) -> Iterator[Tuple[int, str]]:
+    """Stream word/document.xml and split on explicit and rendered page breaks"""
+    page_number = 1
+    lines = []
+    current_line = []
+
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        with archive.open("word/document.xml") as document_xml:
+            for event, element in ElementTree.iterparse(document_xml, events=("start", "end")):
+                tag = element.tag
+                is_page_break = (
+                    tag == f"{WORD_NAMESPACE}lastRenderedPageBreak"
+                    or (tag == f"{WORD_NAMESPACE}br" and element.get(f"{WORD_NAMESPACE}type") == "page")
+                )
+                if event == "start" and is_page_break:
+                    if lines or current_line:
+                        lines.append("".join(current_line))
+                        current_line = []
+                        yield page_number, "\n".join(lines)
+                        page_number += 1
+                        lines = []
+                elif event == "end" and tag == f"{WORD_NAMESPACE}t":
+                    current_line.append(element.text or "")
+                elif event == "end" and tag == f"{WORD_NAMESPACE}tab":
+                    current_line.append("\t")
+                elif event == "end" and tag == f"{WORD_NAMESPACE}p":
+                    lines.append("".join(current_line))
+                    current_line = []
+                    element.clear()
+
+    if current_line:
+        lines.append("".join(current_line))
+    if lines:
+        yield page_number, "\n".join(lines)
+
+
+def _extract_txt_pages(content: bytes) -> Iterator[Tuple[int, str]]:
+    text = content.decode('utf-8', errors='ignore')
+
+    # Respect form feeds when the file already has explicit pages
+    if "\f" in text:
+        for index, page in enumerate(text.split("\f"), start=1):
+            yield index, page
+        return
+
+    lines = text.splitlines()
+    for index, start in enumerate(range(0, len(lines), TEXT_LINES_PER_PAGE), start=1):
+        yield index, "\n".join(lines[start:start + TEXT_LINES_PER_PAGE])
@@ -0,0 +1,87 @@
+"""
+Streaming ZIP writer.
+
+Archives are produced chunk by chunk while they are being downloaded: each
+file is read in bounded blocks, compressed on the fly and handed to the
+response as soon as the bytes are ready. Nothing is assembled in memory or in
+a temporary file, so the cost of an archive is constant regardless of its size.
+"""
+import zipfile
+from datetime import datetime
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Tuple
+
+from services.storage_codec import ALREADY_COMPRESSED_EXTENSIONS
+
+CHUNK_SIZE = 64 * 1024
+
+# (name inside the archive, size in bytes, modified time, opener for the file contents)
+ZipEntry = Tuple[str, int, datetime, Callable[[], BinaryIO]]
+
+
+class _ChunkBuffer:
+    """Unseekable sink that collects ZipFile output until it is drained"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compression_for(file_name: str) -> int:
+    """Store already-compressed media as-is and deflate everything else"""
+    ext = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+    return zipfile.ZIP_STORED if ext in ALREADY_COMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def unique_name(name: str, used: set) -> str:
+    """Disambiguate duplicate archive names as 'name (2).ext'"""
+    candidate = name
+    stem, dot, ext = name.rpartition('.')
+    if not dot:
+        stem, ext = name, ''
+    counter = 2
+    while candidate in used:
+        candidate = f"{stem} ({counter}).{ext}" if dot else f"{stem} ({counter})"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+def stream_zip(entries: Iterable[ZipEntry]) -> Iterator[bytes]:
+    """Yield a ZIP archive of `entries` in bounded chunks"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, mode='w', allowZip64=True) as archive:
+        for name, size, modified_at, open_file in entries:
+            info = zipfile.ZipInfo(name, date_time=modified_at.timetuple()[:6])
+            info.compress_type = compression_for(name)
+            # Lets zipfile decide up front whether the entry needs zip64 headers
+            info.file_size = size
+
+            with open_file() as source, archive.open(info, mode='w') as target:
+                while True:
+                    block = source.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    target.write(block)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+            data = buffer.drain()
+            if data:
+                yield data
+
+    # Central directory
+    data = buffer.drain()
+    if data:
+        yield data
@@ -81,12 +81,17 @@ const ContractUpload: React.FC<ContractUploadProps> = ({ onComplete, onSkip }) =
         }, 200);
 
         try {
-          const response = await familyAPI.uploadContract({
+          let response = await familyAPI.uploadContract({
             fileName: file.name,
             fileContent: base64Data,
             fileType: file.name.split('.').pop() || 'pdf'
           });
 
+          // Parsing runs in the background unless the contract was already parsed
+          if (response.status !== 'completed') {
+            response = await familyAPI.waitForContractJob(response.jobId);
+          }
+
           clearInterval(progressInterval);
           setUploadProgress(100);
 
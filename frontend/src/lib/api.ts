@@ -113,6 +113,25 @@ export const familyAPI = {
   getContract: async () => {
     return fetchWithAuth('/api/v1/family/contract');
   },
+
+  getContractJob: async (jobId: string) => {
+    return fetchWithAuth(`/api/v1/family/contract/jobs/${jobId}`);
+  },
+
+  // Poll a contract-parsing job until it completes or fails
+  waitForContractJob: async (jobId: string, intervalMs = 1000, maxAttempts = 120) => {
+    for (let attempt = 0; attempt < maxAttempts; attempt++) {
+      const job = await familyAPI.getContractJob(jobId);
+      if (job.status === 'completed') {
+        return job;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Contract parsing failed');
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+    throw new Error('Contract parsing is taking longer than expected');
+  },
 };
 
 // Children API
@@ -158,22 +177,47 @@ export const childrenAPI = {
   },
 };
 
+// Admin listings are paged: pass the previous response's nextCursor to get the next page
+export interface AdminPageParams {
+  limit?: number;
+  cursor?: string | null;
+  sort?: string;
+  order?: 'asc' | 'desc';
+}
+
+const adminPageQuery = (params: Record<string, string | number | boolean | null | undefined>) => {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== undefined && value !== null) query.set(key, String(value));
+  });
+  const encoded = query.toString();
+  return encoded ? `?${encoded}` : '';
+};
+
 // Admin API
 export const adminAPI = {
-  getAllFamilies: async () => {
-    return fetchWithAuth('/api/v1/admin/families');
+  // Returns { items, total, nextCursor, sort, order }
+  getAllFamilies: async (params: AdminPageParams & { linked?: boolean } = {}) => {
+    return fetchWithAuth(`/api/v1/admin/families${adminPageQuery({ ...params })}`);
   },
 
   getFamilyDetails: async (familyId: string) => {
     return fetchWithAuth(`/api/v1/admin/families/${familyId}`);
   },
 
-  getStats: async () => {
-    return fetchWithAuth('/api/v1/admin/stats');
+  // Totals plus `days` of daily history for trend lines
+  getStats: async (days?: number) => {
+    return fetchWithAuth(`/api/v1/admin/stats${adminPageQuery({ days })}`);
   },
 
-  getAllUsers: async () => {
-    return fetchWithAuth('/api/v1/admin/users');
+  // Users and families matching q, best first: { items, total, truncated, nextOffset }
+  search: async (q: string, params: { type?: 'user' | 'family'; limit?: number; offset?: number } = {}) => {
+    return fetchWithAuth(`/api/v1/admin/search${adminPageQuery({ q, ...params })}`);
+  },
+
+  // Returns { items, total, nextCursor, sort, order }
+  getAllUsers: async (params: AdminPageParams = {}) => {
+    return fetchWithAuth(`/api/v1/admin/users${adminPageQuery({ ...params })}`);
   },
 };
 
@@ -183,6 +227,11 @@ export const calendarAPI = {
     return fetchWithAuth(`/api/v1/calendar/events?year=${year}&month=${month}`);
   },
 
+  getEventsInRange: async (start: Date, end: Date) => {
+    const params = new URLSearchParams({ start: start.toISOString(), end: end.toISOString() });
+    return fetchWithAuth(`/api/v1/calendar/events?${params.toString()}`);
+  },
+
   createEvent: async (eventData: {
     family_id: string;
     date: string;
@@ -197,6 +246,25 @@ export const calendarAPI = {
     });
   },
 
+  batchEvents: async (batch: {
+    create?: { date: string; type: string; title: string; parent?: string; isSwappable?: boolean }[];
+    update?: { id: string; date?: string; type?: string; title?: string; parent?: string; isSwappable?: boolean }[];
+    delete?: string[];
+  }) => {
+    return fetchWithAuth('/api/v1/calendar/events/batch', {
+      method: 'POST',
+      body: JSON.stringify(batch),
+    });
+  },
+
+  // fileContent is base64; dryRun reports what would be imported without writing
+  importCalendar: async (fileName: string, fileContent: string, dryRun = false) => {
+    return fetchWithAuth('/api/v1/calendar/import', {
+      method: 'POST',
+      body: JSON.stringify({ fileName, fileContent, dryRun }),
+    });
+  },
+
   createChangeRequest: async (requestData: {
     event_id: string;
     requestedDate?: string;
@@ -208,16 +276,37 @@ export const calendarAPI = {
     });
   },
 
-  updateChangeRequest: async (requestId: string, status: 'approved' | 'rejected') => {
+  updateChangeRequest: async (requestId: string, status: 'approved' | 'rejected', force = false) => {
     return fetchWithAuth(`/api/v1/calendar/change-requests/${requestId}`, {
       method: 'PUT',
-      body: JSON.stringify({ status }),
+      body: JSON.stringify({ status, force }),
+    });
+  },
+
+  validateChangeRequests: async (proposals: { event_id: string; requestedDate: string }[]) => {
+    return fetchWithAuth('/api/v1/calendar/change-requests/validate', {
+      method: 'POST',
+      body: JSON.stringify({ proposals }),
     });
   },
 
   getChangeRequests: async () => {
     return fetchWithAuth('/api/v1/calendar/change-requests');
   },
+
+  // Omit the token for a full sync; a 410 means the token expired and a full sync is needed
+  sync: async (syncToken?: string) => {
+    const query = syncToken ? `?syncToken=${encodeURIComponent(syncToken)}` : '';
+    return fetchWithAuth(`/api/v1/calendar/sync${query}`);
+  },
+
+  createIcsSubscription: async () => {
+    return fetchWithAuth('/api/v1/calendar/ics-subscription', { method: 'POST' });
+  },
+
+  deleteIcsSubscription: async () => {
+    return fetchWithAuth('/api/v1/calendar/ics-subscription', { method: 'DELETE' });
+  },
 };
 
 // Messaging API
@@ -311,6 +400,22 @@ export const activityAPI = {
   getRecentActivity: async () => {
     return fetchWithAuth('/api/v1/activity');
   },
+
+  // Pass the createdAt of the last entry already shown to load older activity
+  getActivityHistory: async (before?: string, limit = 20) => {
+    const params = new URLSearchParams({ limit: String(limit), history: 'true' });
+    if (before) params.set('before', before);
+    return fetchWithAuth(`/api/v1/activity?${params.toString()}`);
+  },
+};
+
+// Dashboard API
+export const dashboardAPI = {
+  // One request for the home screen; pass fields to load only some sections
+  getDashboard: async (fields?: string[]) => {
+    const query = fields && fields.length ? `?fields=${encodeURIComponent(fields.join(','))}` : '';
+    return fetchWithAuth(`/api/v1/dashboard${query}`);
+  },
 };
 
 // Documents API
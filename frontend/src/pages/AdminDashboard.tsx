@@ -8,14 +8,79 @@ import { adminAPI } from '@/lib/api';
 import { useToast } from '@/hooks/use-toast';
 import { useNavigate } from 'react-router-dom';
 
+interface AdminSearchResult {
+  type: 'user' | 'family';
+  id: string;
+  label: string;
+  match: 'exact' | 'prefix' | 'word' | 'substring';
+  email?: string;
+  firstName?: string;
+  lastName?: string;
+  role?: string;
+  familyName?: string;
+  familyCode?: string;
+  parent1_email?: string;
+  parent2_email?: string | null;
+  isLinked?: boolean;
+}
+
+interface AdminSearchResults {
+  items: AdminSearchResult[];
+  total: number;
+  truncated: boolean;
+  nextOffset: number | null;
+}
+
+interface AdminStatsDay {
+  date: string;
+  messages?: number;
+  expenseCount?: number;
+  expenseAmount?: number;
+  newFamilies?: number;
+  newUsers?: number;
+  families?: number;
+  activeFamilies?: number;
+  storageBytes?: number;
+}
+
 interface AdminStats {
   totalFamilies: number;
   linkedFamilies: number;
   unlinkedFamilies: number;
+  linkedRatio: number;
   totalUsers: number;
   totalChildren: number;
+  totalMessages: number;
+  messagesToday: number;
+  expenseCount: number;
+  expenseVolume: number;
+  storageBytes: number;
+  activeFamilies: number;
+  refreshedAt: string | null;
+  history: AdminStatsDay[];
 }
 
+const formatBytes = (bytes: number) => {
+  if (bytes < 1024) return `${bytes} B`;
+  if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(1)} KB`;
+  if (bytes < 1024 * 1024 * 1024) return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+  return `${(bytes / (1024 * 1024 * 1024)).toFixed(1)} GB`;
+};
+
+// Daily values from the stats history as a small trend line
+const Sparkline: React.FC<{ values: number[]; color: string }> = ({ values, color }) => {
+  if (values.length < 2) return null;
+  const max = Math.max(...values, 1);
+  const points = values
+    .map((value, index) => `${(index / (values.length - 1)) * 100},${28 - (value / max) * 26}`)
+    .join(' ');
+  return (
+    <svg viewBox="0 0 100 30" preserveAspectRatio="none" className="w-full h-8 mt-3">
+      <polyline points={points} fill="none" stroke={color} strokeWidth="2" vectorEffect="non-scaling-stroke" />
+    </svg>
+  );
+};
+
 interface FamilyData {
   id: string;
   familyName: string;
@@ -40,64 +105,80 @@ interface FamilyData {
   isLinked: boolean;
 }
 
+// Families and users are paged; the children view covers the families loaded so far
+const PAGE_SIZE = 100;
+
 const AdminDashboard: React.FC = () => {
   const { toast } = useToast();
   const navigate = useNavigate();
   const [stats, setStats] = useState<AdminStats | null>(null);
   const [families, setFamilies] = useState<FamilyData[]>([]);
-  const [filteredFamilies, setFilteredFamilies] = useState<FamilyData[]>([]);
+  const [searchResults, setSearchResults] = useState<AdminSearchResults | null>(null);
   const [searchTerm, setSearchTerm] = useState('');
   const [loading, setLoading] = useState(true);
   const [selectedFamily, setSelectedFamily] = useState<string | null>(null);
   const [activeView, setActiveView] = useState<'families' | 'users' | 'children'>('families');
   const [users, setUsers] = useState<any[]>([]);
   const [allChildren, setAllChildren] = useState<any[]>([]);
+  const [familiesCursor, setFamiliesCursor] = useState<string | null>(null);
+  const [usersCursor, setUsersCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchAdminData();
   }, []);
 
+  // Search runs on the server across all users and families, not just the loaded pages
   useEffect(() => {
-    if (searchTerm) {
-      const filtered = families.filter(family =>
-        family.familyName.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        family.parent1.email.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        (family.parent2?.email || '').toLowerCase().includes(searchTerm.toLowerCase()) ||
-        family.familyCode.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-      setFilteredFamilies(filtered);
-    } else {
-      setFilteredFamilies(families);
+    const query = searchTerm.trim();
+    if (!query) {
+      setSearchResults(null);
+      return;
     }
-  }, [searchTerm, families]);
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const results = await adminAPI.search(query, { limit: 50 });
+        if (!cancelled) setSearchResults(results);
+      } catch (error) {
+        console.error('Error searching:', error);
+      }
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchTerm]);
+
+  useEffect(() => {
+    const children: any[] = [];
+    families.forEach((family: FamilyData) => {
+      family.children.forEach((child: any) => {
+        children.push({
+          ...child,
+          familyName: family.familyName,
+          familyCode: family.familyCode,
+          familyId: family.id
+        });
+      });
+    });
+    setAllChildren(children);
+  }, [families]);
 
   const fetchAdminData = async () => {
     try {
       setLoading(true);
       const [statsData, familiesData, usersData] = await Promise.all([
         adminAPI.getStats(),
-        adminAPI.getAllFamilies(),
-        adminAPI.getAllUsers()
+        adminAPI.getAllFamilies({ limit: PAGE_SIZE }),
+        adminAPI.getAllUsers({ limit: PAGE_SIZE })
       ]);
 
       setStats(statsData);
-      setFamilies(familiesData);
-      setFilteredFamilies(familiesData);
-      setUsers(usersData);
-
-      // Extract all children from all families
-      const children: any[] = [];
-      familiesData.forEach((family: FamilyData) => {
-        family.children.forEach((child: any) => {
-          children.push({
-            ...child,
-            familyName: family.familyName,
-            familyCode: family.familyCode,
-            familyId: family.id
-          });
-        });
-      });
-      setAllChildren(children);
+      setFamilies(familiesData.items);
+      setFamiliesCursor(familiesData.nextCursor);
+      setUsers(usersData.items);
+      setUsersCursor(usersData.nextCursor);
     } catch (error) {
       console.error('Error fetching admin data:', error);
       toast({
@@ -110,6 +191,32 @@ const AdminDashboard: React.FC = () => {
     }
   };
 
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      if (activeView === 'users' && usersCursor) {
+        const page = await adminAPI.getAllUsers({ cursor: usersCursor, limit: PAGE_SIZE });
+        setUsers(prev => [...prev, ...page.items]);
+        setUsersCursor(page.nextCursor);
+      } else if (activeView !== 'users' && familiesCursor) {
+        const page = await adminAPI.getAllFamilies({ cursor: familiesCursor, limit: PAGE_SIZE });
+        setFamilies(prev => [...prev, ...page.items]);
+        setFamiliesCursor(page.nextCursor);
+      }
+    } catch (error) {
+      console.error('Error loading more admin data:', error);
+      toast({
+        title: "Error",
+        description: error instanceof Error ? error.message : "Failed to load more results.",
+        variant: "destructive",
+      });
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const hasMore = activeView === 'users' ? Boolean(usersCursor) : Boolean(familiesCursor);
+
   const viewFamilyDetails = (familyId: string) => {
     navigate(`/admin/families/${familyId}`);
   };
@@ -226,6 +333,49 @@ const AdminDashboard: React.FC = () => {
           </div>
         )}
 
+        {/* Activity Trends */}
+        {stats && (
+          <div className="grid grid-cols-1 md:grid-cols-4 gap-4 mb-8">
+            <Card>
+              <CardContent className="pt-6">
+                <p className="text-sm font-medium text-gray-600">Active Families (7 days)</p>
+                <p className="text-2xl font-bold text-gray-900">{stats.activeFamilies}</p>
+                <p className="text-xs text-gray-500">{Math.round(stats.linkedRatio * 100)}% of families linked</p>
+                <Sparkline values={stats.history.map(day => day.activeFamilies ?? 0)} color="#2563eb" />
+              </CardContent>
+            </Card>
+
+            <Card>
+              <CardContent className="pt-6">
+                <p className="text-sm font-medium text-gray-600">Messages Today</p>
+                <p className="text-2xl font-bold text-gray-900">{stats.messagesToday}</p>
+                <p className="text-xs text-gray-500">{stats.totalMessages} total</p>
+                <Sparkline values={stats.history.map(day => day.messages ?? 0)} color="#9333ea" />
+              </CardContent>
+            </Card>
+
+            <Card>
+              <CardContent className="pt-6">
+                <p className="text-sm font-medium text-gray-600">Expense Volume</p>
+                <p className="text-2xl font-bold text-gray-900">${stats.expenseVolume.toFixed(2)}</p>
+                <p className="text-xs text-gray-500">{stats.expenseCount} expenses</p>
+                <Sparkline values={stats.history.map(day => day.expenseAmount ?? 0)} color="#16a34a" />
+              </CardContent>
+            </Card>
+
+            <Card>
+              <CardContent className="pt-6">
+                <p className="text-sm font-medium text-gray-600">Document Storage</p>
+                <p className="text-2xl font-bold text-gray-900">{formatBytes(stats.storageBytes)}</p>
+                <p className="text-xs text-gray-500">
+                  {stats.refreshedAt ? `Updated ${new Date(stats.refreshedAt + 'Z').toLocaleString()}` : 'Not computed yet'}
+                </p>
+                <Sparkline values={stats.history.map(day => day.storageBytes ?? 0)} color="#ea580c" />
+              </CardContent>
+            </Card>
+          </div>
+        )}
+
         {/* Dynamic Content Based on Active View */}
         <Card>
           <CardHeader>
@@ -238,7 +388,7 @@ const AdminDashboard: React.FC = () => {
               <div className="relative w-64">
                 <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 text-gray-400 w-4 h-4" />
                 <Input
-                  placeholder="Search families..."
+                  placeholder="Search users and families..."
                   value={searchTerm}
                   onChange={(e) => setSearchTerm(e.target.value)}
                   className="pl-10"
@@ -247,16 +397,51 @@ const AdminDashboard: React.FC = () => {
             </div>
           </CardHeader>
           <CardContent>
+            {/* Search Results */}
+            {searchResults && (
+              <div className="space-y-2">
+                <p className="text-sm text-gray-600 mb-2">
+                  {searchResults.truncated ? `More than ${searchResults.total}` : searchResults.total} result{searchResults.total === 1 ? '' : 's'}
+                </p>
+                {searchResults.items.map((result) => (
+                  <div
+                    key={`${result.type}-${result.id}`}
+                    className="border rounded-lg p-3 flex items-center justify-between hover:bg-gray-50 transition-colors"
+                  >
+                    <div>
+                      <div className="flex items-center gap-2">
+                        <Badge variant="outline">{result.type === 'family' ? 'Family' : 'User'}</Badge>
+                        <span className="font-medium text-gray-900">
+                          {result.type === 'family' ? result.familyName : `${result.firstName} ${result.lastName}`}
+                        </span>
+                      </div>
+                      <p className="text-xs text-gray-500 mt-1">
+                        {result.type === 'family'
+                          ? `${result.familyCode} · ${result.parent1_email}${result.parent2_email ? ` · ${result.parent2_email}` : ''}`
+                          : `${result.email} · ${result.role}`}
+                      </p>
+                    </div>
+                    {result.type === 'family' && (
+                      <Button size="sm" variant="outline" onClick={() => viewFamilyDetails(result.id)}>
+                        <Eye className="w-4 h-4 mr-2" />
+                        View Details
+                      </Button>
+                    )}
+                  </div>
+                ))}
+              </div>
+            )}
+
             {/* Families View */}
-            {activeView === 'families' && (
+            {!searchResults && activeView === 'families' && (
               <div className="space-y-4">
-                {filteredFamilies.length === 0 ? (
+                {families.length === 0 ? (
                   <div className="text-center py-12">
                     <Users className="w-12 h-12 text-gray-400 mx-auto mb-4" />
                     <p className="text-gray-600">No families found</p>
                   </div>
                 ) : (
-                  filteredFamilies.map((family) => (
+                  families.map((family) => (
                   <div
                     key={family.id}
                     className="border rounded-lg p-4 hover:bg-gray-50 transition-colors"
@@ -325,7 +510,7 @@ const AdminDashboard: React.FC = () => {
             )}
 
             {/* Users View */}
-            {activeView === 'users' && (
+            {!searchResults && activeView === 'users' && (
               <div className="space-y-4">
                 {users.length === 0 ? (
                   <div className="text-center py-12">
@@ -373,7 +558,7 @@ const AdminDashboard: React.FC = () => {
             )}
 
             {/* Children View */}
-            {activeView === 'children' && (
+            {!searchResults && activeView === 'children' && (
               <div className="space-y-4">
                 {allChildren.length === 0 ? (
                   <div className="text-center py-12">
@@ -428,6 +613,14 @@ const AdminDashboard: React.FC = () => {
                 )}
               </div>
             )}
+
+            {!searchResults && hasMore && (
+              <div className="text-center mt-6">
+                <Button variant="outline" onClick={loadMore} disabled={loadingMore}>
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </Button>
+              </div>
+            )}
           </CardContent>
         </Card>
       </div>
@@ -23,7 +23,7 @@ import FamilyOnboarding from '@/components/FamilyOnboarding';
 import ChildManagement from '@/components/ChildManagement';
 import RecentActivity from '@/components/RecentActivity';
 import { FamilyProfile, Child } from '@/types/family';
-import { authAPI, familyAPI, childrenAPI, adminAPI } from '@/lib/api';
+import { adminAPI, dashboardAPI } from '@/lib/api';
 import { useToast } from '@/hooks/use-toast';
 
 interface IndexProps {
@@ -220,22 +220,18 @@ const Index: React.FC<IndexProps> = ({ onLogout, startOnboarding = false, startI
       setAdminLoading(true);
       setAdminError(null);
       try {
-        const statsData = await adminAPI.getStats();
-        const familiesResponse = await adminAPI.getAllFamilies();
-        const familiesData: AdminFamilyRecord[] = Array.isArray(familiesResponse) ? familiesResponse : [];
+        const statsData = await adminAPI.getStats(1);
+        const [pendingResponse, recentResponse] = await Promise.all([
+          adminAPI.getAllFamilies({ linked: false, limit: 4 }),
+          adminAPI.getAllFamilies({ sort: 'createdAt', order: 'desc', limit: 5 }),
+        ]);
 
         setAdminStats(statsData);
 
-        const pendingFamilies = familiesData.filter((family) => !family.isLinked);
-        setAdminPendingFamilies(pendingFamilies.slice(0, 4));
+        const pendingFamilies: AdminFamilyRecord[] = Array.isArray(pendingResponse?.items) ? pendingResponse.items : [];
+        setAdminPendingFamilies(pendingFamilies);
 
-        const recent = [...familiesData]
-          .sort((a, b) => {
-            const aDate = a.createdAt ? new Date(a.createdAt).getTime() : 0;
-            const bDate = b.createdAt ? new Date(b.createdAt).getTime() : 0;
-            return bDate - aDate;
-          })
-          .slice(0, 5);
+        const recent: AdminFamilyRecord[] = Array.isArray(recentResponse?.items) ? recentResponse.items : [];
         setAdminRecentFamilies(recent);
       } catch (error) {
         console.error('Error fetching admin overview:', error);
@@ -255,7 +251,9 @@ const Index: React.FC<IndexProps> = ({ onLogout, startOnboarding = false, startI
       try {
         const token = localStorage.getItem('authToken');
         if (token) {
-          const userProfile = await authAPI.getCurrentUser();
+          // One request for the user, their family and its children
+          const dashboard = await dashboardAPI.getDashboard(['user', 'family', 'children']);
+          const userProfile = dashboard.user;
           const normalizedUser: CurrentUser = {
             firstName: userProfile.firstName,
             lastName: userProfile.lastName,
@@ -277,54 +275,38 @@ const Index: React.FC<IndexProps> = ({ onLogout, startOnboarding = false, startI
           setAdminRecentFamilies([]);
           setAdminError(null);
 
-          // Fetch family profile if exists
-          try {
-            const family = await familyAPI.getFamily();
-            if (family) {
-              // Fetch children separately to ensure we have the latest data
-              let children: Child[] = [];
-              try {
-                const childrenData = await childrenAPI.getChildren();
-                console.log('Fetched children from backend:', childrenData);
-
-                // Convert backend children to frontend format
-                children = childrenData.map((child) => {
-                  const [firstName, ...lastNameParts] = (child.name || '').split(' ');
-                  const lastName = lastNameParts.join(' ');
-                  const convertedChild: Child = {
-                    id: child.id,
-                    firstName: firstName || '',
-                    lastName: lastName || '',
-                    dateOfBirth: new Date(child.dateOfBirth),
-                    age: Math.floor((Date.now() - new Date(child.dateOfBirth).getTime()) / (365.25 * 24 * 60 * 60 * 1000)),
-                    gender: child.gender,
-                    school: child.school,
-                    grade: child.grade,
-                    allergies: child.allergies ? child.allergies.split(',').map((s: string) => s.trim()).filter(Boolean) : [],
-                    medicalConditions: child.medications ? child.medications.split(',').map((s: string) => s.trim()).filter(Boolean) : [],
-                    specialNeeds: child.notes ? [child.notes] : [],
-                    notes: child.notes,
-                  };
-                  console.log('Converted child:', convertedChild);
-                  return convertedChild;
-                });
-
-                console.log('Total children converted:', children.length);
-              } catch (childError) {
-                console.error('Error fetching children:', childError);
-              }
-
-              // Convert backend family data to FamilyProfile format
-              setFamilyProfile({
-                ...family,
-                children: children,
-              } as FamilyProfile);
-              
-              // If family profile exists, clear onboarding state
-              localStorage.removeItem('onboardingState');
-            }
-          } catch (error) {
-            // Family profile doesn't exist yet - that's okay
+          // A user who hasn't created or joined a family yet gets family: null
+          const family = dashboard.family;
+          if (family) {
+            // Convert backend children to frontend format
+            const children: Child[] = (dashboard.children || []).map((child) => {
+              const [firstName, ...lastNameParts] = (child.name || '').split(' ');
+              const lastName = lastNameParts.join(' ');
+              return {
+                id: child.id,
+                firstName: firstName || '',
+                lastName: lastName || '',
+                dateOfBirth: new Date(child.dateOfBirth),
+                age: Math.floor((Date.now() - new Date(child.dateOfBirth).getTime()) / (365.25 * 24 * 60 * 60 * 1000)),
+                gender: child.gender,
+                school: child.school,
+                grade: child.grade,
+                allergies: child.allergies ? child.allergies.split(',').map((s: string) => s.trim()).filter(Boolean) : [],
+                medicalConditions: child.medications ? child.medications.split(',').map((s: string) => s.trim()).filter(Boolean) : [],
+                specialNeeds: child.notes ? [child.notes] : [],
+                notes: child.notes,
+              };
+            });
+
+            // Convert backend family data to FamilyProfile format
+            setFamilyProfile({
+              ...family,
+              children: children,
+            } as FamilyProfile);
+            
+            // If family profile exists, clear onboarding state
+            localStorage.removeItem('onboardingState');
+          } else {
             console.info('No family profile found yet');
           }
         }